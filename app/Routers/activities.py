@@ -1,55 +1,160 @@
 # app/Routers/activities.py
 from fastapi import APIRouter, Query, Depends, Request, HTTPException, Body
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, StreamingResponse
+from sqlalchemy import insert, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from decimal import Decimal
 from datetime import date
 from typing import Optional
-from ..database import get_db
-from ..security import get_current_user
-from ..models import ActivityLog, Facility, EmissionFactor, ActivityType, Unit
+import base64
+import json
+from ..database import async_session, get_async_db, get_db
+from ..security import get_principal, get_principal_async
+from ..models import ActivityLog, Facility, ActivityType, Unit
+from ..resolver import resolver
+from .. import reference, rollup, versions
 
 router = APIRouter(prefix="/api/activities", tags=["activities"])
 pages = APIRouter(tags=["activities:pages"])
 
-# Map ActivityType.code -> EmissionFactor.category
-TYPE_CODE_TO_CATEGORY = {
-    "ELEC_USE": "Electricity",
-    "NAT_GAS": "NaturalGas",
-    "DIESEL": "Diesel",
-    "GASOLINE": "Gasoline",
-    "FREIGHT_TRUCK": "Freight_Truck",
-    "FREIGHT_SHIP": "Freight_Ship",
-    "WASTE": "Waste",
-    "WATER": "Water",
-}
-
+MAX_BATCH_ITEMS = 10000
 
 # ---------------- API: list activities ----------------
 
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STREAM_BATCH_SIZE = 1000
+
+LIST_COLUMNS = (
+    ActivityLog.activity_id,
+    ActivityLog.facility_id,
+    ActivityLog.factor_id,
+    ActivityLog.activity_type,
+    ActivityLog.quantity,
+    ActivityLog.unit,
+    ActivityLog.activity_date,
+    ActivityLog.activity_type_id,
+    ActivityLog.unit_id,
+    ActivityLog.notes,
+    ActivityLog.co2e_kg,
+)
+
+
+def _activity_dict(row) -> dict:
+    return {
+        "activity_id": row.activity_id,
+        "facility_id": row.facility_id,
+        "factor_id": row.factor_id,
+        "activity_type": row.activity_type,
+        "quantity": float(row.quantity) if row.quantity is not None else None,
+        "unit": row.unit,
+        "activity_date": row.activity_date.isoformat() if row.activity_date else None,
+        "activity_type_id": row.activity_type_id,
+        "unit_id": row.unit_id,
+        "notes": row.notes,
+        "co2e_kg": float(row.co2e_kg) if row.co2e_kg is not None else None,
+    }
+
+
+def encode_cursor(row) -> str:
+    day = row.activity_date.isoformat() if row.activity_date else ""
+    return base64.urlsafe_b64encode(f"{day}|{row.activity_id}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[date | None, int]:
+    try:
+        day, activity_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return (date.fromisoformat(day) if day else None), int(activity_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def activities_queries(
+    org_id: int,
+    facility_id: int | None = None,
+    date_from: date | None = None,
+    date_to: date | None = None,
+    cursor: str | None = None,
+) -> list:
+    """
+    Newest-first activities of an org, keyset-paginated on (activity_date, activity_id).
+
+    Returns the queries to read in order: dated rows, then (without a date
+    filter) undated ones. Each phase seeks and sorts exactly along
+    ix_activity_log_org_date / ix_activity_log_facility_date_id, so a page
+    is an index range scan rather than a sort of every row of the org.
+    """
+    base = select(*LIST_COLUMNS).where(ActivityLog.org_id == org_id)
+    if facility_id is not None:
+        base = base.where(ActivityLog.facility_id == facility_id)
+
+    day, last_id = decode_cursor(cursor) if cursor else (None, None)
+    phases = []
+    if last_id is None or day is not None:
+        dated = base.where(ActivityLog.activity_date.is_not(None))
+        if date_from is not None:
+            dated = dated.where(ActivityLog.activity_date >= date_from)
+        if date_to is not None:
+            dated = dated.where(ActivityLog.activity_date <= date_to)
+        if day is not None:
+            dated = dated.where(tuple_(ActivityLog.activity_date, ActivityLog.activity_id) < tuple_(day, last_id))
+        phases.append(dated.order_by(ActivityLog.activity_date.desc(), ActivityLog.activity_id.desc()))
+    if date_from is None and date_to is None:
+        undated = base.where(ActivityLog.activity_date.is_(None))
+        if last_id is not None and day is None:
+            undated = undated.where(ActivityLog.activity_id < last_id)
+        phases.append(undated.order_by(ActivityLog.activity_id.desc()))
+    return phases
+
+
 @router.get("")
-def list_activities(
+async def list_activities(
     facility_id: Optional[int] = Query(None),
-    db: Session = Depends(get_db),
-    user=Depends(get_current_user),
+    date_from: Optional[date] = Query(None),
+    date_to: Optional[date] = Query(None),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None),
+    fmt: str = Query("json", alias="format", pattern="^(json|ndjson)$"),
+    db: AsyncSession = Depends(get_async_db),
+    user=Depends(get_principal_async),
 ):
     """
-    List activities.
+    List activities, newest first.
 
-    - If facility_id is provided, return only activities for that facility.
-    - Otherwise, return all activities for the user's org.
+    - facility_id / date_from / date_to narrow the result.
+    - JSON (default): one page of at most `limit` rows plus `next_cursor`;
+      pass it back as `cursor` to get the next page.
+    - format=ndjson: every matching row (from `cursor` on, if given),
+      streamed one JSON object per line through a server-side cursor.
     """
-    q = (
-        db.query(ActivityLog)
-        .join(Facility, ActivityLog.facility_id == Facility.facility_id)
-        .filter(Facility.org_id == user.org_id)
-    )
-
-    if facility_id is not None:
-        q = q.filter(ActivityLog.facility_id == facility_id)
-
-    activities = q.order_by(ActivityLog.activity_date.desc()).all()
-    return activities
+    phases = activities_queries(user.org_id, facility_id, date_from, date_to, cursor)
+
+    if fmt == "ndjson":
+        # the stream reads on a session of its own; hand back the connection the
+        # request-scoped one may hold from the principal lookup
+        await db.close()
+        return StreamingResponse(_stream_ndjson(phases), media_type="application/x-ndjson")
+
+    rows = []
+    for q in phases:
+        rows += (await db.execute(q.limit(limit + 1 - len(rows)))).all()
+        if len(rows) > limit:
+            break
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return {
+        "items": [_activity_dict(r) for r in rows[:limit]],
+        "next_cursor": next_cursor,
+    }
+
+
+async def _stream_ndjson(phases):
+    # own session: the response body outlives the request-scoped one
+    async with async_session() as db:
+        for q in phases:
+            result = await db.stream(q.execution_options(yield_per=STREAM_BATCH_SIZE))
+            async for partition in result.partitions():
+                yield "".join(json.dumps(_activity_dict(r)) + "\n" for r in partition)
 
 
 # ---------------- PAGES ----------------
@@ -57,7 +162,7 @@ def list_activities(
 @pages.get("/activities", response_class=HTMLResponse)
 def activities_page(
     request: Request,
-    user=Depends(get_current_user),
+    user=Depends(get_principal),
     db: Session = Depends(get_db),
 ):
     """
@@ -70,24 +175,17 @@ def activities_page(
 @pages.get("/activities/new", response_class=HTMLResponse)
 def new_activity_page(
     request: Request,
-    user=Depends(get_current_user),
+    user=Depends(get_principal),
     db: Session = Depends(get_db),
 ):
-    types = db.query(ActivityType).all()
-    units = db.query(Unit).all()
-    facilities = (
-        db.query(Facility)
-        .filter(Facility.org_id == user.org_id)
-        .all()
-    )
-
+    # dropdowns come from in-process caches, not the tables
     return request.app.state.templates.TemplateResponse(
         "activities_new.html",
         {
             "request": request,
-            "types": types,
-            "units": units,
-            "facilities": facilities,
+            "types": reference.activity_types(db),
+            "units": reference.units(db),
+            "facilities": reference.facilities(db, user.org_id),
         },
     )
 
@@ -98,7 +196,7 @@ def new_activity_page(
 def create_activity(
     payload: dict,
     db: Session = Depends(get_db),
-    user=Depends(get_current_user),
+    user=Depends(get_principal),
 ):
     facility_id = payload.get("facility_id")
     activity_type_id = payload.get("activity_type_id")
@@ -106,9 +204,9 @@ def create_activity(
     quantity = Decimal(str(payload.get("quantity", 0)))
     activity_date = payload.get("activity_date")
 
-    # Facility must belong to the current org
+    # Facility must belong to the current org (the only query before the insert)
     fac = (
-        db.query(Facility)
+        db.query(Facility.facility_id)
         .filter(
             Facility.org_id == user.org_id,
             Facility.facility_id == facility_id,
@@ -118,51 +216,183 @@ def create_activity(
     if not fac:
         raise HTTPException(status_code=403, detail="Invalid facility")
 
-    # Look up the ActivityType row
-    atype = (
-        db.query(ActivityType)
-        .filter(ActivityType.activity_type_id == activity_type_id)
-        .first()
-    )
+    # Activity type and its factor category come from the in-process resolver
+    atype = resolver.activity_type(db, activity_type_id)
     if not atype:
         raise HTTPException(status_code=400, detail="Invalid activity type")
 
-    # Map ActivityType.code -> EmissionFactor.category
-    category = TYPE_CODE_TO_CATEGORY.get(atype.code)
-    if not category:
-        # Fallback: try first word of label if mapping missing
-        category = atype.label.split()[0]
-
-    # Find the most recent emission factor for that category
-    factor = (
-        db.query(EmissionFactor)
-        .filter(EmissionFactor.category == category)
-        .order_by(EmissionFactor.year.desc())
-        .first()
-    )
+    try:
+        activity_date = date.fromisoformat(activity_date)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="activity_date must be YYYY-MM-DD")
+
+    # Newest emission factor for that category not newer than the activity's
+    # year, as in CSV ingestion
+    factor = resolver.factor(db, atype.category, activity_date.year)
     if not factor:
         raise HTTPException(
             status_code=400,
             detail="No emission factor exists for this activity type",
         )
 
-    co2e = quantity * Decimal(str(factor.factor or 0))
+    co2e = quantity * factor.factor
 
     row = ActivityLog(
+        org_id=user.org_id,
         facility_id=facility_id,
         activity_type_id=activity_type_id,
         unit_id=unit_id,
         quantity=quantity,
-        activity_date=date.fromisoformat(activity_date),
+        activity_date=activity_date,
         factor_id=factor.factor_id,
         co2e_kg=co2e,
     )
 
     db.add(row)
+    rollup.add_activities(db, [(
+        rollup.rollup_key(user.org_id, fac.facility_id, atype.scope, atype.activity_type_id, row.activity_date),
+        co2e,
+        quantity,
+    )])
+    versions.bump(db, versions.org_key(user.org_id))
     db.commit()
     return {"saved": True, "co2e_kg": float(co2e)}
 
 
+# ---------------- CREATE many activities ----------------
+
+@router.post("/batch")
+def create_activities_batch(
+    payload: dict = Body(...),
+    db: Session = Depends(get_db),
+    user=Depends(get_principal),
+):
+    """
+    Create many activities in one transaction.
+
+    Expects JSON body like:
+    {
+      "mode": "all_or_nothing",      # or "partial"
+      "items": [{"facility_id": 1, "activity_type_id": 2, "unit_id": 1,
+                 "quantity": 120.5, "activity_date": "2024-01-31"}, ...]
+    }
+
+    Facilities and units are checked with one query each, activity types and
+    factors come from the resolver, and every valid row goes in with a single
+    bulk INSERT and one commit. In all_or_nothing mode any invalid item
+    rejects the whole batch (422) and nothing is written.
+    """
+    items = payload.get("items") or []
+    mode = payload.get("mode", "all_or_nothing")
+    if mode not in ("all_or_nothing", "partial"):
+        raise HTTPException(status_code=400, detail="mode must be 'all_or_nothing' or 'partial'")
+    if not isinstance(items, list) or not items:
+        raise HTTPException(status_code=400, detail="items must be a non-empty list")
+    if len(items) > MAX_BATCH_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_ITEMS} items per batch")
+
+    def ids(field):
+        out = set()
+        for item in items:
+            try:
+                out.add(int(item.get(field)))
+            except (AttributeError, TypeError, ValueError):
+                pass
+        return out
+
+    # Set-based validation: one query for facilities, one for units
+    wanted_facilities = ids("facility_id")
+    valid_facilities = {
+        fid for (fid,) in db.query(Facility.facility_id).filter(
+            Facility.org_id == user.org_id,
+            Facility.facility_id.in_(wanted_facilities),
+        )
+    } if wanted_facilities else set()
+
+    wanted_units = ids("unit_id")
+    valid_units = {
+        uid for (uid,) in db.query(Unit.unit_id).filter(Unit.unit_id.in_(wanted_units))
+    } if wanted_units else set()
+
+    results = []
+    rows = []
+    entries = []
+    for index, item in enumerate(items):
+        try:
+            if not isinstance(item, dict):
+                raise ValueError("Item must be an object")
+            facility_id = int(item.get("facility_id"))
+            if facility_id not in valid_facilities:
+                raise ValueError("Invalid facility")
+
+            atype = resolver.activity_type(db, item.get("activity_type_id"))
+            if not atype:
+                raise ValueError("Invalid activity type")
+
+            unit_id = item.get("unit_id")
+            if unit_id is None:
+                unit_id = atype.default_unit_id
+            elif int(unit_id) not in valid_units:
+                raise ValueError("Invalid unit")
+
+            try:
+                quantity = Decimal(str(item.get("quantity", 0)))
+            except ArithmeticError:
+                raise ValueError("Invalid quantity")
+            if not quantity.is_finite():
+                raise ValueError("Invalid quantity")
+            activity_date = date.fromisoformat(item.get("activity_date"))
+
+            factor = resolver.factor(db, atype.category, activity_date.year)
+            if not factor:
+                raise ValueError("No emission factor exists for this activity type")
+        except (TypeError, ValueError) as exc:
+            message = str(exc) if isinstance(exc, ValueError) and str(exc) else "Invalid item"
+            results.append({"index": index, "saved": False, "error": message})
+            continue
+
+        co2e = quantity * factor.factor
+        rows.append({
+            "org_id": user.org_id,
+            "facility_id": facility_id,
+            "activity_type_id": atype.activity_type_id,
+            "unit_id": unit_id,
+            "quantity": quantity,
+            "activity_date": activity_date,
+            "factor_id": factor.factor_id,
+            "co2e_kg": co2e,
+        })
+        entries.append((
+            rollup.rollup_key(user.org_id, facility_id, atype.scope, atype.activity_type_id, activity_date),
+            co2e,
+            quantity,
+        ))
+        results.append({"index": index, "saved": True, "co2e_kg": float(co2e)})
+
+    failed = len(items) - len(rows)
+    if failed and mode == "all_or_nothing":
+        raise HTTPException(
+            status_code=422,
+            detail={
+                "message": f"{failed} invalid item(s); nothing was saved",
+                "results": [r for r in results if not r["saved"]],
+            },
+        )
+
+    if rows:
+        db.execute(insert(ActivityLog.__table__), rows)
+        rollup.add_activities(db, entries)
+        versions.bump(db, versions.org_key(user.org_id))
+        db.commit()
+
+    return {
+        "mode": mode,
+        "saved": len(rows),
+        "failed": failed,
+        "results": results,
+    }
+
+
 @router.get("/activity-types")
 def list_activity_types(db: Session = Depends(get_db)):
     return db.query(ActivityType).all()
@@ -178,7 +408,7 @@ def list_units(db: Session = Depends(get_db)):
 def alias_create_activity(
     payload: dict = Body(...),
     db: Session = Depends(get_db),
-    user=Depends(get_current_user),
+    user=Depends(get_principal),
 ):
     return create_activity(payload, db=db, user=user)
 
@@ -187,7 +417,7 @@ def alias_create_activity(
 def delete_activity(
     activity_id: int,
     db: Session = Depends(get_db),
-    user=Depends(get_current_user)
+    user=Depends(get_principal)
 ):
     """
     Delete a single activity, ensuring:
@@ -196,10 +426,9 @@ def delete_activity(
     """
     act = (
         db.query(ActivityLog)
-        .join(Facility, ActivityLog.facility_id == Facility.facility_id)
         .filter(
             ActivityLog.activity_id == activity_id,
-            Facility.org_id == user.org_id
+            ActivityLog.org_id == user.org_id
         )
         .first()
     )
@@ -207,7 +436,14 @@ def delete_activity(
     if not act:
         raise HTTPException(404, "Activity not found or access denied")
 
+    scope = act.activity_type_fk.scope if act.activity_type_fk else None
+    rollup.remove_activities(db, [(
+        rollup.rollup_key(user.org_id, act.facility_id, scope, act.activity_type_id, act.activity_date),
+        act.co2e_kg,
+        act.quantity,
+    )])
     db.delete(act)
+    versions.bump(db, versions.org_key(user.org_id))
     db.commit()
 
     return {"deleted": True, "activity_id": activity_id}
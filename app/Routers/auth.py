@@ -1,20 +1,21 @@
 # app/Routers/auth.py
 from fastapi import APIRouter, Depends, HTTPException, status, Request, Form
 from fastapi.responses import JSONResponse, HTMLResponse
-from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 
 from ..database import get_db
 from ..models import User, Organization
 from ..schemas import UserCreate, UserOut, Token, ProfileUpdate
+from .. import passwords
+from ..templating import templates
 from ..security import (
-    hash_password,
-    verify_password,
     create_access_token,
     get_current_user,
+    invalidate_user,
+    invalidate_org,
 )
 
-templates = Jinja2Templates(directory="app/templates")
 
 # JSON auth endpoints (/api/auth/...)
 router = APIRouter(prefix="/api/auth", tags=["auth"])
@@ -42,52 +43,78 @@ def register_page(request: Request):
 # ---------------------------
 # Auth API
 # ---------------------------
+# Both endpoints are async: bcrypt runs in app.passwords' process pool and the
+# (short) database work is handed to the threadpool, so a burst of sign-ins
+# does not hold threadpool slots for the duration of a hash.
 @router.post("/register", response_model=UserOut, status_code=status.HTTP_201_CREATED)
-def register(payload: UserCreate, db: Session = Depends(get_db)):
+async def register(payload: UserCreate, db: Session = Depends(get_db)):
     # Check if email already exists
-    existing = db.query(User).filter(User.email == payload.email).first()
+    existing = await run_in_threadpool(
+        lambda: db.query(User.user_id).filter(User.email == payload.email).first()
+    )
     if existing:
         raise HTTPException(status_code=400, detail="Email already registered")
 
-    org_id = None
-    if payload.org_name:
-        org = (
-            db.query(Organization)
-            .filter(Organization.name == payload.org_name)
-            .first()
+    password_hash = await passwords.hash_password(payload.password)
+
+    def save() -> User:
+        org_id = None
+        if payload.org_name:
+            org = (
+                db.query(Organization)
+                .filter(Organization.name == payload.org_name)
+                .first()
+            )
+            if not org:
+                org = Organization(name=payload.org_name)
+                db.add(org)
+                db.flush()  # assigns id without commit
+            org_id = org.org_id
+
+        user = User(
+            email=payload.email,
+            full_name=payload.full_name,
+            password_hash=password_hash,
+            org_id=org_id,
         )
-        if not org:
-            org = Organization(name=payload.org_name)
-            db.add(org)
-            db.flush()  # assigns id without commit
-        org_id = org.org_id
-
-    user = User(
-        email=payload.email,
-        full_name=payload.full_name,
-        password_hash=hash_password(payload.password),
-        org_id=org_id,
-    )
-    db.add(user)
-    db.commit()
-    db.refresh(user)
-    return user
+        db.add(user)
+        db.commit()
+        db.refresh(user)
+        return user
+
+    return await run_in_threadpool(save)
 
 
 @router.post("/login", response_model=Token)
-def login(
+async def login(
     email: str = Form(...),
     password: str = Form(...),
     db: Session = Depends(get_db),
 ):
-    user = db.query(User).filter(User.email == email).first()
-    if not user or not verify_password(password, user.password_hash):
+    user = await run_in_threadpool(
+        lambda: db.query(User).filter(User.email == email).first()
+    )
+    if not user or not await passwords.verify_password(password, user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid credentials",
         )
 
-    token = create_access_token({"sub": str(user.user_id)})
+    # read before the rehash commit expires the instance: reloading it here
+    # would be a blocking SELECT on the event loop
+    user_id = user.user_id
+
+    # Transparently move old hashes to the configured work factor
+    if passwords.needs_rehash(user.password_hash):
+        new_hash = await passwords.hash_password(password)
+
+        def save_hash() -> None:
+            user.password_hash = new_hash
+            db.commit()
+
+        await run_in_threadpool(save_hash)
+
+    token = create_access_token({"sub": str(user_id)})
 
     resp = JSONResponse({"access_token": token, "token_type": "bearer"})
     resp.set_cookie(
@@ -183,6 +210,9 @@ def update_profile_me(
             org.size = payload.org_size
 
     db.commit()
+    invalidate_user(current_user.user_id)
+    if org:
+        invalidate_org(org.org_id)
     db.refresh(current_user)
 
     if current_user.org_id and not org:
@@ -0,0 +1,192 @@
+# app/Routers/exports.py
+from datetime import date
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from ..database import SessionLocal, get_db
+from ..security import get_principal
+from ..models import ActivityLog, ActivityType, EmissionRollup, Facility, Unit
+from .. import exports
+
+router = APIRouter(prefix="/api/exports", tags=["exports"])
+
+EXPORT_BATCH_SIZE = 5000
+FORMAT_PATTERN = "^(csv|xlsx|parquet)$"
+R = EmissionRollup.__table__
+
+ACTIVITY_COLUMNS = [
+    ("activity_id", "int"),
+    ("activity_date", "date"),
+    ("facility_id", "int"),
+    ("facility_name", "str"),
+    ("activity_type", "str"),
+    ("activity_type_label", "str"),
+    ("scope", "int"),
+    ("quantity", "float"),
+    ("unit", "str"),
+    ("factor_id", "int"),
+    ("co2e_kg", "float"),
+]
+
+SUMMARY_COLUMNS = [
+    ("period", "str"),
+    ("facility_id", "int"),
+    ("facility_name", "str"),
+    ("scope", "int"),
+    ("activity_type", "str"),
+    ("co2e_kg", "float"),
+    ("quantity", "float"),
+    ("activity_count", "int"),
+]
+
+
+def _check_request(fmt: str, facility_id: int | None, db: Session, org_id: int) -> None:
+    try:
+        exports.require(fmt)
+    except exports.ExportUnavailable as exc:
+        raise HTTPException(status_code=501, detail=str(exc))
+
+    if facility_id is not None:
+        owned = db.execute(
+            select(Facility.facility_id).where(
+                Facility.facility_id == facility_id,
+                Facility.org_id == org_id,
+            )
+        ).first()
+        if owned is None:
+            raise HTTPException(status_code=404, detail="Facility not found")
+
+
+def _stream(fmt: str, columns, stmt, title: str, transform=None):
+    # own session: the response body outlives the request-scoped one
+    db = SessionLocal()
+    try:
+        result = db.execute(stmt.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        batches = result.partitions()
+        if transform is not None:
+            batches = ([transform(row) for row in batch] for batch in batches)
+        yield from exports.iter_export(fmt, columns, batches, title)
+    finally:
+        db.close()
+
+
+def _response(fmt: str, body, name: str, org_id: int) -> StreamingResponse:
+    filename = f"{name}-org{org_id}-{date.today():%Y%m%d}.{fmt}"
+    return StreamingResponse(
+        body,
+        media_type=exports.media_type(fmt),
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@router.get("/activities")
+def export_activities(
+    fmt: str = Query("csv", alias="format", pattern=FORMAT_PATTERN),
+    facility_id: Optional[int] = Query(None),
+    scope: Optional[int] = Query(None),
+    date_from: Optional[date] = Query(None),
+    date_to: Optional[date] = Query(None),
+    db: Session = Depends(get_db),
+    user=Depends(get_principal),
+):
+    """
+    Every activity of the org (oldest first) as CSV, XLSX or Parquet, read
+    through a server-side cursor and streamed as it is written.
+    """
+    _check_request(fmt, facility_id, db, user.org_id)
+
+    q = (
+        select(
+            ActivityLog.activity_id,
+            ActivityLog.activity_date,
+            ActivityLog.facility_id,
+            Facility.name,
+            ActivityType.code,
+            ActivityType.label,
+            ActivityType.scope,
+            ActivityLog.quantity,
+            Unit.code,
+            ActivityLog.factor_id,
+            ActivityLog.co2e_kg,
+        )
+        .join(Facility, Facility.facility_id == ActivityLog.facility_id)
+        .outerjoin(ActivityType, ActivityType.activity_type_id == ActivityLog.activity_type_id)
+        .outerjoin(Unit, Unit.unit_id == ActivityLog.unit_id)
+        .where(ActivityLog.org_id == user.org_id)
+    )
+    if facility_id is not None:
+        q = q.where(ActivityLog.facility_id == facility_id)
+    if scope is not None:
+        q = q.where(ActivityType.scope == scope)
+    if date_from is not None:
+        q = q.where(ActivityLog.activity_date >= date_from)
+    if date_to is not None:
+        q = q.where(ActivityLog.activity_date <= date_to)
+    q = q.order_by(ActivityLog.activity_date, ActivityLog.activity_id)
+
+    return _response(fmt, _stream(fmt, ACTIVITY_COLUMNS, q, "activities"), "activities", user.org_id)
+
+
+@router.get("/summary")
+def export_summary(
+    fmt: str = Query("csv", alias="format", pattern=FORMAT_PATTERN),
+    period: str = Query("monthly", pattern="^(monthly|yearly)$"),
+    facility_id: Optional[int] = Query(None),
+    scope: Optional[int] = Query(None),
+    date_from: Optional[date] = Query(None),
+    date_to: Optional[date] = Query(None),
+    db: Session = Depends(get_db),
+    user=Depends(get_principal),
+):
+    """
+    Emissions per period x facility x scope x activity type, from the rollup.
+    Date filters apply at month granularity; undated activities are left out.
+    """
+    _check_request(fmt, facility_id, db, user.org_id)
+
+    period_cols = [R.c.period_year]
+    if period == "monthly":
+        period_cols.append(R.c.period_month)
+
+    q = (
+        select(
+            *period_cols,
+            R.c.facility_id,
+            Facility.name,
+            R.c.scope,
+            ActivityType.code,
+            func.sum(R.c.co2e_kg),
+            func.sum(R.c.quantity),
+            func.sum(R.c.row_count),
+        )
+        .select_from(R)
+        .join(Facility, Facility.facility_id == R.c.facility_id)
+        .outerjoin(ActivityType, ActivityType.activity_type_id == R.c.activity_type_id)
+        .where(R.c.org_id == user.org_id, R.c.period_year > 0)
+        .group_by(*period_cols, R.c.facility_id, Facility.name, R.c.scope, ActivityType.code)
+        .order_by(*period_cols, R.c.facility_id, R.c.scope, ActivityType.code)
+    )
+    if facility_id is not None:
+        q = q.where(R.c.facility_id == facility_id)
+    if scope is not None:
+        q = q.where(R.c.scope == scope)
+    month_index = R.c.period_year * 100 + R.c.period_month
+    if date_from is not None:
+        q = q.where(month_index >= date_from.year * 100 + date_from.month)
+    if date_to is not None:
+        q = q.where(month_index <= date_to.year * 100 + date_to.month)
+
+    def to_row(row):
+        if period == "monthly":
+            label, rest = f"{row[0]:04d}-{row[1]:02d}", row[2:]
+        else:
+            label, rest = str(row[0]), row[1:]
+        fac_id, fac_name, sc, code, co2e, qty, count = rest
+        return (label, fac_id, fac_name, sc or None, code, co2e, qty, count)
+
+    body = _stream(fmt, SUMMARY_COLUMNS, q, "summary", transform=to_row)
+    return _response(fmt, body, "summary", user.org_id)
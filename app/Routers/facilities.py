@@ -1,21 +1,22 @@
 # app/Routers/facilities.py
 from fastapi import APIRouter, Depends, Request, HTTPException, status
 from fastapi.responses import HTMLResponse
-from fastapi.templating import Jinja2Templates
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from typing import Optional
-from ..database import get_db
-from ..security import get_current_user
+from ..database import get_async_db, get_db
+from ..security import get_principal, get_principal_async, get_token_claims
 from ..models import Facility
-
-templates = Jinja2Templates(directory="app/templates")
+from .. import conditional, rollup, versions
+from ..templating import templates
 
 router = APIRouter(prefix="/api/facilities", tags=["facilities"])
 pages = APIRouter(tags=["pages"])
 
 # ---------- CREATE FACILITY ----------
 @router.post("")
-def create_facility(payload: dict, db: Session = Depends(get_db), user=Depends(get_current_user)):
+def create_facility(payload: dict, db: Session = Depends(get_db), user=Depends(get_principal)):
     name = (payload.get("name") or "").strip()
     location = (payload.get("location") or "").strip()
     grid = (payload.get("grid_region_code") or "").strip()
@@ -30,23 +31,29 @@ def create_facility(payload: dict, db: Session = Depends(get_db), user=Depends(g
         grid_region_code=grid or None
     )
     db.add(fac)
+    versions.bump(db, versions.org_key(user.org_id))
     db.commit()
     db.refresh(fac)
     return fac
 
 # ---------- LIST FACILITIES ----------
 @router.get("")
-def list_facilities(db: Session = Depends(get_db), user=Depends(get_current_user)):
-    return (
-        db.query(Facility)
-        .filter(Facility.org_id == user.org_id)
-        .order_by(Facility.facility_id)
-        .all()
+async def list_facilities(request: Request, db: AsyncSession = Depends(get_async_db), user=Depends(get_principal_async)):
+    async def build():
+        result = await db.execute(
+            select(Facility)
+            .where(Facility.org_id == user.org_id)
+            .order_by(Facility.facility_id)
+        )
+        return result.scalars().all()
+
+    return await conditional.cached_json_async(
+        request, db, "facilities.list", [versions.org_key(user.org_id)], (), build
     )
 
 # ---------- GET ONE FACILITY ----------
 @router.get("/{facility_id}")
-def get_facility(facility_id: int, db: Session = Depends(get_db), user=Depends(get_current_user)):
+def get_facility(facility_id: int, db: Session = Depends(get_db), user=Depends(get_principal)):
     fac = (
         db.query(Facility)
         .filter(Facility.facility_id == facility_id, Facility.org_id == user.org_id)
@@ -64,7 +71,7 @@ def get_facility(facility_id: int, db: Session = Depends(get_db), user=Depends(g
 
 # ---------- UPDATE ----------
 @router.put("/{facility_id}")
-def update_facility(facility_id: int, payload: dict, db: Session = Depends(get_db), user=Depends(get_current_user)):
+def update_facility(facility_id: int, payload: dict, db: Session = Depends(get_db), user=Depends(get_principal)):
     fac = (
         db.query(Facility)
         .filter(Facility.facility_id == facility_id, Facility.org_id == user.org_id)
@@ -76,13 +83,14 @@ def update_facility(facility_id: int, payload: dict, db: Session = Depends(get_d
     fac.name = payload.get("name") or fac.name
     fac.location = payload.get("location") or fac.location
     fac.grid_region_code = payload.get("grid_region_code") or fac.grid_region_code
+    versions.bump(db, versions.org_key(user.org_id))
     db.commit()
     db.refresh(fac)
     return {"ok": True}
 
 # ---------- DELETE ----------
 @router.delete("/{facility_id}")
-def delete_facility(facility_id: int, db: Session = Depends(get_db), user=Depends(get_current_user)):
+def delete_facility(facility_id: int, db: Session = Depends(get_db), user=Depends(get_principal)):
     fac = (
         db.query(Facility)
         .filter(Facility.facility_id == facility_id, Facility.org_id == user.org_id)
@@ -91,15 +99,17 @@ def delete_facility(facility_id: int, db: Session = Depends(get_db), user=Depend
     if not fac:
         raise HTTPException(404, "Facility not found")
 
+    rollup.drop_facility(db, fac.facility_id)
     db.delete(fac)
+    versions.bump(db, versions.org_key(user.org_id))
     db.commit()
     return {"deleted": True}
 
 # ---------- HTML ----------
 @pages.get("/facilities", response_class=HTMLResponse)
-def facilities_page(request: Request, user=Depends(get_current_user)):
+def facilities_page(request: Request, claims=Depends(get_token_claims)):
     return templates.TemplateResponse("facilities_list.html", {"request": request})
 
 @pages.get("/facilities/{facility_id}", response_class=HTMLResponse)
-def facility_detail_page(facility_id: int, request: Request, user=Depends(get_current_user)):
+def facility_detail_page(facility_id: int, request: Request, claims=Depends(get_token_claims)):
     return templates.TemplateResponse("facility_detail.html", {"request": request, "facility_id": facility_id})
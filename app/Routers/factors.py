@@ -1,12 +1,26 @@
 # app/Routers/factors.py
-from fastapi import APIRouter, Depends, Request
+import os
+
+from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.responses import HTMLResponse
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 
-from ..database import get_db
-from ..security import get_current_user
+from ..database import get_async_db, get_db
+from ..security import get_principal, get_principal_async, require_role
 from ..models import EmissionFactor
 from ..schemas import FactorOut  # OK if you use it elsewhere
+from ..resolver import resolver
+from ..factor_import import FactorImportError, import_factors
+from .. import conditional, uploads, versions
+
+# Emission factors are shared by every org, so bulk imports are limited to these roles
+FACTOR_IMPORT_ROLES = tuple(
+    r.strip() for r in os.getenv("FACTOR_IMPORT_ROLES", "admin").split(",") if r.strip()
+)
 
 router = APIRouter(prefix="/api/factors", tags=["factors"])
 pages = APIRouter(tags=["factors:pages"])
@@ -19,20 +33,32 @@ def factors_page(request: Request):
         {"request": request},
     )
 
+@pages.get("/factors/import", response_class=HTMLResponse)
+def factors_import_page(request: Request):
+    return request.app.state.templates.TemplateResponse(
+        "factors_import.html",
+        {"request": request},
+    )
+
 @router.get("")
-def list_factors(
-    db: Session = Depends(get_db),
-    user=Depends(get_current_user),
+async def list_factors(
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    user=Depends(get_principal_async),
 ):
-    factors = (
-        db.query(EmissionFactor)
-        .order_by(EmissionFactor.category, EmissionFactor.year)
-        .all()
+    async def build():
+        result = await db.execute(
+            select(EmissionFactor)
+            .order_by(EmissionFactor.category, EmissionFactor.year)
+        )
+        return result.scalars().all()
+
+    return await conditional.cached_json_async(
+        request, db, "factors.list", [versions.FACTORS], (), build
     )
-    return factors
 
 @router.post("")
-def create_factor(payload: dict, db: Session = Depends(get_db), user=Depends(get_current_user)):
+def create_factor(payload: dict, db: Session = Depends(get_db), user=Depends(get_principal)):
     f = EmissionFactor(
         source=payload.get("source"),
         category=payload["category"],
@@ -41,6 +67,40 @@ def create_factor(payload: dict, db: Session = Depends(get_db), user=Depends(get
         year=payload.get("year"),
     )
     db.add(f)
-    db.commit()
+    versions.bump(db, versions.FACTORS)
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="A factor with this source, category, unit and year already exists")
+    resolver.invalidate()
     db.refresh(f)
     return {"created": True, "factor_id": f.factor_id}
+
+@router.post("/import")
+async def import_factor_csv(
+    request: Request,
+    db: Session = Depends(get_db),
+    user=Depends(require_role(*FACTOR_IMPORT_ROLES)),
+):
+    """
+    multipart/form-data with one `file` (CSV: name/category, unit, factor
+    value, source, year) and an optional `source` field used for rows that
+    have none. Existing (source, category, unit, year) rows are updated.
+    Only callers with a role in FACTOR_IMPORT_ROLES may import.
+    """
+    try:
+        fields, stored = await uploads.receive(request)
+    except uploads.UploadError as exc:
+        raise HTTPException(status_code=exc.status_code, detail=str(exc))
+
+    try:
+        return await run_in_threadpool(
+            import_factors, db, stored.temp_path, (fields.get("source") or "").strip() or None
+        )
+    except FactorImportError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="File is not UTF-8 encoded CSV")
+    finally:
+        await run_in_threadpool(uploads.discard, stored)
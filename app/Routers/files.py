@@ -1,56 +1,95 @@
 # app/Routers/files.py
 import os
-from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException
+from fastapi import APIRouter, Body, Depends, HTTPException, Request
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from pathlib import Path
-from fastapi.responses import HTMLResponse
-from fastapi.templating import Jinja2Templates
-from pathlib import Path
 from ..models import UploadedFile
 from ..database import get_db
-from ..security import get_current_user
+from ..security import get_principal
+from ..ingest import INGESTIBLE_PURPOSES
+from .. import jobs, uploads
 
-router = APIRouter()
+router = APIRouter(prefix="/api/files", tags=["files"])
 
-UPLOAD_ROOT = Path("uploads")
-UPLOAD_ROOT.mkdir(exist_ok=True)
 
-@router.post("/files/upload")
+@router.post("/upload")
 async def upload_file(
-    purpose: str = Form(...),
-    file: UploadFile = File(...),
+    request: Request,
     db: Session = Depends(get_db),
-    user=Depends(get_current_user),
+    user=Depends(get_principal),
 ):
+    """
+    multipart/form-data with a `purpose` field and one `file`.
+
+    The body is streamed to disk in chunks and hashed on the way; identical
+    files share one stored copy.
+    """
     if not user.org_id:
         raise HTTPException(status_code=400, detail="User is not attached to an organization")
 
-    org_dir = UPLOAD_ROOT / f"org_{user.org_id}"
-    org_dir.mkdir(parents=True, exist_ok=True)
+    try:
+        fields, stored = await uploads.receive(request)
+    except uploads.UploadError as exc:
+        raise HTTPException(status_code=exc.status_code, detail=str(exc))
+
+    purpose = (fields.get("purpose") or "").strip()
+    if not purpose:
+        uploads.discard(stored)
+        raise HTTPException(status_code=400, detail="purpose is required")
+
+    return await run_in_threadpool(_store, db, user, purpose, stored)
+
+
+def _same_blob(sha256: str | None, path: str):
+    return UploadedFile.sha256 == sha256 if sha256 else UploadedFile.storage_path == path
+
+
+def _lock_blob(db: Session, sha256: str | None, path: str) -> list[int]:
+    """
+    Lock every row sharing a stored copy (SELECT ... FOR UPDATE).
 
-    dest = org_dir / file.filename
-    data = await file.read()
-    with dest.open("wb") as f:
-        f.write(data)
+    Upload and delete both take this lock before touching the blob, so placing
+    a copy and removing the last reference to it never interleave.
+    """
+    return [
+        file_id for (file_id,) in
+        db.query(UploadedFile.file_id).filter(_same_blob(sha256, path)).with_for_update().all()
+    ]
 
+
+def _store(db: Session, user, purpose: str, stored: uploads.StoredFile) -> UploadedFile:
     rec = UploadedFile(
         org_id=user.org_id,
         user_id=user.user_id,
         purpose=purpose,
-        storage_path=str(dest),
-        original_name=file.filename,
-        content_type=file.content_type,
+        storage_path=str(uploads.blob_path(stored.sha256)),
+        original_name=stored.filename,
+        content_type=stored.content_type,
+        sha256=stored.sha256,
+        size_bytes=stored.size,
     )
-    db.add(rec)
-    db.commit()
+    placed = False
+    try:
+        _lock_blob(db, stored.sha256, rec.storage_path)
+        db.add(rec)
+        db.flush()
+        uploads.place(stored)
+        placed = True
+        db.commit()
+    except Exception:
+        db.rollback()
+        # a placed blob may already be shared by a concurrent upload; leave it
+        if not placed:
+            uploads.discard(stored)
+        raise
     db.refresh(rec)
     return rec
 
 
-@router.get("/files/list")
+@router.get("/list")
 def list_files(
     db: Session = Depends(get_db),
-    user=Depends(get_current_user),
+    user=Depends(get_principal),
 ):
     items = (
         db.query(UploadedFile)
@@ -61,11 +100,11 @@ def list_files(
     return {"items": items}
 
 
-@router.delete("/files/{file_id}")
+@router.delete("/{file_id}")
 def delete_file(
     file_id: int,
     db: Session = Depends(get_db),
-    user=Depends(get_current_user),
+    user=Depends(get_principal),
 ):
     rec = (
         db.query(UploadedFile)
@@ -78,12 +117,51 @@ def delete_file(
     if not rec:
         raise HTTPException(status_code=404, detail="File not found")
 
-    try:
-        if rec.storage_path and os.path.exists(rec.storage_path):
-            os.remove(rec.storage_path)
-    except OSError:
-        pass
-
+    path, sha256 = rec.storage_path, rec.sha256
+    _lock_blob(db, sha256, path)
     db.delete(rec)
+    db.flush()
+
+    # the stored copy goes with the last row that references it; removed while
+    # the rows are still locked, so an upload of the same file waits and re-places it
+    shared = db.query(UploadedFile.file_id).filter(_same_blob(sha256, path)).with_for_update().first()
+    if path and shared is None:
+        uploads.remove(path)
+    db.commit()
+    return {"ok": True}
+
+@router.post("/{file_id}/ingest", status_code=202)
+def ingest_file(
+    file_id: int,
+    payload: dict | None = Body(default=None),
+    db: Session = Depends(get_db),
+    user=Depends(get_principal),
+):
+    """
+    Queue an uploaded activity CSV for loading into activity_log.
+
+    Optional body: {"mapping": {"facility": "Site", "quantity": "kWh", ...}}
+    to point logical fields at non-standard header names. Poll the returned
+    job at /api/jobs/{job_id} for progress and the result.
+    """
+    rec = (
+        db.query(UploadedFile)
+        .filter(
+            UploadedFile.file_id == file_id,
+            UploadedFile.org_id == user.org_id,
+        )
+        .first()
+    )
+    if not rec:
+        raise HTTPException(status_code=404, detail="File not found")
+    if rec.purpose not in INGESTIBLE_PURPOSES:
+        raise HTTPException(status_code=400, detail=f"Files with purpose '{rec.purpose}' hold no activity data")
+    if not os.path.exists(rec.storage_path):
+        raise HTTPException(status_code=410, detail="Stored file is missing")
+
+    mapping = (payload or {}).get("mapping")
+    job = jobs.enqueue(
+        db, "ingest_file", user.org_id, {"file_id": rec.file_id, "mapping": mapping}, user_id=user.user_id
+    )
     db.commit()
-    return {"ok": True}
\ No newline at end of file
+    return {"file_id": rec.file_id, "job_id": job.job_id, "status": job.status}
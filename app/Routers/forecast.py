@@ -1,68 +1,134 @@
 # app/Routers/forecast.py
-from fastapi import APIRouter, Depends, Request, HTTPException
+from fastapi import APIRouter, Depends, Query, Request, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import HTMLResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from decimal import Decimal
-from ..database import get_db
-from ..security import get_current_user
-from ..models import ForecastScenario, ActivityLog, Facility
+from ..database import get_async_db, get_db
+from ..security import get_principal, get_principal_async, get_token_claims
+from ..models import ForecastScenario
+from .. import conditional, forecasting, rollup, versions
 
 router = APIRouter(prefix="/api/forecast", tags=["forecast"])
 pages = APIRouter(tags=["forecast:pages"])
 
 @pages.get("/forecast", response_class=HTMLResponse)
-def page(request: Request, user=Depends(get_current_user)):
+def page(request: Request, claims=Depends(get_token_claims)):
     return request.app.state.templates.TemplateResponse("forecast.html", {"request": request})
 
-def total_emissions_for_year(org_id: int, year: int, db: Session) -> Decimal:
-    q = (
-        db.query(ActivityLog)
-        .join(Facility)
-        .filter(Facility.org_id == org_id)
-        .filter(ActivityLog.activity_date != None)
-        .filter(ActivityLog.activity_date.between(f"{year}-01-01", f"{year}-12-31"))
-    )
-    total = Decimal("0")
-    for r in q.all():
-        total += Decimal(str(r.co2e_kg or 0))
-    return total
+async def total_emissions_for_year(org_id: int, year: int, db: AsyncSession) -> Decimal:
+    return await rollup.total_co2e_async(db, org_id, year, year)
+
+def _category_growth(raw) -> dict | None:
+    """Validate {"<category>": <pct>, ...}."""
+    if raw in (None, {}):
+        return None
+    if not isinstance(raw, dict):
+        raise HTTPException(400, "category_growth_pct must be an object of {category: percent}")
+    try:
+        return {str(k): float(v) for k, v in raw.items()}
+    except (TypeError, ValueError):
+        raise HTTPException(400, "category_growth_pct values must be numbers")
+
+def _years(payload: dict) -> tuple[int, int]:
+    try:
+        start_year, end_year = int(payload["start_year"]), int(payload["end_year"])
+    except KeyError as exc:
+        raise HTTPException(400, f"{exc.args[0]} is required")
+    except (TypeError, ValueError):
+        raise HTTPException(400, "start_year and end_year must be integers")
+    if end_year < start_year:
+        raise HTTPException(400, "end_year must not be before start_year")
+    if end_year - start_year > forecasting.MAX_HORIZON_YEARS:
+        raise HTTPException(400, f"A scenario can span at most {forecasting.MAX_HORIZON_YEARS} years")
+    return start_year, end_year
 
 @router.post("/scenario")
-def create_scenario(payload: dict, db: Session = Depends(get_db), user=Depends(get_current_user)):
+def create_scenario(payload: dict, db: Session = Depends(get_db), user=Depends(get_principal)):
+    start_year, end_year = _years(payload)
     sc = ForecastScenario(
         org_id=user.org_id,
         name=payload["name"],
         description=payload.get("description"),
         annual_growth_pct=payload.get("annual_growth_pct"),
         renewable_share_pct=payload.get("renewable_share_pct"),
-        start_year=payload["start_year"],
-        end_year=payload["end_year"],
+        category_growth_pct=_category_growth(payload.get("category_growth_pct")),
+        start_year=start_year,
+        end_year=end_year,
         created_by=user.user_id,
     )
     db.add(sc)
+    versions.bump(db, versions.org_key(user.org_id))
     db.commit()
     db.refresh(sc)
     return {"created": True, "scenario_id": sc.scenario_id}
 
+@router.get("/compare")
+async def compare_scenarios(request: Request, db: AsyncSession = Depends(get_async_db), user=Depends(get_principal_async)):
+    """Side-by-side projections of every scenario of the org, computed in one pass."""
+    async def build():
+        scenarios = (
+            await db.execute(
+                select(ForecastScenario)
+                .filter_by(org_id=user.org_id)
+                .order_by(ForecastScenario.scenario_id)
+            )
+        ).scalars().all()
+        projections = await forecasting.project_scenarios(db, user.org_id, scenarios)
+        years = sorted({r["year"] for p in projections for r in p["results"]})
+        return {"years": years, "scenarios": projections}
+
+    return await conditional.cached_json_async(
+        request, db, "forecast.compare", [versions.org_key(user.org_id)], (), build
+    )
+
 @router.get("/scenario/{scenario_id}")
-def scenario_results(scenario_id: int, db: Session = Depends(get_db), user=Depends(get_current_user)):
-    sc = db.query(ForecastScenario).filter_by(scenario_id=scenario_id, org_id=user.org_id).first()
-    if not sc:
-        raise HTTPException(404, "Scenario not found")
+async def scenario_results(
+    request: Request,
+    scenario_id: int,
+    mode: str = Query("deterministic", pattern="^(deterministic|stochastic)$"),
+    paths: int = Query(10_000, ge=100, le=forecasting.MAX_PATHS),
+    seed: int = Query(0, ge=0),
+    growth_sd_pct: float = Query(forecasting.GROWTH_SD_PCT, ge=0),
+    renewable_sd_pct: float = Query(forecasting.RENEWABLE_SD_PCT, ge=0),
+    factor_sd_pct: float = Query(forecasting.FACTOR_SD_PCT, ge=0),
+    db: AsyncSession = Depends(get_async_db),
+    user=Depends(get_principal_async),
+):
+    """
+    Year-by-year projection of one scenario.
 
-    results = []
-    current = total_emissions_for_year(user.org_id, sc.start_year, db)
-    growth = Decimal(str(sc.annual_growth_pct or 0)) / Decimal("100")
-    renewable = Decimal(str(sc.renewable_share_pct or 0)) / Decimal("100")
+    mode=stochastic also returns P10/P50/P90 bands from `paths` Monte Carlo
+    paths in which growth, renewable share and emission factors vary by the
+    given spreads; the same scenario and seed give the same bands.
+    """
+    spread = forecasting.Spread(growth_sd_pct, renewable_sd_pct, factor_sd_pct)
 
-    for yr in range(sc.start_year, sc.end_year + 1):
-        if yr > sc.start_year:
-            current = current * (1 + growth)
-        adjusted = current * (1 - renewable)
+    async def build():
+        sc = (
+            await db.execute(select(ForecastScenario).filter_by(scenario_id=scenario_id, org_id=user.org_id))
+        ).scalars().first()
+        if not sc:
+            raise HTTPException(404, "Scenario not found")
 
-        results.append({
-            "year": yr,
-            "projected_kg": float(adjusted),
-        })
+        # Start-year baseline by (category, scope); growth per category and the
+        # renewable share applied to electricity only
+        baselines = await forecasting.load_baselines(db, user.org_id, [sc.start_year])
+        projection, = forecasting.project([sc], baselines)
 
-    return {"scenario": sc.name, "results": results}
+        if mode == "stochastic":
+            try:
+                projection["bands"] = await run_in_threadpool(
+                    forecasting.simulate, sc, dict(baselines.get(sc.start_year, {})), paths, seed, spread
+                )
+            except forecasting.SimulationTooLarge as exc:
+                raise HTTPException(400, str(exc))
+            projection["simulation"] = {"paths": paths, "seed": seed, **spread._asdict()}
+        return projection
+
+    params = (scenario_id, mode) + ((paths, seed, spread) if mode == "stochastic" else ())
+    return await conditional.cached_json_async(
+        request, db, "forecast.scenario", [versions.org_key(user.org_id)], params, build
+    )
@@ -0,0 +1,59 @@
+# app/Routers/jobs.py
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+
+from ..database import get_db
+from ..security import get_principal
+from ..models import Job
+from .. import jobs
+
+router = APIRouter(prefix="/api/jobs", tags=["jobs"])
+
+
+def _own_job(db: Session, job_id: int, org_id: int) -> Job:
+    job = db.query(Job).filter(Job.job_id == job_id, Job.org_id == org_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.get("")
+def list_jobs(
+    limit: int = Query(20, ge=1, le=200),
+    db: Session = Depends(get_db),
+    user=Depends(get_principal),
+):
+    """The org's most recent jobs, newest first."""
+    items = (
+        db.query(Job)
+        .filter(Job.org_id == user.org_id)
+        .order_by(Job.created_at.desc(), Job.job_id.desc())
+        .limit(limit)
+        .all()
+    )
+    return {"items": [jobs.job_dict(j) for j in items]}
+
+
+@router.get("/{job_id}")
+def get_job(job_id: int, db: Session = Depends(get_db), user=Depends(get_principal)):
+    """Status, progress (0..1) and, once finished, the result or error of a job."""
+    return jobs.job_dict(_own_job(db, job_id, user.org_id))
+
+
+@router.post("/{job_id}/cancel")
+def cancel_job(job_id: int, db: Session = Depends(get_db), user=Depends(get_principal)):
+    job = _own_job(db, job_id, user.org_id)
+    if job.status in jobs.FINISHED:
+        raise HTTPException(status_code=409, detail=f"Job already {job.status}")
+    jobs.cancel(db, job)
+    db.commit()
+    db.refresh(job)
+    return jobs.job_dict(job)
+
+
+@router.post("/recompute", status_code=202)
+def recompute_org(db: Session = Depends(get_db), user=Depends(get_principal)):
+    """Queue a rebuild of the org's emission rollup from its activity log."""
+    job = jobs.enqueue(db, "recompute_org", user.org_id, user_id=user.user_id)
+    db.commit()
+    return {"job_id": job.job_id, "status": job.status}
@@ -0,0 +1,27 @@
+# app/Routers/metrics.py
+import hmac
+import os
+
+from fastapi import APIRouter, Header, HTTPException
+
+from .. import passwords
+from ..database import pool_metrics
+
+router = APIRouter(prefix="/internal", tags=["internal"], include_in_schema=False)
+
+# Callers must send it as X-Metrics-Token; without one configured the
+# endpoint does not exist
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+
+@router.get("/metrics")
+def get_metrics(x_metrics_token: str | None = Header(default=None)):
+    if not METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_metrics_token or not hmac.compare_digest(x_metrics_token, METRICS_TOKEN):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+    return {
+        "password_hashing": passwords.metrics(),
+        "db_pool": pool_metrics(),
+    }
@@ -1,21 +1,23 @@
 # app/Routers/planner.py
+import math
 from decimal import Decimal
 
+import numpy as np
 from fastapi import APIRouter, Depends, Request, HTTPException
 from fastapi.responses import HTMLResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import func
 
 from ..database import get_db
-from ..security import get_current_user
-from ..models import ActionLibrary, OrgAction, Facility, ActivityLog
+from ..security import get_principal, get_token_claims
+from ..models import ActionLibrary, OrgAction, Facility
+from .. import optimizer, rollup
 
 router = APIRouter(prefix="/api/planner", tags=["planner"])
 pages = APIRouter(tags=["planner:pages"])
 
 
 @pages.get("/planner", response_class=HTMLResponse)
-def planner_page(request: Request, user=Depends(get_current_user)):
+def planner_page(request: Request, claims=Depends(get_token_claims)):
     return request.app.state.templates.TemplateResponse(
         "planner.html",
         {"request": request},
@@ -34,7 +36,7 @@ def get_library(db: Session = Depends(get_db)):
 def add_action(
     payload: dict,
     db: Session = Depends(get_db),
-    user=Depends(get_current_user),
+    user=Depends(get_principal),
 ):
     a = ActionLibrary(
         code=payload["code"],
@@ -57,11 +59,16 @@ def add_action(
 def apply_action(
     payload: dict,
     db: Session = Depends(get_db),
-    user=Depends(get_current_user),
+    user=Depends(get_principal),
 ):
     fac_id = payload.get("facility_id")
-
-    if fac_id:
+    if fac_id in (None, ""):
+        fac_id = None
+    else:
+        try:
+            fac_id = int(fac_id)
+        except (TypeError, ValueError):
+            raise HTTPException(400, "facility_id must be an integer")
         fac = (
             db.query(Facility)
             .filter(Facility.facility_id == fac_id, Facility.org_id == user.org_id)
@@ -70,31 +77,111 @@ def apply_action(
         if not fac:
             raise HTTPException(403, "Invalid facility")
 
-    red_pct = Decimal(str(payload.get("estimated_reduction_pct", 0))) / Decimal("100")
-    capex = Decimal(str(payload.get("capex_usd", 0)))
+    try:
+        action_id = int(payload["action_id"])
+    except KeyError:
+        raise HTTPException(400, "action_id is required")
+    except (TypeError, ValueError):
+        raise HTTPException(400, "action_id must be an integer")
+    action = db.get(ActionLibrary, action_id)
+    if not action:
+        raise HTTPException(404, "Action not found")
+
+    # Reduction is estimated from the latest year's emissions (of the facility,
+    # or the whole org) and the action's expected percentage, not taken from the client
+    red_pct = Decimal(str(action.expected_reduction_pct or 0)) / Decimal("100")
+    capex = Decimal(str(payload.get("capex_usd", action.default_capex_usd or 0)))
+
+    year = optimizer.latest_year(db, user.org_id)
+    baselines = optimizer.facility_baselines(db, user.org_id, year) if year else {}
+    base_kg = baselines.get(fac_id, 0.0) if fac_id is not None else sum(baselines.values())
+    est_reduction_kg = Decimal(str(base_kg)) * red_pct
 
     act = OrgAction(
         org_id=user.org_id,
-        action_id=payload["action_id"],
+        action_id=action.action_id,
         facility_id=fac_id,
-        est_reduction_kg=payload.get("est_reduction_kg"),
+        est_reduction_kg=est_reduction_kg,
         est_capex_usd=capex,
         planned_year=payload.get("planned_year"),
         status="planned",
     )
     db.add(act)
     db.commit()
-    return {"applied": True}
+    return {"applied": True, "est_reduction_kg": float(est_reduction_kg)}
 
 
 # ----------------------------
-# Planner evaluation endpoint
+# Portfolio optimizer
 # ----------------------------
+@router.post("/optimize")
+def optimize_plan(
+    payload: dict,
+    db: Session = Depends(get_db),
+    user=Depends(get_principal),
+):
+    """
+    Pick the action/facility combination with the largest avoided CO2e
+    that fits a capex budget.
+
+    Expects JSON body like:
+    {
+      "budget_usd": 250000,
+      "target_year": 2030,
+      "baseline_year": 2024,        # optional, defaults to the latest year with data
+      "action_ids": [1, 2, 3],      # optional, defaults to the whole library
+      "facility_ids": [4, 5]        # optional, defaults to every facility
+    }
+
+    Also returns the marginal abatement cost curve of all candidates.
+    """
+    try:
+        budget = float(payload.get("budget_usd"))
+        target_year = int(payload.get("target_year"))
+        baseline_year = payload.get("baseline_year")
+        baseline_year = int(baseline_year) if baseline_year is not None else None
+        action_ids = [int(i) for i in payload.get("action_ids") or []]
+        facility_ids = [int(i) for i in payload.get("facility_ids") or []]
+    except (TypeError, ValueError):
+        raise HTTPException(400, "budget_usd and target_year are required numbers; ids must be integers")
+    if budget < 0 or not math.isfinite(budget):
+        raise HTTPException(400, "budget_usd must be a non-negative number")
+
+    try:
+        return optimizer.optimize(
+            db, user.org_id, budget, target_year,
+            baseline_year=baseline_year,
+            action_ids=action_ids,
+            facility_ids=facility_ids,
+        )
+    except ValueError as exc:
+        raise HTTPException(400, str(exc))
+
+
+# ----------------------------
+# Planner evaluation endpoints
+# ----------------------------
+# Toy model: share of the baseline each slider removes at 100 %
+SLIDER_WEIGHTS = {
+    "led_retrofit_pct": 0.10,   # LED retrofits
+    "solar_share_pct": 0.50,    # Solar share
+    "fleet_hybrid_pct": 0.30,   # Fleet hybridization
+}
+DEFAULT_SWEEP_AXIS = [float(v) for v in range(0, 101, 10)]
+MAX_SWEEP_POINTS = 200_000
+
+
+def _reduction_fraction(*sliders):
+    """Works on floats and on broadcast NumPy grids alike."""
+    total = sum(w * (v / 100.0) for w, v in zip(SLIDER_WEIGHTS.values(), sliders))
+    return np.minimum(total, 1.0)
+
+
 @router.post("/evaluate")
 def evaluate_plan(
     payload: dict,
     db: Session = Depends(get_db),
-    user=Depends(get_current_user),
+    user=Depends(get_principal),
 ):
     """
     Evaluate a simple reduction scenario based on sliders from planner.html.
@@ -112,25 +199,10 @@ def evaluate_plan(
     solar = float(payload.get("solar_share_pct", 0) or 0.0)
     fleet = float(payload.get("fleet_hybrid_pct", 0) or 0.0)
 
-    # Baseline: total CO2e from all activities for this org
-    baseline_co2e = (
-        db.query(func.coalesce(func.sum(ActivityLog.co2e_kg), 0))
-        .join(Facility, ActivityLog.facility_id == Facility.facility_id)
-        .filter(Facility.org_id == user.org_id)
-        .scalar()
-    )
-
-    baseline = float(baseline_co2e)
-
-    # Toy model: how strongly each slider affects reductions
-    reduction_fraction = (
-        (led / 100.0) * 0.10 +   # LED retrofits
-        (solar / 100.0) * 0.50 + # Solar share
-        (fleet / 100.0) * 0.30   # Fleet hybridization
-    )
-    if reduction_fraction > 1.0:
-        reduction_fraction = 1.0
+    # Baseline: total CO2e of the org, memoized until its activity data changes
+    baseline = float(rollup.org_total_co2e(db, user.org_id))
 
+    reduction_fraction = float(_reduction_fraction(led, solar, fleet))
     reduction_kg = baseline * reduction_fraction
     projected_kg = baseline - reduction_kg
 
@@ -145,3 +217,75 @@ def evaluate_plan(
         "estimated_reduction_kg": reduction_kg,
         "projected_emissions_kg": projected_kg,
     }
+
+
+def _sweep_axis(name: str, raw) -> list[float]:
+    if raw is None:
+        return DEFAULT_SWEEP_AXIS
+    if isinstance(raw, (int, float)):
+        return [float(raw)]
+    shape_error = f"{name} must be a number, a list of numbers or {{start, stop, step}}"
+    if isinstance(raw, dict):
+        try:
+            start, stop, step = float(raw["start"]), float(raw["stop"]), float(raw["step"])
+        except (KeyError, TypeError, ValueError):
+            raise HTTPException(400, shape_error)
+        if not step > 0:
+            raise HTTPException(400, f"{name}.step must be positive")
+        # count the points before building them, so a tiny step cannot allocate a huge array
+        span = (stop - start) / step
+        if not math.isfinite(span):
+            raise HTTPException(400, f"{name} start, stop and step must be finite")
+        n = max(math.floor(span + 1e-9) + 1, 0)
+        if n > MAX_SWEEP_POINTS:
+            raise HTTPException(400, f"{name} has more than {MAX_SWEEP_POINTS} points")
+        values = (start + step * np.arange(n)).tolist()
+    else:
+        if not isinstance(raw, list):
+            raise HTTPException(400, shape_error)
+        if len(raw) > MAX_SWEEP_POINTS:
+            raise HTTPException(400, f"{name} has more than {MAX_SWEEP_POINTS} points")
+        try:
+            values = [float(v) for v in raw]
+        except (TypeError, ValueError):
+            raise HTTPException(400, shape_error)
+    if len(values) == 0:
+        raise HTTPException(400, f"{name} must not be empty")
+    return values
+
+
+@router.post("/sweep")
+def sweep_plan(
+    payload: dict,
+    db: Session = Depends(get_db),
+    user=Depends(get_principal),
+):
+    """
+    Evaluate a whole grid of slider combinations in one call, so the page can
+    interpolate locally instead of posting to /evaluate on every move.
+
+    Every slider takes a number, a list or {"start", "stop", "step"}; missing
+    sliders default to 0..100 in steps of 10:
+    {
+      "led_retrofit_pct": [0, 50, 100],
+      "solar_share_pct": {"start": 0, "stop": 100, "step": 5}
+    }
+
+    Result arrays are nested in axis order (led, solar, fleet).
+    """
+    axes = {name: _sweep_axis(name, payload.get(name)) for name in SLIDER_WEIGHTS}
+    shape = [len(v) for v in axes.values()]
+    if math.prod(shape) > MAX_SWEEP_POINTS:
+        raise HTTPException(400, f"At most {MAX_SWEEP_POINTS} grid points per sweep")
+
+    baseline = float(rollup.org_total_co2e(db, user.org_id))
+    grids = np.meshgrid(*(np.asarray(v) for v in axes.values()), indexing="ij")
+    fraction = _reduction_fraction(*grids)
+
+    return {
+        "baseline_co2e_kg": baseline,
+        "axes": axes,
+        "shape": shape,
+        "estimated_reduction_fraction": fraction.round(6).tolist(),
+        "projected_emissions_kg": (baseline * (1.0 - fraction)).round(3).tolist(),
+    }
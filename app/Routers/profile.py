@@ -4,7 +4,7 @@ from fastapi.responses import HTMLResponse
 from sqlalchemy.orm import Session
 
 from ..database import get_db
-from ..security import get_current_user
+from ..security import get_current_user, invalidate_user, invalidate_org
 from ..models import User, Organization
 from ..schemas import ProfileOut, ProfileUpdate
 
@@ -68,6 +68,9 @@ def update_me(
             org.size = payload.org_size
 
     db.commit()
+    invalidate_user(user.user_id)
+    if org:
+        invalidate_org(org.org_id)
     db.refresh(user)
     if org:
         db.refresh(org)
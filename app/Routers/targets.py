@@ -2,13 +2,14 @@
 from datetime import date
 from decimal import Decimal
 
-from fastapi import APIRouter, Depends, Request
+from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.responses import HTMLResponse
 from sqlalchemy.orm import Session
 
 from ..database import get_db
-from ..security import get_current_user
-from ..models import Target, ActivityLog, Facility
+from ..security import get_principal
+from ..models import Target
+from .. import conditional, progress, versions
 
 router = APIRouter(prefix="/api/targets", tags=["targets"])
 pages = APIRouter(tags=["targets:pages"])
@@ -35,32 +36,24 @@ class TargetIn(BaseModel):
 def create_target(
     payload: TargetIn,
     db: Session = Depends(get_db),
-    user=Depends(get_current_user),
+    user=Depends(get_principal),
 ):
-    # Sum all emissions for this org between baseline_year and target_year
-    start_date = date(payload.baseline_year, 1, 1)
-    end_date = date(payload.target_year, 12, 31)
-
-    q = (
-        db.query(ActivityLog)
-        .join(Facility, Facility.facility_id == ActivityLog.facility_id)
-        .filter(Facility.org_id == user.org_id)
-        .filter(ActivityLog.activity_date >= start_date)
-        .filter(ActivityLog.activity_date <= end_date)
-    )
+    if payload.target_year <= payload.baseline_year:
+        raise HTTPException(400, "target_year must be after baseline_year")
 
-    baseline_total = Decimal("0")
-    for row in q:
-        baseline_total += Decimal(str(row.co2e_kg or 0))
+    # Baseline = emissions of the baseline year
+    baseline_total = progress.baseline_for(db, user.org_id, payload.baseline_year)
 
     t = Target(
         org_id=user.org_id,
         baseline_year=payload.baseline_year,
         target_year=payload.target_year,
         reduction_percent=Decimal(str(payload.target_percent)),
-        baseline_co2e_kg=baseline_total,
+        baseline_co2e_kg=Decimal(str(baseline_total)),
+        created_by=user.user_id,
     )
     db.add(t)
+    versions.bump(db, versions.org_key(user.org_id))
     db.commit()
     db.refresh(t)
 
@@ -70,4 +63,21 @@ def create_target(
         "target_year": t.target_year,
         "reduction_percent": float(t.reduction_percent),
         "baseline_co2e_kg": float(t.baseline_co2e_kg or 0),
-    }
\ No newline at end of file
+    }
+
+
+@router.get("")
+def list_targets(
+    request: Request,
+    db: Session = Depends(get_db),
+    user=Depends(get_principal),
+):
+    """
+    Every target of the org with its progress: actual vs required emissions
+    per year, on/off track for the latest year and the projected year in
+    which the target is reached.
+    """
+    return conditional.cached_json(
+        request, db, "targets.list", [versions.org_key(user.org_id)], (date.today().year,),
+        lambda: {"targets": progress.org_progress(db, user.org_id)},
+    )
@@ -0,0 +1,135 @@
+# app/aggregates.py
+"""
+Set-based emission aggregations.
+
+Reports read the monthly emission_rollup (see app/rollup.py) with GROUP BY
+queries, so their cost depends on the number of months and facilities,
+not on the number of activity rows.
+"""
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from .models import ActivityType, EmissionRollup
+
+R = EmissionRollup.__table__
+
+
+# ---------------------------------------------------------------
+# /api/reports/summary
+# ---------------------------------------------------------------
+def _filtered(stmt, org_id: int, facility_id: int | None, scope: int | None):
+    stmt = stmt.select_from(R).where(R.c.org_id == org_id)
+    if facility_id is not None:
+        stmt = stmt.where(R.c.facility_id == facility_id)
+    if scope is not None:
+        stmt = stmt.where(R.c.scope == scope)
+    return stmt
+
+
+def summary_statements(
+    org_id: int,
+    facility_id: int | None = None,
+    scope: int | None = None,
+    period: str = "monthly",
+) -> dict:
+    """Build the four GROUP BY statements behind the summary report."""
+    co2 = func.coalesce(func.sum(R.c.co2e_kg), 0)
+
+    totals = _filtered(
+        select(func.coalesce(func.sum(R.c.row_count), 0), co2), org_id, facility_id, scope
+    )
+
+    by_facility = (
+        _filtered(select(R.c.facility_id, co2), org_id, facility_id, scope)
+        .group_by(R.c.facility_id)
+        .order_by(R.c.facility_id)
+    )
+
+    # monthly -> (year, month) buckets, anything else -> year buckets
+    period_cols = [R.c.period_year]
+    if period == "monthly":
+        period_cols.append(R.c.period_month)
+    by_period = (
+        _filtered(select(*period_cols, co2), org_id, facility_id, scope)
+        .where(R.c.period_year > 0)
+        .group_by(*period_cols)
+        .order_by(*period_cols)
+    )
+
+    quantities = (
+        _filtered(
+            select(ActivityType.label, func.coalesce(func.sum(R.c.quantity), 0)),
+            org_id, facility_id, scope,
+        )
+        .join(ActivityType, ActivityType.activity_type_id == R.c.activity_type_id)
+        .group_by(ActivityType.label)
+        .order_by(ActivityType.label)
+    )
+
+    return {
+        "totals": totals,
+        "by_facility": by_facility,
+        "by_period": by_period,
+        "raw_quantities": quantities,
+    }
+
+
+def _period_key(year: int, month: int | None = None) -> str:
+    if month is None:
+        return str(year)
+    return f"{year:04d}-{month:02d}"
+
+
+def shape_summary(
+    results: dict,
+    facility_id: int | None,
+    scope: int | None,
+    period: str,
+) -> dict:
+    """Turn the aggregate rows into the public summary payload."""
+    count, total = results["totals"][0]
+    return {
+        "facility_id": facility_id,
+        "scope": scope,
+        "period": period,
+        "activity_count": int(count or 0),
+        "total_co2e_kg": float(total or 0),
+        "by_facility": [
+            {"facility_id": k, "co2e_kg": float(v or 0)} for k, v in results["by_facility"]
+        ],
+        "by_period": [
+            {
+                "period": _period_key(row[0], row[1] if period == "monthly" else None),
+                "co2e_kg": float(row[-1] or 0),
+            }
+            for row in results["by_period"]
+        ],
+        "raw_quantities": [
+            {"type": k, "quantity": float(v or 0)} for k, v in results["raw_quantities"]
+        ],
+    }
+
+
+def emissions_summary(
+    db: Session,
+    org_id: int,
+    facility_id: int | None = None,
+    scope: int | None = None,
+    period: str = "monthly",
+) -> dict:
+    stmts = summary_statements(org_id, facility_id, scope, period)
+    results = {name: db.execute(stmt).all() for name, stmt in stmts.items()}
+    return shape_summary(results, facility_id, scope, period)
+
+
+async def emissions_summary_async(
+    db: AsyncSession,
+    org_id: int,
+    facility_id: int | None = None,
+    scope: int | None = None,
+    period: str = "monthly",
+) -> dict:
+    stmts = summary_statements(org_id, facility_id, scope, period)
+    results = {name: (await db.execute(stmt)).all() for name, stmt in stmts.items()}
+    return shape_summary(results, facility_id, scope, period)
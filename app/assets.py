@@ -0,0 +1,123 @@
+# app/assets.py
+"""
+Fingerprinted static assets.
+
+`python scripts/build_static.py` copies every file under app/static to
+app/static/build/ with a content hash in its name (css/main.css ->
+css/main.1a2b3c4d5e.css), writes .gz (and .br, when the brotli package is
+installed) next to the compressible ones and records the mapping in
+build/manifest.json.
+
+Templates reference files with {{ static_url('css/main.css') }}: the hashed
+name when the manifest has one, the plain /static path otherwise (no build
+in development). Hashed files never change, so they are served with a one-year
+immutable Cache-Control and, when the client accepts it, the precompressed
+variant; everything else is revalidated through StaticFiles' ETag.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+from pathlib import Path
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.staticfiles import StaticFiles
+
+from .compression import accepted_encodings, brotli
+
+STATIC_DIR = Path(os.getenv("STATIC_DIR", "app/static"))
+BUILD_DIR = "build"
+MANIFEST = "manifest.json"
+URL_PREFIX = "/static/"
+HASH_LENGTH = 10
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+COMPRESSIBLE = {".css", ".js", ".svg", ".json", ".txt", ".html", ".map", ".xml"}
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))   # preference order
+
+
+# ---------------------------------------------------------------
+# Build
+# ---------------------------------------------------------------
+def fingerprint(relative: str, data: bytes) -> str:
+    digest = hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+    path = Path(relative)
+    return str(path.with_name(f"{path.stem}.{digest}{path.suffix}").as_posix())
+
+
+def build(static_dir: Path = STATIC_DIR) -> dict:
+    """Rebuild static_dir/build from the sources; returns {source path: hashed path}."""
+    out = static_dir / BUILD_DIR
+    if out.exists():
+        shutil.rmtree(out)
+
+    manifest = {}
+    for src in sorted(static_dir.rglob("*")):
+        if not src.is_file() or out in src.parents:
+            continue
+        relative = src.relative_to(static_dir).as_posix()
+        data = src.read_bytes()
+        hashed = fingerprint(relative, data)
+        target = out / hashed
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_bytes(data)
+        if src.suffix in COMPRESSIBLE:
+            # mtime=0 keeps the .gz byte-identical between builds
+            target.with_name(target.name + ".gz").write_bytes(gzip.compress(data, 9, mtime=0))
+            if brotli is not None:
+                target.with_name(target.name + ".br").write_bytes(brotli.compress(data, quality=11))
+        manifest[relative] = f"{BUILD_DIR}/{hashed}"
+
+    (out / MANIFEST).write_text(json.dumps(manifest, indent=2, sort_keys=True))
+    return manifest
+
+
+# ---------------------------------------------------------------
+# Runtime
+# ---------------------------------------------------------------
+def load_manifest(static_dir: Path = STATIC_DIR) -> dict:
+    try:
+        return json.loads((static_dir / BUILD_DIR / MANIFEST).read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+_manifest = load_manifest()
+
+
+def static_url(path: str) -> str:
+    """URL of a static file, fingerprinted when the build has it."""
+    path = path.lstrip("/")
+    return URL_PREFIX + _manifest.get(path, path)
+
+
+class StaticAssets(StaticFiles):
+    """StaticFiles with immutable caching and precompressed variants for fingerprinted files."""
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        path = scope.get("path", "")
+        immutable = f"/{BUILD_DIR}/" in path
+        response = None
+
+        if immutable and status_code == 200:
+            accepted = accepted_encodings(Headers(scope=scope).get("accept-encoding", ""))
+            for encoding, suffix in ENCODINGS:
+                variant = f"{full_path}{suffix}"
+                if encoding in accepted and os.path.isfile(variant):
+                    response = FileResponse(
+                        variant,
+                        media_type=mimetypes.guess_type(str(full_path))[0] or "text/plain",
+                        headers={"Content-Encoding": encoding},
+                    )
+                    break
+
+        if response is None:
+            response = super().file_response(full_path, stat_result, scope, status_code)
+        response.headers["Cache-Control"] = IMMUTABLE if immutable else REVALIDATE
+        if immutable:
+            response.headers["Vary"] = "Accept-Encoding"
+        return response
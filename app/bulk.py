@@ -0,0 +1,67 @@
+# app/bulk.py
+"""
+Dialect-aware bulk upserts.
+
+Postgres and SQLite get INSERT ... ON CONFLICT, MySQL gets
+INSERT ... ON DUPLICATE KEY UPDATE. Each call is one executemany round trip.
+"""
+from sqlalchemy import Table, and_, select, update as sa_update
+from sqlalchemy.orm import Session
+
+
+def upsert(
+    db: Session,
+    table: Table,
+    rows: list[dict],
+    keys: list[str],
+    update: list[str] = (),
+    increment: list[str] = (),
+) -> None:
+    """
+    Insert `rows` into `table`. When a row collides on `keys`:
+    - columns in `update` are overwritten with the new value
+    - columns in `increment` have the new value added to the stored one
+    - with neither, the existing row is left alone
+    """
+    if not rows:
+        return
+
+    dialect = db.get_bind().dialect.name
+
+    if dialect in ("postgresql", "sqlite"):
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(table)
+        set_ = {c: stmt.excluded[c] for c in update}
+        set_.update({c: table.c[c] + stmt.excluded[c] for c in increment})
+        if set_:
+            stmt = stmt.on_conflict_do_update(index_elements=keys, set_=set_)
+        else:
+            stmt = stmt.on_conflict_do_nothing(index_elements=keys)
+        db.execute(stmt, rows)
+        return
+
+    if dialect == "mysql":
+        from sqlalchemy.dialects.mysql import insert
+        stmt = insert(table)
+        set_ = {c: stmt.inserted[c] for c in update}
+        set_.update({c: table.c[c] + stmt.inserted[c] for c in increment})
+        if not set_:
+            # no-op update so duplicates are skipped instead of raising
+            set_ = {keys[0]: table.c[keys[0]]}
+        db.execute(stmt.on_duplicate_key_update(**set_), rows)
+        return
+
+    # Anything else: per-row fallback
+    for row in rows:
+        match = and_(*(table.c[k] == row[k] for k in keys))
+        exists = db.execute(select(*(table.c[k] for k in keys)).where(match)).first()
+        if exists is None:
+            db.execute(table.insert().values(**row))
+            continue
+        values = {c: row[c] for c in update}
+        values.update({c: table.c[c] + row[c] for c in increment})
+        if values:
+            db.execute(sa_update(table).where(match).values(**values))
@@ -0,0 +1,121 @@
+# app/compression.py
+"""
+Compression of large, complete response bodies.
+
+CompressionMiddleware looks at the first body message of each response: when
+it is the whole body (no more_body), at least COMPRESS_MIN_BYTES long, of a
+compressible type, not already encoded and not a byte range (206 /
+Content-Range), it is sent as br (if the brotli
+package is installed and accepted) or gzip. Streaming responses (exports,
+NDJSON, file downloads) announce more_body on their first chunk and pass
+through untouched, as do small bodies, 304s and excluded path prefixes.
+"""
+import gzip
+import importlib
+import os
+
+from starlette.datastructures import Headers, MutableHeaders
+
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+COMPRESS_LEVEL = int(os.getenv("COMPRESS_LEVEL", "6"))           # gzip 1-9
+BROTLI_QUALITY = int(os.getenv("COMPRESS_BROTLI_QUALITY", "4"))  # 0-11
+
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+    "text/",
+)
+
+try:
+    brotli = importlib.import_module("brotli")
+except ImportError:
+    brotli = None
+
+
+def accepted_encodings(header: str) -> set:
+    """Content codings an Accept-Encoding header allows (q=0 excluded)."""
+    accepted = set()
+    for part in header.split(","):
+        name, *params = [p.strip() for p in part.split(";")]
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        if name and q > 0:
+            accepted.add(name.lower())
+    return accepted
+
+
+def _compressible(status: int, headers: Headers) -> bool:
+    # a range is a slice of the identity-encoded body; compressing it breaks resuming
+    if status == 206 or "content-encoding" in headers or "content-range" in headers:
+        return False
+    content_type = headers.get("content-type", "")
+    return content_type.startswith(COMPRESSIBLE_TYPES) and "text/event-stream" not in content_type
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, COMPRESS_LEVEL, mtime=0)
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = COMPRESS_MIN_BYTES, exclude_prefixes=("/static",)):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.exclude_prefixes = tuple(exclude_prefixes)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(self.exclude_prefixes):
+            await self.app(scope, receive, send)
+            return
+
+        accepted = accepted_encodings(Headers(scope=scope).get("accept-encoding", ""))
+        if "br" in accepted and brotli is not None:
+            encoding = "br"
+        elif "gzip" in accepted:
+            encoding = "gzip"
+        else:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        passthrough = False
+
+        async def wrapped_send(message):
+            nonlocal start, passthrough
+            if message["type"] == "http.response.start":
+                start = message            # held until the first body message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            if start is not None:
+                headers = MutableHeaders(raw=start["headers"])
+                if (
+                    not message.get("more_body", False)
+                    and len(body) >= self.minimum_size
+                    and _compressible(start["status"], headers)
+                ):
+                    body = compress(body, encoding)
+                    headers["Content-Encoding"] = encoding
+                    headers["Content-Length"] = str(len(body))
+                    headers.add_vary_header("Accept-Encoding")
+                    message = {**message, "body": body}
+                else:
+                    passthrough = True
+                await send(start)
+                start = None
+            await send(message)
+
+        await self.app(scope, receive, wrapped_send)
+        if start is not None:              # response without a body message
+            await send(start)
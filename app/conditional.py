@@ -0,0 +1,147 @@
+# app/conditional.py
+"""
+Conditional GETs for read endpoints whose payload only changes with a data version.
+
+The ETag is built from the data_version counters a payload depends on (the
+org's counter for activity-derived data, 'factors' for the factor list) and
+Last-Modified from their updated_at. A request whose If-None-Match (or, without
+one, If-Modified-Since) still matches gets an empty 304; otherwise the encoded
+JSON body is served from an LRU keyed by (endpoint, versions, params), so a
+repeat view after another user's refresh costs one primary-key lookup.
+
+The versions are read before the payload is built, so a cached body is never
+older than the ETag it is stored under.
+"""
+import json
+import os
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import NamedTuple
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from .cache import TTLCache
+from .versions import TABLE
+
+PAYLOAD_CACHE_SIZE = int(os.getenv("PAYLOAD_CACHE_SIZE", "2000"))
+PAYLOAD_CACHE_TTL_SECONDS = float(os.getenv("PAYLOAD_CACHE_TTL_SECONDS", "600"))
+
+_payloads = TTLCache(PAYLOAD_CACHE_SIZE, PAYLOAD_CACHE_TTL_SECONDS)
+
+
+class Stamp(NamedTuple):
+    etag: str
+    last_modified: datetime | None
+
+
+def _stamp_stmt(keys):
+    return select(TABLE.c.key, TABLE.c.version, TABLE.c.updated_at).where(TABLE.c.key.in_(keys))
+
+
+def _make_stamp(keys, rows) -> Stamp:
+    found = {key: (version, updated) for key, version, updated in rows}
+    tag = ".".join(f"{key}={found.get(key, (0, None))[0]}" for key in keys)
+    stamps = [updated for _, updated in found.values() if updated is not None]
+    return Stamp(f'W/"{tag}"', max(stamps) if stamps else None)
+
+
+def stamp(db: Session, keys) -> Stamp:
+    return _make_stamp(keys, db.execute(_stamp_stmt(keys)).all())
+
+
+async def stamp_async(db: AsyncSession, keys) -> Stamp:
+    return _make_stamp(keys, (await db.execute(_stamp_stmt(keys))).all())
+
+
+# ---------------------------------------------------------------
+# Headers
+# ---------------------------------------------------------------
+def _http_date(value: datetime) -> str:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)   # data_version stores UTC
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+
+def _headers(st: Stamp) -> dict:
+    headers = {"ETag": st.etag, "Cache-Control": "private, no-cache"}
+    if st.last_modified is not None:
+        headers["Last-Modified"] = _http_date(st.last_modified)
+    return headers
+
+
+def _opaque(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def is_fresh(request: Request, st: Stamp) -> bool:
+    """True when the client's cached copy still matches (If-None-Match wins over If-Modified-Since)."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        current = _opaque(st.etag)
+        return any(_opaque(tag) == current for tag in if_none_match.split(","))
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and st.last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        modified = st.last_modified
+        if modified.tzinfo is None:
+            modified = modified.replace(tzinfo=timezone.utc)
+        return modified.replace(microsecond=0) <= since
+    return False
+
+
+# ---------------------------------------------------------------
+# Responses
+# ---------------------------------------------------------------
+def _encode(payload) -> bytes:
+    return json.dumps(
+        jsonable_encoder(payload), ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def not_modified(st: Stamp) -> Response:
+    return Response(status_code=304, headers=_headers(st))
+
+
+def _ok(body: bytes, st: Stamp) -> Response:
+    return Response(body, media_type="application/json", headers=_headers(st))
+
+
+def cached_json(request: Request, db: Session, name: str, keys, params, build) -> Response:
+    """Serve build() as JSON with ETag/Last-Modified, a 304 or a cached body."""
+    st = stamp(db, keys)
+    if is_fresh(request, st):
+        return not_modified(st)
+    key = (name, st.etag, params)
+    body = _payloads.get(key)
+    if body is None:
+        body = _encode(build())
+        _payloads.set(key, body)
+    return _ok(body, st)
+
+
+async def cached_json_async(request: Request, db: AsyncSession, name: str, keys, params, build) -> Response:
+    """cached_json for async routes; build is a coroutine function."""
+    st = await stamp_async(db, keys)
+    if is_fresh(request, st):
+        return not_modified(st)
+    key = (name, st.etag, params)
+    body = _payloads.get(key)
+    if body is None:
+        body = _encode(await build())
+        _payloads.set(key, body)
+    return _ok(body, st)
+
+
+def clear() -> None:
+    _payloads.clear()
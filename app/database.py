@@ -1,37 +1,196 @@
 # app/database.py
-import os
-from pathlib import Path
-
-from dotenv import load_dotenv, find_dotenv
-from sqlalchemy import create_engine, text
-from sqlalchemy.engine import make_url
-from sqlalchemy.orm import sessionmaker, declarative_base
-
-# 1) Load .env first
-load_dotenv(find_dotenv())
-
-DATABASE_URL = os.getenv("DATABASE_URL")
-if not DATABASE_URL:
-    raise RuntimeError(
-        "DATABASE_URL is not set. Put it in a .env file at project root or set it in the environment."
-    )
-
-# 2) Ensure the database exists (create if missing)
-url = make_url(DATABASE_URL)
-
-# Single engine, using whatever DATABASE_URL points to (Render Postgres in production)
-engine = create_engine(
-    DATABASE_URL,
-    pool_pre_ping=True,
-    future=True,
-)
-
-SessionLocal = sessionmaker(
-    bind=engine,
-    autoflush=False,
-    autocommit=False,
-    future=True,
-)
+"""
+Engines and sessions.
+
+Nothing is read or connected at import: the engine is built from
+app.settings the first time something asks for a session (get_engine), so
+importing models and routers stays cheap and the app factory can install its
+own Settings first. The app's startup warms the pool (warm_pool) so the first
+requests don't pay for connecting.
+"""
+import threading
+import time
+from collections import deque
+
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.engine import Engine, URL, make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
+
+from .settings import Settings, get_settings
+
+# ---------------------------------------------------------------
+# Connection pool
+# ---------------------------------------------------------------
+# Sizing comes from the settings (DB_POOL_* in the environment) so several
+# uvicorn workers can share one Postgres without exceeding its connection
+# limit. Instead of pinging on every checkout, a connection is only pinged
+# when it sat idle for longer than DB_POOL_PING_IDLE_SECONDS;
+# DB_POOL_FAIL_FAST=1 makes an exhausted pool raise at once (the app answers
+# 503) instead of waiting DB_POOL_TIMEOUT seconds.
+# asyncio's wait_for(timeout=0) never yields to the queue, so "fail fast" is a
+# very short wait rather than zero
+FAIL_FAST_TIMEOUT = 0.05
+
+
+class PoolStats:
+    """Checkout wait times and liveness counters for one pool."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total_ms = 0.0
+        self.wait_max_ms = 0.0
+        self.recent_waits_ms = deque(maxlen=1000)
+        self.pings = 0
+        self.stale_connections = 0
+
+    def record_wait(self, ms: float, timed_out: bool) -> None:
+        with self.lock:
+            if timed_out:
+                self.timeouts += 1
+                return
+            self.checkouts += 1
+            self.wait_total_ms += ms
+            self.wait_max_ms = max(self.wait_max_ms, ms)
+            self.recent_waits_ms.append(ms)
+
+    def snapshot(self, pool, max_overflow: int) -> dict:
+        with self.lock:
+            recent = sorted(self.recent_waits_ms)
+            data = {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_ms_avg": round(self.wait_total_ms / self.checkouts, 3) if self.checkouts else None,
+                "wait_ms_p95": round(recent[int(0.95 * (len(recent) - 1))], 3) if recent else None,
+                "wait_ms_max": round(self.wait_max_ms, 3),
+                "idle_pings": self.pings,
+                "stale_connections": self.stale_connections,
+            }
+        if hasattr(pool, "checkedout"):
+            data.update({
+                "size": pool.size(),
+                "in_use": pool.checkedout(),
+                "idle": pool.checkedin(),
+                "overflow": max(pool.overflow(), 0),
+                "max_overflow": max_overflow,
+            })
+        return data
+
+
+class _TimedCheckout:
+    """Mixin measuring how long a caller waited for a pooled connection."""
+
+    stats: PoolStats
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except exc.TimeoutError:
+            self.stats.record_wait(0, timed_out=True)
+            raise
+        self.stats.record_wait((time.perf_counter() - started) * 1000, timed_out=False)
+        return conn
+
+
+# stats live on the class so they survive pool.recreate()
+class InstrumentedQueuePool(_TimedCheckout, QueuePool):
+    stats = PoolStats()
+
+
+class InstrumentedAsyncQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    stats = PoolStats()
+
+
+def _pool_options(pool_class, url: URL, settings: Settings) -> dict:
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        return {}  # in-memory SQLite must keep its single shared connection
+    return {
+        "poolclass": pool_class,
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_recycle": settings.db_pool_recycle,
+        "pool_timeout": FAIL_FAST_TIMEOUT if settings.db_pool_fail_fast else settings.db_pool_timeout,
+    }
+
+
+def instrument_pool(pool, stats: PoolStats, ping_idle_seconds: float) -> None:
+
+    @event.listens_for(pool, "connect")
+    def _on_connect(dbapi_conn, record):
+        record.info["last_used"] = time.monotonic()
+
+    @event.listens_for(pool, "checkin")
+    def _on_checkin(dbapi_conn, record):
+        if record is not None:
+            record.info["last_used"] = time.monotonic()
+
+    @event.listens_for(pool, "checkout")
+    def _on_checkout(dbapi_conn, record, proxy):
+        idle = time.monotonic() - record.info.get("last_used", 0)
+        if idle < ping_idle_seconds:
+            return
+        with stats.lock:
+            stats.pings += 1
+        try:
+            cursor = dbapi_conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.close()
+        except Exception:
+            with stats.lock:
+                stats.stale_connections += 1
+            # the pool discards this connection and retries with a fresh one
+            raise exc.DisconnectionError()
+
+
+# ---------------------------------------------------------------
+# Sync engine (built on first use)
+# ---------------------------------------------------------------
+_engine = None
+_sessionmaker = None
+_engine_lock = threading.Lock()
+
+
+def database_url() -> URL:
+    settings = get_settings()
+    if not settings.database_url:
+        raise RuntimeError(
+            "DATABASE_URL is not set. Put it in a .env file at project root or set it in the environment."
+        )
+    return make_url(settings.database_url)
+
+
+def get_engine() -> Engine:
+    """The process-wide engine, using whatever DATABASE_URL points to (Render Postgres in production)."""
+    global _engine, _sessionmaker
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                settings = get_settings()
+                url = database_url()
+                engine = create_engine(
+                    url,
+                    future=True,
+                    **_pool_options(InstrumentedQueuePool, url, settings),
+                )
+                instrument_pool(engine.pool, InstrumentedQueuePool.stats, settings.db_pool_ping_idle_seconds)
+                _sessionmaker = sessionmaker(
+                    bind=engine,
+                    autoflush=False,
+                    autocommit=False,
+                    future=True,
+                )
+                _engine = engine
+    return _engine
+
+
+def SessionLocal() -> Session:
+    """A new Session on the engine (named after the sessionmaker it used to be)."""
+    get_engine()
+    return _sessionmaker()
+
 
 Base = declarative_base()
 
@@ -41,4 +200,124 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+# ---------------------------------------------------------------
+# Optional async path (read-heavy endpoints)
+# ---------------------------------------------------------------
+# The async engine is built on first use too, so deployments that never hit an
+# async route don't need the async driver installed. ASYNC_DATABASE_URL
+# overrides the URL derived from DATABASE_URL.
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+    "mysql": "mysql+aiomysql",
+}
+
+_async_engine = None
+AsyncSessionLocal = None
+
+
+def async_database_url() -> URL:
+    override = get_settings().async_database_url
+    if override:
+        return make_url(override)
+
+    url = database_url()
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise RuntimeError(f"No async driver configured for '{backend}'; set ASYNC_DATABASE_URL.")
+
+    async_url = url.set(drivername=ASYNC_DRIVERS[backend])
+    if backend == "postgresql" and "sslmode" in async_url.query:
+        # asyncpg spells libpq's sslmode as ssl
+        query = dict(async_url.query)
+        query["ssl"] = query.pop("sslmode")
+        async_url = async_url.set(query=query)
+    return async_url
+
+
+def get_async_engine():
+    global _async_engine, AsyncSessionLocal
+    if _async_engine is None:
+        with _engine_lock:
+            if _async_engine is None:
+                from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+                settings = get_settings()
+                url = async_database_url()
+                engine = create_async_engine(
+                    url,
+                    **_pool_options(InstrumentedAsyncQueuePool, url, settings),
+                )
+                instrument_pool(
+                    engine.sync_engine.pool, InstrumentedAsyncQueuePool.stats, settings.db_pool_ping_idle_seconds
+                )
+                AsyncSessionLocal = async_sessionmaker(
+                    bind=engine,
+                    autoflush=False,
+                    expire_on_commit=False,
+                )
+                _async_engine = engine
+    return _async_engine
+
+
+def async_session():
+    get_async_engine()
+    return AsyncSessionLocal()
+
+
+async def get_async_db():
+    async with async_session() as db:
+        yield db
+
+
+# ---------------------------------------------------------------
+# Lifecycle
+# ---------------------------------------------------------------
+def warm_pool(count: int) -> None:
+    """Open `count` pooled connections now rather than on the first requests."""
+    engine = get_engine()
+    conns = []
+    try:
+        for _ in range(count):
+            conn = engine.connect()
+            conns.append(conn)
+            conn.exec_driver_sql("SELECT 1")
+    finally:
+        for conn in conns:
+            conn.close()
+
+
+async def warm_async_pool(count: int) -> None:
+    engine = get_async_engine()
+    conns = []
+    try:
+        for _ in range(count):
+            conn = await engine.connect()
+            conns.append(conn)
+            await conn.exec_driver_sql("SELECT 1")
+    finally:
+        for conn in conns:
+            await conn.close()
+
+
+async def dispose() -> None:
+    """Close every pooled connection and drop the engines (rebuilt on next use)."""
+    global _engine, _sessionmaker, _async_engine, AsyncSessionLocal
+    with _engine_lock:
+        engine, async_engine = _engine, _async_engine
+        _engine = _sessionmaker = _async_engine = AsyncSessionLocal = None
+    if async_engine is not None:
+        await async_engine.dispose()
+    if engine is not None:
+        engine.dispose()
+
+
+def pool_metrics() -> dict:
+    max_overflow = get_settings().db_max_overflow
+    data = {"sync": InstrumentedQueuePool.stats.snapshot(_engine.pool if _engine else None, max_overflow)}
+    if _async_engine is not None:
+        data["async"] = InstrumentedAsyncQueuePool.stats.snapshot(_async_engine.sync_engine.pool, max_overflow)
+    return data
@@ -0,0 +1,304 @@
+# app/exports.py
+"""
+Streaming writers for /api/exports.
+
+Rows arrive as an iterator of batches (lists of tuples, straight from a
+server-side cursor) and leave as an iterator of bytes, so memory stays flat
+however many rows an org has:
+
+  csv      one encoded chunk per batch
+  parquet  one row group per ROW_GROUP_SIZE rows, emitted as soon as written
+  xlsx     SpreadsheetML written into a streamed zip (stdlib only), one
+           compressed chunk per batch; a new sheet every XLSX_MAX_ROWS rows
+
+pyarrow is optional; require() raises ExportUnavailable when it is not
+installed.
+"""
+import csv
+import importlib
+import io
+import re
+import zipfile
+from datetime import date, datetime
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+ROW_GROUP_SIZE = 20_000
+XLSX_MAX_ROWS = 1_048_576          # per sheet, header included
+
+FORMATS = {
+    "csv": ("text/csv; charset=utf-8", None),
+    "xlsx": ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", None),
+    "parquet": ("application/vnd.apache.parquet", "pyarrow"),
+}
+
+
+class ExportUnavailable(RuntimeError):
+    """The optional library behind an export format is not installed."""
+
+
+def require(fmt: str) -> None:
+    module = FORMATS[fmt][1]
+    if module is None:
+        return
+    try:
+        importlib.import_module(module)
+    except ImportError:
+        raise ExportUnavailable(f"{fmt} export needs the '{module}' package")
+
+
+def media_type(fmt: str) -> str:
+    return FORMATS[fmt][0]
+
+
+# ---------------------------------------------------------------
+# CSV
+# ---------------------------------------------------------------
+def _csv_value(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return "" if value is None else value
+
+
+def iter_csv(columns, batches):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow([name for name, _ in columns])
+    for batch in batches:
+        writer.writerows([_csv_value(v) for v in row] for row in batch)
+        yield buf.getvalue().encode("utf-8")
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode("utf-8")
+
+
+# ---------------------------------------------------------------
+# Parquet
+# ---------------------------------------------------------------
+class _Sink:
+    """Write-only file object whose bytes the generator drains after each chunk."""
+
+    def __init__(self):
+        self.parts = []
+        self.pos = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        self.parts.append(bytes(data))
+        self.pos += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.pos
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self.parts)
+        self.parts.clear()
+        return data
+
+
+def _arrow_type(pa, kind: str):
+    return {
+        "int": pa.int64(),
+        "float": pa.float64(),
+        "str": pa.string(),
+        "date": pa.date32(),
+    }[kind]
+
+
+def _arrow_column(kind: str, values: list) -> list:
+    # aggregates (SUM of an integer column included) come back as Decimal on MySQL
+    if kind == "float":
+        return [None if v is None else float(v) for v in values]
+    if kind == "int":
+        return [None if v is None else int(v) for v in values]
+    return values
+
+
+def iter_parquet(columns, batches):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(name, _arrow_type(pa, kind)) for name, kind in columns])
+    sink = _Sink()
+    writer = pq.ParquetWriter(sink, schema, compression="snappy")
+    pending = []
+
+    def row_group(rows) -> bytes:
+        cols = list(zip(*rows))
+        writer.write_table(pa.table(
+            [pa.array(_arrow_column(kind, list(values)), type=field.type)
+             for (_, kind), field, values in zip(columns, schema, cols)],
+            schema=schema,
+        ))
+        return sink.drain()
+
+    try:
+        for batch in batches:
+            pending.extend(batch)
+            while len(pending) >= ROW_GROUP_SIZE:
+                yield row_group(pending[:ROW_GROUP_SIZE])
+                del pending[:ROW_GROUP_SIZE]
+        if pending:
+            yield row_group(pending)
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+# ---------------------------------------------------------------
+# XLSX
+# ---------------------------------------------------------------
+# Minimal SpreadsheetML written straight into a streamed zip: one sheet part
+# per XLSX_MAX_ROWS rows, inline strings, dates as serials with a date style.
+_EXCEL_EPOCH = date(1899, 12, 30)
+_XML_INVALID = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+_REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_PKG_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+
+_STYLES = (
+    f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<styleSheet xmlns="{_NS}">'
+    '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="14" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/></cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    "</styleSheet>"
+)
+
+
+def _col_letter(index: int) -> str:
+    letters = ""
+    index += 1
+    while index:
+        index, rem = divmod(index - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+
+def _xlsx_cell(ref: str, value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return f'<c r="{ref}" t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float, Decimal)):
+        return f'<c r="{ref}"><v>{value}</v></c>'
+    if isinstance(value, datetime):
+        value = value.date()
+    if isinstance(value, date):
+        return f'<c r="{ref}" s="1"><v>{(value - _EXCEL_EPOCH).days}</v></c>'
+    text = escape(_XML_INVALID.sub("", str(value)))
+    return f'<c r="{ref}" t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _xlsx_row(number: int, letters, values) -> str:
+    cells = "".join(_xlsx_cell(f"{col}{number}", v) for col, v in zip(letters, values))
+    return f'<row r="{number}">{cells}</row>'
+
+
+def _workbook_parts(names: list[str]) -> dict:
+    sheets = "".join(
+        f'<sheet name="{escape(n)}" sheetId="{i}" r:id="rId{i}"/>' for i, n in enumerate(names, 1)
+    )
+    sheet_rels = "".join(
+        f'<Relationship Id="rId{i}" Type="{_REL_NS}/worksheet" Target="worksheets/sheet{i}.xml"/>'
+        for i in range(1, len(names) + 1)
+    )
+    overrides = "".join(
+        f'<Override PartName="/xl/worksheets/sheet{i}.xml" ContentType="application/'
+        'vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        for i in range(1, len(names) + 1)
+    )
+    head = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    return {
+        "xl/workbook.xml": f'{head}<workbook xmlns="{_NS}" xmlns:r="{_REL_NS}"><sheets>{sheets}</sheets></workbook>',
+        "xl/_rels/workbook.xml.rels": (
+            f'{head}<Relationships xmlns="{_PKG_REL_NS}">{sheet_rels}'
+            f'<Relationship Id="rId{len(names) + 1}" Type="{_REL_NS}/styles" Target="styles.xml"/>'
+            "</Relationships>"
+        ),
+        "xl/styles.xml": _STYLES,
+        "_rels/.rels": (
+            f'{head}<Relationships xmlns="{_PKG_REL_NS}">'
+            f'<Relationship Id="rId1" Type="{_REL_NS}/officeDocument" Target="xl/workbook.xml"/>'
+            "</Relationships>"
+        ),
+        "[Content_Types].xml": (
+            f'{head}<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" ContentType="application/'
+            'vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            '<Override PartName="/xl/styles.xml" ContentType="application/'
+            'vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+            f"{overrides}</Types>"
+        ),
+    }
+
+
+def iter_xlsx(columns, batches, title: str = "data"):
+    header = [name for name, _ in columns]
+    letters = [_col_letter(i) for i in range(len(columns))]
+    sink = _Sink()
+    zf = zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED, allowZip64=True)
+    names = []
+    part = None
+    row_number = XLSX_MAX_ROWS
+
+    def open_sheet():
+        names.append(f"{title}{len(names) + 1}" if names else title)
+        handle = zf.open(f"xl/worksheets/sheet{len(names)}.xml", "w", force_zip64=True)
+        handle.write(
+            f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            f'<worksheet xmlns="{_NS}"><sheetData>{_xlsx_row(1, letters, header)}'.encode("utf-8")
+        )
+        return handle
+
+    def close_sheet(handle):
+        handle.write(b"</sheetData></worksheet>")
+        handle.close()
+
+    try:
+        for batch in batches:
+            chunk = []
+            for row in batch:
+                if row_number >= XLSX_MAX_ROWS:
+                    if part is not None:
+                        part.write("".join(chunk).encode("utf-8"))
+                        chunk.clear()
+                        close_sheet(part)
+                    part = open_sheet()
+                    row_number = 1
+                row_number += 1
+                chunk.append(_xlsx_row(row_number, letters, row))
+            if chunk:
+                part.write("".join(chunk).encode("utf-8"))
+            yield sink.drain()
+        if part is None:
+            part = open_sheet()
+        close_sheet(part)
+        for name, xml in _workbook_parts(names).items():
+            zf.writestr(name, xml)
+    finally:
+        zf.close()
+    yield sink.drain()
+
+
+def iter_export(fmt: str, columns, batches, title: str = "data"):
+    """Bytes of `batches` in the requested format; call require(fmt) first."""
+    if fmt == "xlsx":
+        return iter_xlsx(columns, batches, title)
+    if fmt == "parquet":
+        return iter_parquet(columns, batches)
+    return iter_csv(columns, batches)
@@ -0,0 +1,278 @@
+# app/factor_import.py
+"""
+Bulk import of emission factor tables (eGRID subregions, DEFRA, GLEC...).
+
+The CSV is read row by row. Category names are folded onto the categories the
+resolver already knows ("Electric", "electricity", "ELEC_USE" -> Electricity)
+and units onto kgCO2e/<activity unit>, converting lb/g/t numerators and MWh
+denominators on the way. Each chunk goes in with one INSERT ... ON CONFLICT
+(ON DUPLICATE KEY on MySQL) keyed on (source, category, unit, year), so
+re-importing a table updates its values instead of adding copies.
+"""
+import csv
+import io
+import math
+import re
+import time
+from datetime import date
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from . import versions
+from .bulk import upsert
+from .models import EmissionFactor, Unit
+from .resolver import TYPE_CODE_TO_CATEGORY, resolver
+
+CHUNK_SIZE = 5000
+MAX_REPORTED_ERRORS = 1000
+MAX_FACTOR = 10 ** 8        # emission_factor.factor is NUMERIC(14, 6)
+
+KEY_COLUMNS = ["source", "category", "unit", "year"]
+
+# Logical field -> header names we accept (compared lower-cased, stripped)
+COLUMN_ALIASES = {
+    "category": ["category", "name", "fuel", "activity", "activity_type"],
+    "unit": ["unit", "units", "factor_unit"],
+    "factor": ["factor", "factor value", "factor_value", "value_per_unit", "value", "co2e"],
+    "source": ["source", "dataset", "publisher"],
+    "year": ["year", "factor_year", "data_year"],
+}
+REQUIRED_FIELDS = ("category", "unit", "factor")
+
+# Extra spellings for the resolver's categories, keyed by _fold()
+CATEGORY_ALIASES = {
+    "electric": "Electricity",
+    "grid": "Electricity",
+    "power": "Electricity",
+    "gas": "NaturalGas",
+    "ng": "NaturalGas",
+    "petrol": "Gasoline",
+    "gasoil": "Diesel",
+    "truck": "Freight_Truck",
+    "hgv": "Freight_Truck",
+    "ship": "Freight_Ship",
+    "shipping": "Freight_Ship",
+}
+
+# Emission numerator -> kgCO2e multiplier
+MASS_TO_KG = {
+    "kg": 1.0,
+    "g": 0.001,
+    "lb": 0.45359237,
+    "lbs": 0.45359237,
+    "t": 1000.0,
+    "tonne": 1000.0,
+    "tonnes": 1000.0,
+    "metricton": 1000.0,
+    "mt": 1000.0,
+}
+
+# Activity denominator -> (unit code, divisor applied to the factor)
+DENOMINATORS = {
+    "kwh": ("kWh", 1.0),
+    "mwh": ("kWh", 1000.0),
+    "gwh": ("kWh", 1_000_000.0),
+    "therm": ("therm", 1.0),
+    "therms": ("therm", 1.0),
+    "gal": ("gal", 1.0),
+    "gallon": ("gal", 1.0),
+    "gallons": ("gal", 1.0),
+    "usgal": ("gal", 1.0),
+    "l": ("L", 1.0),
+    "liter": ("L", 1.0),
+    "litre": ("L", 1.0),
+    "liters": ("L", 1.0),
+    "litres": ("L", 1.0),
+    "kg": ("kg", 1.0),
+    "tonmile": ("ton-mile", 1.0),
+    "tonmi": ("ton-mile", 1.0),
+    "km": ("km", 1.0),
+    "mi": ("mi", 1.0),
+    "mile": ("mi", 1.0),
+    "miles": ("mi", 1.0),
+}
+
+_GAS = re.compile(r"(co2e|co2eq|co2)$")
+
+
+class FactorImportError(ValueError):
+    """The file as a whole cannot be imported (empty, missing columns...)."""
+
+
+def _fold(text: str) -> str:
+    """Lower-case with everything but letters and digits removed."""
+    return re.sub(r"[^a-z0-9]", "", text.replace("₂", "2").lower())
+
+
+def resolve_columns(header: list[str]) -> dict:
+    """Return {logical field: column index}."""
+    normalized = [h.strip().lower() for h in header]
+    cols = {}
+    for field, aliases in COLUMN_ALIASES.items():
+        for name in aliases:
+            if name in normalized:
+                cols[field] = normalized.index(name)
+                break
+
+    missing = [f for f in REQUIRED_FIELDS if f not in cols]
+    if missing:
+        raise FactorImportError(f"Missing column(s): {', '.join(missing)}")
+    return cols
+
+
+class _Normalizer:
+    """Category and unit spellings known to this database, loaded once per import."""
+
+    def __init__(self, db: Session):
+        self.categories = {}
+        for category in TYPE_CODE_TO_CATEGORY.values():
+            self.categories[_fold(category)] = category
+        for code, category in TYPE_CODE_TO_CATEGORY.items():
+            self.categories[_fold(code)] = category
+        for t in resolver.activity_types(db).values():
+            self.categories.setdefault(_fold(t.code), t.category)
+            self.categories.setdefault(_fold(t.label), t.category)
+        for (category,) in db.execute(select(EmissionFactor.category).distinct()):
+            if category:
+                self.categories.setdefault(_fold(category), category)
+        for alias, category in CATEGORY_ALIASES.items():
+            self.categories.setdefault(alias, category)
+
+        self.denominators = dict(DENOMINATORS)
+        for (code,) in db.execute(select(Unit.code)):
+            self.denominators.setdefault(_fold(code), (code, 1.0))
+
+    def category(self, raw: str) -> str:
+        cleaned = " ".join(raw.split())
+        return self.categories.get(_fold(cleaned), cleaned)
+
+    def unit(self, raw: str) -> tuple[str, float]:
+        """('kgCO2e/<unit>', multiplier for the factor value)."""
+        numerator, slash, denominator = raw.partition("/")
+        if not slash:
+            # a bare activity unit ("kWh") means the value is already kgCO2e per unit
+            numerator, denominator = "kgCO2e", raw
+        if not denominator.strip():
+            raise ValueError(f"unrecognized unit '{raw}'")
+
+        mass = _GAS.sub("", _fold(numerator))
+        if mass not in MASS_TO_KG:
+            raise ValueError(f"unrecognized emission unit '{numerator.strip()}'")
+
+        code, divisor = self.denominators.get(_fold(denominator), (denominator.strip(), 1.0))
+        return f"kgCO2e/{code}", MASS_TO_KG[mass] / divisor
+
+
+def import_factors(db: Session, path: str, default_source: str | None = None) -> dict:
+    """
+    Upsert the emission factors in the CSV at `path`.
+
+    Rows without a source take `default_source`; rows without a year are
+    stamped with the current year so they still land on the upsert key.
+    Everything is committed in one transaction together with the FACTORS
+    version bump.
+    """
+    started = time.perf_counter()
+    normalizer = _Normalizer(db)
+    table = EmissionFactor.__table__
+    this_year = date.today().year
+
+    errors = []
+    error_count = 0
+    rows_read = 0
+    rows_imported = 0
+
+    def fail(line_no: int, message: str) -> None:
+        nonlocal error_count
+        error_count += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append({"row": line_no, "error": message})
+
+    # key -> row; a key may appear only once per INSERT ... ON CONFLICT statement
+    pending = {}
+
+    def flush() -> None:
+        nonlocal rows_imported
+        if pending:
+            upsert(db, table, list(pending.values()), KEY_COLUMNS, update=["factor"])
+            rows_imported += len(pending)
+            pending.clear()
+
+    with open(path, "rb") as raw, io.TextIOWrapper(raw, newline="", encoding="utf-8-sig") as fh:
+        reader = csv.reader(fh)
+        header = next(reader, None)
+        if not header:
+            raise FactorImportError("File is empty")
+        cols = resolve_columns(header)
+        width = max(cols.values()) + 1
+
+        for line_no, record in enumerate(reader, start=2):
+            if not any(cell.strip() for cell in record):
+                continue
+            rows_read += 1
+            if len(record) < width:
+                fail(line_no, "too few columns")
+                continue
+
+            category = normalizer.category(record[cols["category"]])
+            if not category:
+                fail(line_no, "category is empty")
+                continue
+
+            try:
+                unit, scale = normalizer.unit(record[cols["unit"]])
+            except ValueError as exc:
+                fail(line_no, str(exc))
+                continue
+
+            try:
+                value = float(record[cols["factor"]].replace(",", "")) * scale
+            except ValueError:
+                fail(line_no, "factor is not a number")
+                continue
+            if not math.isfinite(value) or abs(value) >= MAX_FACTOR:
+                fail(line_no, "factor out of range")
+                continue
+
+            source = record[cols["source"]].strip() if "source" in cols else ""
+            source = " ".join(source.split()) or default_source
+            if not source:
+                fail(line_no, "source is empty")
+                continue
+
+            year_raw = record[cols["year"]].strip() if "year" in cols else ""
+            try:
+                year = int(float(year_raw)) if year_raw else this_year
+            except ValueError:
+                fail(line_no, "year is not a number")
+                continue
+
+            row = {
+                "source": source[:128],
+                "category": category[:128],
+                "unit": unit[:64],
+                "factor": round(value, 6),
+                "year": year,
+            }
+            pending[(row["source"], row["category"], row["unit"], year)] = row
+            if len(pending) >= CHUNK_SIZE:
+                flush()
+
+        flush()
+
+    if rows_imported:
+        versions.bump(db, versions.FACTORS)
+    db.commit()
+    if rows_imported:
+        resolver.invalidate()
+
+    elapsed = time.perf_counter() - started
+    return {
+        "rows_read": rows_read,
+        "imported": rows_imported,
+        "error_count": error_count,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "rows_per_sec": round(rows_read / elapsed, 1) if elapsed > 0 else None,
+    }
@@ -0,0 +1,261 @@
+# app/forecasting.py
+"""
+Vectorized emission projections for ForecastScenario rows.
+
+The baseline of a scenario is its start year's emissions from emission_rollup,
+split into (category, scope) buckets. Every scenario of a request is evaluated
+at once as a (scenario x bucket x year) array:
+
+    projected = baseline * (1 + growth) ** t * (1 - renewable share if electricity)
+
+where growth is the scenario's annual_growth_pct, overridden per category by
+category_growth_pct, and the renewable share only displaces electricity.
+
+simulate() adds uncertainty: growth, renewable share and emission factors are
+sampled for thousands of paths at once and summarised as P10/P50/P90 bands.
+"""
+import os
+from collections import defaultdict
+from typing import NamedTuple
+
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .cache import TTLCache
+from .models import ActivityType, EmissionRollup
+from .resolver import category_for
+
+R = EmissionRollup.__table__
+
+ELECTRICITY = "Electricity"
+UNKNOWN_CATEGORY = "Other"
+
+# Default spreads of the stochastic mode
+GROWTH_SD_PCT = 1.0        # +/- percentage points of annual growth, per year
+RENEWABLE_SD_PCT = 5.0     # +/- percentage points of renewable share
+FACTOR_SD_PCT = 10.0       # relative spread of each category's emission factor
+MAX_PATHS = 100_000
+MAX_HORIZON_YEARS = 100
+# paths x buckets x years one simulation may evaluate
+MAX_SIMULATION_CELLS = int(os.getenv("FORECAST_MAX_SIMULATION_CELLS", str(50_000_000)))
+
+SIMULATION_CACHE_SIZE = int(os.getenv("FORECAST_CACHE_SIZE", "256"))
+SIMULATION_CACHE_TTL_SECONDS = float(os.getenv("FORECAST_CACHE_TTL_SECONDS", "600"))
+_simulations = TTLCache(SIMULATION_CACHE_SIZE, SIMULATION_CACHE_TTL_SECONDS)
+
+
+class SimulationTooLarge(ValueError):
+    """paths x buckets x years is over MAX_SIMULATION_CELLS."""
+
+
+class Buckets(NamedTuple):
+    categories: list[str]   # per bucket
+    scopes: np.ndarray      # (B,) int, 0 = unknown
+    base: np.ndarray        # (S, B) baseline kg per scenario
+
+
+# ---------------------------------------------------------------
+# Baselines
+# ---------------------------------------------------------------
+def baseline_stmt(org_id: int, years):
+    """co2e per (activity type, scope, year) for the given years."""
+    return (
+        select(
+            R.c.period_year,
+            R.c.scope,
+            ActivityType.code,
+            ActivityType.label,
+            func.coalesce(func.sum(R.c.co2e_kg), 0),
+        )
+        .select_from(R)
+        .outerjoin(ActivityType, ActivityType.activity_type_id == R.c.activity_type_id)
+        .where(R.c.org_id == org_id, R.c.period_year.in_(sorted(set(years))))
+        .group_by(R.c.period_year, R.c.scope, R.c.activity_type_id, ActivityType.code, ActivityType.label)
+    )
+
+
+class _TypeRow(NamedTuple):
+    code: str
+    label: str
+
+
+def shape_baselines(rows) -> dict:
+    """{year: {(category, scope): kg}} from baseline_stmt rows."""
+    out = defaultdict(lambda: defaultdict(float))
+    for year, scope, code, label, kg in rows:
+        category = category_for(_TypeRow(code, label)) if code else UNKNOWN_CATEGORY
+        out[year][(category, int(scope or 0))] += float(kg or 0)
+    return out
+
+
+async def load_baselines(db: AsyncSession, org_id: int, years) -> dict:
+    years = list(years)
+    if not years:
+        return {}
+    return shape_baselines((await db.execute(baseline_stmt(org_id, years))).all())
+
+
+# ---------------------------------------------------------------
+# Projection
+# ---------------------------------------------------------------
+def _pct(value) -> float:
+    return float(value or 0) / 100.0
+
+
+def build_buckets(scenarios, baselines: dict) -> Buckets:
+    keys = sorted({key for sc in scenarios for key in baselines.get(sc.start_year, {})})
+    base = np.zeros((len(scenarios), len(keys)))
+    for s, sc in enumerate(scenarios):
+        year_base = baselines.get(sc.start_year, {})
+        for b, key in enumerate(keys):
+            base[s, b] = year_base.get(key, 0.0)
+    return Buckets(
+        [k[0] for k in keys],
+        np.array([k[1] for k in keys], dtype=int),
+        base,
+    )
+
+
+def growth_matrix(scenarios, categories: list[str]) -> np.ndarray:
+    """(S, B) annual growth rate: the scenario default, overridden per category."""
+    rates = np.repeat(
+        np.array([_pct(sc.annual_growth_pct) for sc in scenarios])[:, None], len(categories), axis=1
+    )
+    lowered = np.array([c.lower() for c in categories])
+    for s, sc in enumerate(scenarios):
+        for category, pct in (sc.category_growth_pct or {}).items():
+            rates[s, lowered == str(category).lower()] = _pct(pct)
+    return rates
+
+
+def _one_hot(index: np.ndarray, width: int) -> np.ndarray:
+    out = np.zeros((len(index), width))
+    out[np.arange(len(index)), index] = 1.0
+    return out
+
+
+def project(scenarios, baselines: dict) -> list[dict]:
+    """Year-by-year projections of every scenario (same order as `scenarios`)."""
+    if not scenarios:
+        return []
+    buckets = build_buckets(scenarios, baselines)
+    horizons = np.array([max(sc.end_year - sc.start_year, 0) for sc in scenarios])
+    t = np.arange(horizons.max() + 1)
+
+    growth = growth_matrix(scenarios, buckets.categories)                       # (S, B)
+    is_elec = np.array([c == ELECTRICITY for c in buckets.categories])         # (B,)
+    renewable = np.array([_pct(sc.renewable_share_pct) for sc in scenarios])  # (S,)
+    keep = 1.0 - renewable[:, None] * is_elec[None, :]                         # (S, B)
+
+    # (S, B, T)
+    projected = (buckets.base * keep)[:, :, None] * (1.0 + growth)[:, :, None] ** t[None, None, :]
+
+    totals = projected.sum(axis=1)                                             # (S, T)
+    scope_ids, scope_of = np.unique(buckets.scopes, return_inverse=True)
+    cat_names, cat_of = np.unique(np.array(buckets.categories, dtype=object), return_inverse=True)
+    by_scope = np.einsum("sbt,bk->skt", projected, _one_hot(scope_of, len(scope_ids)))
+    by_category = np.einsum("sbt,bc->sct", projected, _one_hot(cat_of, len(cat_names)))
+
+    scope_labels = [str(sid) if sid else "unscoped" for sid in scope_ids]
+    out = []
+    for s, sc in enumerate(scenarios):
+        results = []
+        for i in range(horizons[s] + 1):
+            results.append({
+                "year": sc.start_year + i,
+                "projected_kg": float(totals[s, i]),
+                "by_scope": {label: float(by_scope[s, k, i]) for k, label in enumerate(scope_labels)},
+                "by_category": {name: float(by_category[s, c, i]) for c, name in enumerate(cat_names)},
+            })
+        out.append({
+            "scenario_id": sc.scenario_id,
+            "scenario": sc.name,
+            "start_year": sc.start_year,
+            "end_year": sc.end_year,
+            "baseline_kg": float(buckets.base[s].sum()),
+            "results": results,
+        })
+    return out
+
+
+async def project_scenarios(db: AsyncSession, org_id: int, scenarios) -> list[dict]:
+    baselines = await load_baselines(db, org_id, (sc.start_year for sc in scenarios))
+    return project(scenarios, baselines)
+
+
+# ---------------------------------------------------------------
+# Monte Carlo
+# ---------------------------------------------------------------
+class Spread(NamedTuple):
+    growth_sd_pct: float = GROWTH_SD_PCT
+    renewable_sd_pct: float = RENEWABLE_SD_PCT
+    factor_sd_pct: float = FACTOR_SD_PCT
+
+
+def _simulate(sc, baseline: dict, paths: int, seed: int, spread: Spread) -> list[dict]:
+    rng = np.random.default_rng(seed)
+    buckets = build_buckets([sc], {sc.start_year: baseline})
+    base = buckets.base[0]                                                     # (B,)
+    steps = max(sc.end_year - sc.start_year, 0)
+    cat_names, cat_of = np.unique(np.array(buckets.categories, dtype=object), return_inverse=True)
+    is_elec = np.array([c == ELECTRICITY for c in buckets.categories])
+
+    cells = paths * len(base) * (steps + 1)
+    if cells > MAX_SIMULATION_CELLS:
+        raise SimulationTooLarge(
+            f"{paths} paths x {len(base)} buckets x {steps + 1} years is over the "
+            f"{MAX_SIMULATION_CELLS} cell limit; use fewer paths"
+        )
+
+    # growth: category mean compounded per bucket, times one shock per path and
+    # year shared by every bucket, so neither needs a (P, B, T) array
+    mean_growth = growth_matrix([sc], buckets.categories)[0]                   # (B,)
+    trend = (1.0 + mean_growth)[:, None] ** np.arange(steps + 1)[None, :]      # (B, T)
+    shocks = rng.normal(0.0, _pct(spread.growth_sd_pct), size=(paths, steps))  # (P, T-1)
+    shocked = np.ones((paths, steps + 1))
+    if steps:
+        shocked[:, 1:] = np.cumprod(1.0 + shocks, axis=1)                      # (P, T)
+
+    # renewable share per path, clipped to [0, 1]
+    share = np.clip(
+        rng.normal(_pct(sc.renewable_share_pct), _pct(spread.renewable_sd_pct), size=paths), 0.0, 1.0
+    )
+    keep = 1.0 - share[:, None] * is_elec[None, :]                             # (P, B)
+
+    # emission factors: mean-one lognormal multiplier per path and category
+    sigma = _pct(spread.factor_sd_pct)
+    factors = rng.lognormal(-0.5 * sigma ** 2, sigma, size=(paths, len(cat_names)))[:, cat_of]
+
+    totals = np.einsum("pb,bt,pt->pt", base[None, :] * keep * factors, trend, shocked)  # (P, T)
+    p10, p50, p90 = np.percentile(totals, [10, 50, 90], axis=0)
+    mean = totals.mean(axis=0)
+    return [
+        {
+            "year": sc.start_year + i,
+            "p10": float(p10[i]),
+            "p50": float(p50[i]),
+            "p90": float(p90[i]),
+            "mean": float(mean[i]),
+        }
+        for i in range(steps + 1)
+    ]
+
+
+def simulate(sc, baseline: dict, paths: int = 10_000, seed: int = 0, spread: Spread = Spread()) -> list[dict]:
+    """
+    Percentile bands per year for one scenario. Results are cached per
+    scenario and seed; the key also covers the scenario's parameters and
+    baseline, so edits and new activity data never return stale bands.
+    """
+    key = (
+        sc.scenario_id, seed, paths, spread,
+        sc.start_year, sc.end_year, sc.annual_growth_pct, sc.renewable_share_pct,
+        tuple(sorted((sc.category_growth_pct or {}).items())),
+        tuple(sorted(baseline.items())),
+    )
+    bands = _simulations.get(key)
+    if bands is None:
+        bands = _simulate(sc, baseline, paths, seed, spread)
+        _simulations.set(key, bands)
+    return bands
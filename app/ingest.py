@@ -0,0 +1,283 @@
+# app/ingest.py
+"""
+Streaming CSV ingestion of activity data from UploadedFile records.
+
+The file is read row by row (never loaded whole), lookups are resolved once up
+front, emission factors once per (category, year), co2e is computed per chunk
+with NumPy and each chunk goes in with one multi-row INSERT (COPY on Postgres).
+"""
+import csv
+import io
+import os
+import time
+from datetime import date, datetime
+
+import numpy as np
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from . import rollup, versions
+from .models import ActivityLog, Facility, Unit
+from .resolver import resolver
+
+CHUNK_SIZE = 5000
+MAX_REPORTED_ERRORS = 1000
+MAX_QUANTITY = 10 ** 8     # activity_log.quantity is NUMERIC(14, 6)
+MAX_CO2E = 10 ** 12        # activity_log.co2e_kg is NUMERIC(18, 6)
+
+INGESTIBLE_PURPOSES = {"energy", "fuel", "shipping", "freight"}
+
+# Logical field -> header names we accept (compared lower-cased, stripped)
+COLUMN_ALIASES = {
+    "facility": ["facility", "facility_id", "facility_name", "site"],
+    "activity_type": ["activity_type", "activity_type_id", "activity_type_code", "type"],
+    "unit": ["unit", "unit_id", "unit_code", "units"],
+    "quantity": ["quantity", "qty", "amount", "usage", "value"],
+    "date": ["activity_date", "date", "period", "period_start"],
+}
+REQUIRED_FIELDS = ("facility", "activity_type", "quantity", "date")
+
+DATE_FORMATS = ("%Y-%m-%d", "%m/%d/%Y", "%Y/%m/%d")
+
+INSERT_COLUMNS = [
+    "org_id", "facility_id", "factor_id", "activity_type_id", "unit_id",
+    "quantity", "activity_date", "co2e_kg",
+]
+
+
+class IngestError(ValueError):
+    """The file as a whole cannot be ingested (bad header, unknown column...)."""
+
+
+def resolve_columns(header: list[str], mapping: dict | None = None) -> dict:
+    """Return {logical field: column index}, honoring an explicit header mapping."""
+    normalized = [h.strip().lower() for h in header]
+    cols = {}
+    for field, aliases in COLUMN_ALIASES.items():
+        wanted = [mapping[field].strip().lower()] if mapping and mapping.get(field) else aliases
+        for name in wanted:
+            if name in normalized:
+                cols[field] = normalized.index(name)
+                break
+
+    missing = [f for f in REQUIRED_FIELDS if f not in cols]
+    if missing:
+        raise IngestError(f"Missing column(s): {', '.join(missing)}")
+    return cols
+
+
+def _parse_date(raw: str) -> date:
+    try:
+        return date.fromisoformat(raw)
+    except ValueError:
+        pass
+    for fmt in DATE_FORMATS[1:]:
+        try:
+            return datetime.strptime(raw, fmt).date()
+        except ValueError:
+            continue
+    raise ValueError(f"unrecognized date '{raw}'")
+
+
+class _Lookups:
+    """Reference data for one org, loaded once per ingestion."""
+
+    def __init__(self, db: Session, org_id: int):
+        self.db = db
+
+        self.facilities = {}
+        for fac in db.query(Facility).filter(Facility.org_id == org_id).all():
+            self.facilities[str(fac.facility_id)] = fac.facility_id
+            if fac.name:
+                self.facilities[fac.name.strip().lower()] = fac.facility_id
+
+        # id / code / label -> TypeInfo
+        self.types = {}
+        for t in resolver.activity_types(db).values():
+            for key in (str(t.activity_type_id), t.code.lower(), t.label.lower()):
+                self.types[key] = t
+
+        self.units = {}
+        for u in db.query(Unit).all():
+            self.units[str(u.unit_id)] = u.unit_id
+            self.units[u.code.lower()] = u.unit_id
+
+        self._factors = {}
+
+    def factor(self, category: str, year: int):
+        """(factor_id, factor) for the newest factor not newer than `year`, else the newest one."""
+        key = (category, year)
+        if key not in self._factors:
+            f = resolver.factor(self.db, category, year)
+            self._factors[key] = (f.factor_id, float(f.factor)) if f else None
+        return self._factors[key]
+
+
+def _insert_chunk(db: Session, rows: list[tuple]) -> None:
+    dbapi_conn = db.connection().connection.driver_connection
+    if db.get_bind().dialect.name == "postgresql" and hasattr(dbapi_conn, "cursor"):
+        cur = dbapi_conn.cursor()
+        if hasattr(cur, "copy_expert"):
+            buf = io.StringIO()
+            csv.writer(buf).writerows(rows)
+            buf.seek(0)
+            cur.copy_expert(
+                f"COPY activity_log ({', '.join(INSERT_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+                buf,
+            )
+            return
+
+    db.execute(
+        insert(ActivityLog.__table__),
+        [dict(zip(INSERT_COLUMNS, r)) for r in rows],
+    )
+
+
+def ingest_csv(
+    db: Session,
+    path: str,
+    org_id: int,
+    mapping: dict | None = None,
+    on_progress=None,
+    skip_rows: int = 0,
+    prior_errors: dict | None = None,
+) -> dict:
+    """
+    Load activity rows from the CSV at `path` for `org_id`.
+
+    Each chunk is committed on its own. `on_progress(rows_read, rows_inserted,
+    fraction, errors)` is called inside every chunk's transaction, just before
+    its commit, so whatever it writes is stored together with the chunk;
+    `errors` is {"error_count", "errors"} for every row read so far.
+    `skip_rows` data rows are passed over (resuming an interrupted load) and
+    `prior_errors`, the `errors` stored with that checkpoint, carries the
+    skipped rows' errors into the report.
+    """
+    started = time.perf_counter()
+    lookups = _Lookups(db, org_id)
+
+    errors = list((prior_errors or {}).get("errors", []))[:MAX_REPORTED_ERRORS]
+    error_count = int((prior_errors or {}).get("error_count", 0))
+    rows_read = 0
+    rows_inserted = 0
+
+    def fail(line_no: int, message: str) -> None:
+        nonlocal error_count
+        error_count += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append({"row": line_no, "error": message})
+
+    # parsed rows of the current chunk, kept as parallel lists for NumPy
+    pending = []
+    quantities = []
+    factors = []
+
+    def flush() -> None:
+        nonlocal rows_inserted
+        if not pending:
+            return
+        co2e = np.round(np.asarray(quantities) * np.asarray(factors), 6)
+
+        rows = []
+        entries = []
+        for (line_no, fac_id, atype, unit_id, qty, day, factor_id), kg in zip(pending, co2e.tolist()):
+            if abs(kg) >= MAX_CO2E:
+                fail(line_no, "co2e out of range")
+                continue
+            rows.append((org_id, fac_id, factor_id, atype.activity_type_id, unit_id, qty, day, kg))
+            entries.append((
+                rollup.rollup_key(org_id, fac_id, atype.scope, atype.activity_type_id, day),
+                kg,
+                qty,
+            ))
+
+        if rows:
+            _insert_chunk(db, rows)
+            rollup.add_activities(db, entries)
+            versions.bump(db, versions.org_key(org_id))
+            rows_inserted += len(rows)
+        if on_progress:
+            on_progress(
+                rows_read, rows_inserted, raw.tell() / size if size else 1.0,
+                {"error_count": error_count, "errors": list(errors)},
+            )
+        db.commit()
+
+        pending.clear()
+        quantities.clear()
+        factors.clear()
+
+    size = os.path.getsize(path)
+    with open(path, "rb") as raw, io.TextIOWrapper(raw, newline="", encoding="utf-8-sig") as fh:
+        reader = csv.reader(fh)
+        header = next(reader, None)
+        if not header:
+            raise IngestError("File is empty")
+        cols = resolve_columns(header, mapping)
+        width = max(cols.values()) + 1
+
+        for line_no, record in enumerate(reader, start=2):
+            if not any(cell.strip() for cell in record):
+                continue
+            rows_read += 1
+            if rows_read <= skip_rows:
+                continue
+            if len(record) < width:
+                fail(line_no, "too few columns")
+                continue
+
+            fac_id = lookups.facilities.get(record[cols["facility"]].strip().lower())
+            if fac_id is None:
+                fail(line_no, "unknown facility")
+                continue
+
+            atype = lookups.types.get(record[cols["activity_type"]].strip().lower())
+            if atype is None:
+                fail(line_no, "unknown activity type")
+                continue
+
+            if "unit" in cols and record[cols["unit"]].strip():
+                unit_id = lookups.units.get(record[cols["unit"]].strip().lower())
+                if unit_id is None:
+                    fail(line_no, "unknown unit")
+                    continue
+            else:
+                unit_id = atype.default_unit_id
+
+            try:
+                qty = float(record[cols["quantity"]].replace(",", ""))
+            except ValueError:
+                fail(line_no, "quantity is not a number")
+                continue
+            if not np.isfinite(qty) or abs(qty) >= MAX_QUANTITY:
+                fail(line_no, "quantity out of range")
+                continue
+
+            try:
+                day = _parse_date(record[cols["date"]].strip())
+            except ValueError as exc:
+                fail(line_no, str(exc))
+                continue
+
+            factor = lookups.factor(atype.category, day.year)
+            if factor is None:
+                fail(line_no, "no emission factor exists for this activity type")
+                continue
+
+            pending.append((line_no, fac_id, atype, unit_id, round(qty, 6), day, factor[0]))
+            quantities.append(qty)
+            factors.append(factor[1])
+            if len(pending) >= CHUNK_SIZE:
+                flush()
+
+        flush()
+
+    elapsed = time.perf_counter() - started
+    return {
+        "rows_read": rows_read,
+        "rows_inserted": rows_inserted,
+        "error_count": error_count,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "rows_per_sec": round(rows_read / elapsed, 1) if elapsed > 0 else None,
+    }
@@ -0,0 +1,424 @@
+# app/jobs.py
+"""
+Background jobs kept in the app's own database (no broker).
+
+enqueue() inserts a row into `job`. Worker processes, started with
+`python -m app.jobs` (or by each web process when JOB_EMBEDDED_WORKERS is set;
+off by default, as every uvicorn/gunicorn worker would start its own), claim
+queued rows with an optimistic UPDATE ... WHERE status = 'queued', so any
+number of workers can compete on any backend. They run the handler registered
+for the job's kind and record the outcome.
+
+  progress   handlers call ctx.progress(fraction, message, checkpoint) inside
+             their own transaction, so a checkpoint is committed together with
+             the work it describes and a retry resumes from it
+  retries    a failed attempt is requeued with exponential backoff until
+             max_attempts; PermanentError fails the job at once
+  cancel     a queued job is cancelled directly; a running one is flagged and
+             stops at its next progress() call
+  crashes    while a job runs its worker refreshes heartbeat_at; running jobs
+             with a stale heartbeat are requeued by the next idle worker
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import signal
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from . import rollup
+from .ingest import IngestError, ingest_csv
+from .models import Job, UploadedFile
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = "queued", "running", "succeeded", "failed", "cancelled"
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# worker processes each web process starts alongside itself; opt-in, since the
+# default deployment runs `python -m app.jobs` next to the web processes
+JOB_EMBEDDED_WORKERS = int(os.getenv("JOB_EMBEDDED_WORKERS", "0"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1"))
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", "5"))
+JOB_STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", "60"))
+JOB_RETRY_BASE_SECONDS = float(os.getenv("JOB_RETRY_BASE_SECONDS", "5"))
+JOB_RETRY_MAX_SECONDS = float(os.getenv("JOB_RETRY_MAX_SECONDS", "600"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+CLAIM_BATCH = 10
+
+HANDLERS = {}
+
+
+class PermanentError(Exception):
+    """A failure that retrying cannot fix (bad input, missing file...)."""
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def handler(kind: str):
+    def register(fn):
+        HANDLERS[kind] = fn
+        return fn
+    return register
+
+
+def _now() -> datetime:
+    return datetime.utcnow()
+
+
+def backoff_seconds(attempt: int) -> float:
+    """Delay before retry number `attempt` (1-based): base * 2^(n-1), capped, +-20% jitter."""
+    delay = min(JOB_RETRY_BASE_SECONDS * 2 ** (attempt - 1), JOB_RETRY_MAX_SECONDS)
+    return delay * random.uniform(0.8, 1.2)
+
+
+# ---------------------------------------------------------------
+# API side
+# ---------------------------------------------------------------
+def enqueue(db: Session, kind: str, org_id: int, payload: dict | None = None,
+            user_id: int | None = None, max_attempts: int = JOB_MAX_ATTEMPTS) -> Job:
+    """Add a job to the session; it becomes visible to workers on commit."""
+    if kind not in HANDLERS:
+        raise ValueError(f"Unknown job kind '{kind}'")
+    job = Job(
+        org_id=org_id, user_id=user_id, kind=kind, payload=payload or {},
+        status=QUEUED, progress=0, attempts=0, max_attempts=max_attempts,
+        cancel_requested=False, run_after=_now(), created_at=_now(),
+    )
+    db.add(job)
+    return job
+
+
+def cancel(db: Session, job: Job) -> None:
+    """Cancel a queued job now, or ask a running one to stop."""
+    if job.status == QUEUED:
+        db.execute(
+            update(Job).where(Job.job_id == job.job_id, Job.status == QUEUED)
+            .values(status=CANCELLED, finished_at=_now(), message="Cancelled")
+        )
+    if job.status in (QUEUED, RUNNING):
+        db.execute(update(Job).where(Job.job_id == job.job_id).values(cancel_requested=True))
+
+
+def job_dict(job: Job) -> dict:
+    return {
+        "job_id": job.job_id,
+        "kind": job.kind,
+        "status": job.status,
+        "progress": float(job.progress or 0),
+        "message": job.message,
+        "result": job.result,
+        "error": job.error,
+        "attempts": job.attempts,
+        "max_attempts": job.max_attempts,
+        "cancel_requested": bool(job.cancel_requested),
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+        "run_after": job.run_after if job.status == QUEUED else None,
+    }
+
+
+# ---------------------------------------------------------------
+# Worker side
+# ---------------------------------------------------------------
+class JobContext:
+    """What a handler gets: its session, the job row's data and progress reporting."""
+
+    def __init__(self, db: Session, job: Job, cancelled: threading.Event):
+        self.db = db
+        self.job_id = job.job_id
+        self.org_id = job.org_id
+        self.user_id = job.user_id
+        self.checkpoint = job.checkpoint or {}
+        self.attempt = job.attempts
+        self._cancelled = cancelled
+
+    def progress(self, fraction: float | None = None, message: str | None = None,
+                 checkpoint: dict | None = None) -> None:
+        """Record progress in the handler's current transaction; raises JobCancelled when asked to stop."""
+        if self._cancelled.is_set():
+            raise JobCancelled()
+        values = {}
+        if fraction is not None:
+            values["progress"] = round(min(max(fraction, 0.0), 1.0), 4)
+        if message is not None:
+            values["message"] = message[:255]
+        if checkpoint is not None:
+            values["checkpoint"] = checkpoint
+            self.checkpoint = checkpoint
+        if values:
+            self.db.execute(update(Job).where(Job.job_id == self.job_id).values(**values))
+
+
+def requeue_stale(db: Session) -> int:
+    """Give jobs of crashed workers back to the queue (or fail them when out of attempts)."""
+    cutoff = _now() - timedelta(seconds=JOB_STALE_SECONDS)
+    stale = (Job.status == RUNNING) & (Job.heartbeat_at < cutoff)
+    failed = db.execute(
+        update(Job).where(stale, Job.attempts >= Job.max_attempts)
+        .values(status=FAILED, finished_at=_now(), worker=None, error="Worker stopped responding")
+    ).rowcount
+    requeued = db.execute(
+        update(Job).where(stale)
+        .values(status=QUEUED, run_after=_now(), worker=None, message="Requeued after a worker stopped")
+    ).rowcount
+    db.commit()
+    return failed + requeued
+
+
+def claim(db: Session, worker: str) -> Job | None:
+    now = _now()
+    candidates = db.scalars(
+        select(Job.job_id)
+        .where(Job.status == QUEUED, Job.run_after <= now)
+        .order_by(Job.run_after, Job.job_id)
+        .limit(CLAIM_BATCH)
+    ).all()
+    for job_id in candidates:
+        won = db.execute(
+            update(Job).where(Job.job_id == job_id, Job.status == QUEUED)
+            .values(status=RUNNING, worker=worker, attempts=Job.attempts + 1,
+                    started_at=now, heartbeat_at=now, error=None)
+        ).rowcount
+        db.commit()
+        if won:
+            return db.get(Job, job_id)
+    return None
+
+
+def _heartbeat(session_factory, job_id: int, worker: str, cancelled: threading.Event, done: threading.Event):
+    """Keep the claim alive and watch for cancellation, on a connection of its own."""
+    while not done.wait(JOB_HEARTBEAT_SECONDS):
+        db = session_factory()
+        try:
+            db.execute(
+                update(Job).where(Job.job_id == job_id, Job.worker == worker)
+                .values(heartbeat_at=_now())
+            )
+            db.commit()
+            if db.scalar(select(Job.cancel_requested).where(Job.job_id == job_id)):
+                cancelled.set()
+        except Exception:
+            db.rollback()
+        finally:
+            db.close()
+
+
+def _finish(db: Session, job_id: int, owner: str, **values) -> None:
+    # fenced on the owner: a job requeued as stale is no longer ours to finish
+    db.execute(
+        update(Job).where(Job.job_id == job_id, Job.worker == owner, Job.status == RUNNING)
+        .values(**values)
+    )
+    db.commit()
+
+
+def run_job(db: Session, session_factory, job: Job, worker: str) -> str:
+    """Run one claimed job to an outcome; returns the final status."""
+    cancelled, done = threading.Event(), threading.Event()
+    if job.cancel_requested:
+        cancelled.set()
+    beat = threading.Thread(
+        target=_heartbeat, args=(session_factory, job.job_id, worker, cancelled, done), daemon=True
+    )
+    beat.start()
+
+    job_id, attempts, max_attempts = job.job_id, job.attempts, job.max_attempts
+    ctx = JobContext(db, job, cancelled)
+    try:
+        fn = HANDLERS.get(job.kind)
+        if fn is None:
+            raise PermanentError(f"No handler for job kind '{job.kind}'")
+        ctx.progress()          # honours a cancel requested before the start
+        result = fn(ctx, **(job.payload or {}))
+        db.commit()
+        _finish(db, job_id, worker, status=SUCCEEDED, progress=1, result=result,
+                finished_at=_now(), message="Done")
+        return SUCCEEDED
+    except JobCancelled:
+        db.rollback()
+        _finish(db, job_id, worker, status=CANCELLED, finished_at=_now(), message="Cancelled")
+        return CANCELLED
+    except Exception as exc:
+        db.rollback()
+        error = f"{type(exc).__name__}: {exc}"[:4000]
+        if isinstance(exc, PermanentError) or attempts >= max_attempts:
+            _finish(db, job_id, worker, status=FAILED, error=error, finished_at=_now(), message="Failed")
+            return FAILED
+        delay = backoff_seconds(attempts)
+        _finish(db, job_id, worker, status=QUEUED, error=error, worker=None,
+                run_after=_now() + timedelta(seconds=delay),
+                message=f"Retrying in {delay:.0f}s (attempt {attempts} of {max_attempts} failed)")
+        return QUEUED
+    finally:
+        done.set()
+        beat.join()
+
+
+def work(worker: str, stop, poll_seconds: float = JOB_POLL_SECONDS) -> None:
+    """Claim and run jobs until `stop` (a threading/multiprocessing Event) is set."""
+    from .database import SessionLocal
+
+    last_sweep = 0.0
+    while not stop.is_set():
+        db = SessionLocal()
+        try:
+            if time.monotonic() - last_sweep >= JOB_STALE_SECONDS / 2:
+                requeue_stale(db)
+                last_sweep = time.monotonic()
+            job = claim(db, worker)
+            if job is not None:
+                run_job(db, SessionLocal, job, worker)
+                continue
+        except Exception:
+            db.rollback()
+        finally:
+            db.close()
+        stop.wait(poll_seconds)
+
+
+# ---------------------------------------------------------------
+# Handlers
+# ---------------------------------------------------------------
+@handler("ingest_file")
+def ingest_file(ctx: JobContext, file_id: int, mapping: dict | None = None) -> dict:
+    """Load an uploaded activity CSV; a retry skips the rows earlier attempts committed."""
+    rec = ctx.db.get(UploadedFile, file_id)
+    if rec is None or rec.org_id != ctx.org_id:
+        raise PermanentError("File not found")
+    if not os.path.exists(rec.storage_path):
+        raise PermanentError("Stored file is missing")
+
+    skip = ctx.checkpoint.get("rows_read", 0)
+    inserted_before = ctx.checkpoint.get("rows_inserted", 0)
+
+    def on_progress(rows_read: int, rows_inserted: int, fraction: float, errors: dict) -> None:
+        # the errors so far go with the checkpoint: a retry skips those rows
+        # without validating them again
+        ctx.progress(
+            fraction,
+            f"{rows_read} rows read",
+            {"rows_read": rows_read, "rows_inserted": inserted_before + rows_inserted, **errors},
+        )
+
+    try:
+        result = ingest_csv(
+            ctx.db, rec.storage_path, ctx.org_id,
+            mapping=mapping, on_progress=on_progress, skip_rows=skip,
+            prior_errors=ctx.checkpoint,
+        )
+    except IngestError as exc:
+        raise PermanentError(str(exc))
+    except UnicodeDecodeError:
+        raise PermanentError("File is not UTF-8 encoded CSV")
+    result["rows_inserted"] += inserted_before
+    return {"file_id": file_id, **result}
+
+
+@handler("recompute_org")
+def recompute_org(ctx: JobContext) -> dict:
+    """Rebuild the org's emission rollup from activity_log."""
+    ctx.progress(0.0, "Rebuilding emission rollup")
+    # committed on its own: left in the rebuild's transaction, the job row stays
+    # locked and the heartbeat cannot update it until the rebuild is done
+    ctx.db.commit()
+    rollup.rebuild(ctx.db, ctx.org_id)
+    return {"org_id": ctx.org_id}
+
+
+# ---------------------------------------------------------------
+# Process pool
+# ---------------------------------------------------------------
+def _worker_main(name: str, stop) -> None:
+    signal.signal(signal.SIGINT, signal.SIG_IGN)    # the pool owner decides when to stop
+    work(name, stop)
+
+
+class WorkerPool:
+    """N worker processes (spawned, so none inherits the parent's DB connections)."""
+
+    def __init__(self, size: int = JOB_WORKERS):
+        self.size = size
+        self._ctx = multiprocessing.get_context("spawn")
+        self._stop = self._ctx.Event()
+        self._procs = {}
+
+    def _spawn(self, index: int) -> None:
+        name = f"{socket.gethostname()}:{os.getpid()}:{index}"
+        proc = self._ctx.Process(target=_worker_main, args=(name, self._stop), daemon=True)
+        proc.start()
+        self._procs[index] = proc
+
+    def start(self) -> "WorkerPool":
+        for i in range(self.size):
+            self._spawn(i)
+        return self
+
+    def supervise(self) -> None:
+        """Restart workers that died (call periodically)."""
+        for index, proc in list(self._procs.items()):
+            if not proc.is_alive() and not self._stop.is_set():
+                self._spawn(index)
+
+    def stop(self, timeout: float = 30.0) -> None:
+        self._stop.set()
+        deadline = time.monotonic() + timeout
+        for proc in self._procs.values():
+            proc.join(max(deadline - time.monotonic(), 0))
+            if proc.is_alive():
+                proc.terminate()
+
+
+_embedded: WorkerPool | None = None
+_supervisor: threading.Event | None = None
+
+
+def start_embedded() -> None:
+    """Startup hook of the web app: run JOB_EMBEDDED_WORKERS workers next to it."""
+    global _embedded, _supervisor
+    if JOB_EMBEDDED_WORKERS <= 0 or _embedded is not None:
+        return
+    _embedded = WorkerPool(JOB_EMBEDDED_WORKERS).start()
+    _supervisor = threading.Event()
+
+    def supervise(pool: WorkerPool, stopping: threading.Event) -> None:
+        while not stopping.wait(5.0):
+            pool.supervise()
+
+    threading.Thread(target=supervise, args=(_embedded, _supervisor), daemon=True).start()
+
+
+def stop_embedded() -> None:
+    global _embedded, _supervisor
+    if _embedded is None:
+        return
+    _supervisor.set()
+    _embedded.stop()
+    _embedded = _supervisor = None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run background job workers.")
+    parser.add_argument("--workers", type=int, default=JOB_WORKERS)
+    args = parser.parse_args()
+
+    pool = WorkerPool(args.workers).start()
+    stopping = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stopping.set())
+    print(f"{args.workers} job worker(s) running")
+    while not stopping.wait(1.0):
+        pool.supervise()
+    pool.stop()
+
+
+if __name__ == "__main__":
+    main()
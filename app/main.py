@@ -1,79 +1,178 @@
 # app/main.py
+"""
+Application factory.
+
+    uvicorn --factory app.main:create_app
+    uvicorn app.main:app                    (same thing, built on first access)
+
+Importing this module does no work: routers, templates and the database are
+set up by create_app(), and the connection pools, reference data, factor
+snapshot and template cache are warmed by the lifespan before the first
+request is accepted. scripts/bench_startup.py measures both.
+"""
+import logging
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, Request
-from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse, RedirectResponse
-
-# Import routers
-from app.Routers import (
-    auth,
-    facilities,
-    activities,
-    factors,
-    reports,
-    forecast,
-    planner,
-    targets
-)
-
-app = FastAPI()
-
-app.include_router(auth.profile_router)
-app.mount("/static", StaticFiles(directory="app/static"), name="static")
-templates = Jinja2Templates(directory="app/templates")
-app.state.templates = templates   # ← add this line
-
-@app.get("/", response_class=HTMLResponse)
+from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
+from sqlalchemy import exc as sa_exc
+from starlette.concurrency import run_in_threadpool
+
+from app.settings import Settings, configure, get_settings
+
+log = logging.getLogger(__name__)
+
+
+async def pool_exhausted(request: Request, exc: sa_exc.TimeoutError):
+    # raised when no pooled DB connection frees up in time (see DB_POOL_FAIL_FAST)
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Database busy, please retry"},
+        headers={"Retry-After": "1"},
+    )
+
+
+# ---------------------------
+# Startup / shutdown
+# ---------------------------
+def _warm(settings: Settings) -> None:
+    from app import database, seed, templating
+    from app.resolver import resolver
+
+    database.warm_pool(settings.db_pool_warm)
+    if settings.seed_on_startup:
+        seed.seed_on_startup()
+    with database.SessionLocal() as db:
+        resolver.activity_types(db)     # loads the factor/unit/type snapshot
+    templating.precompile()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    from app import database, jobs, passwords
+
+    settings = app.state.settings
+    settings.validate()
+    await run_in_threadpool(_warm, settings)
+    try:
+        await database.warm_async_pool(settings.db_pool_warm)
+    except (ImportError, RuntimeError, OSError, sa_exc.SQLAlchemyError) as exc:
+        # the async path is optional: no driver for this backend, or its database
+        # is unreachable right now; the async routes report it when called
+        log.warning("async database pool not warmed: %s", exc)
+    jobs.start_embedded()   # no-op unless JOB_EMBEDDED_WORKERS is set
+    try:
+        yield
+    finally:
+        jobs.stop_embedded()
+        passwords.shutdown()
+        await database.dispose()
+
+
+# ---------------------------
+# Pages served from app/templates
+# ---------------------------
 def login_page(request: Request):
-    return templates.TemplateResponse("landing.html", {"request": request})  # ← changed file name
+    return request.app.state.templates.TemplateResponse("landing.html", {"request": request})  # ← changed file name
 
-@app.get("/dashboard", response_class=HTMLResponse)
 def dashboard_page(request: Request):
-    return templates.TemplateResponse("dashboard.html", {"request": request})
+    return request.app.state.templates.TemplateResponse("dashboard.html", {"request": request})
 
-@app.get("/files", response_class=HTMLResponse)
 def files_page(request: Request):
-    return templates.TemplateResponse("files.html", {"request": request})
+    return request.app.state.templates.TemplateResponse("files.html", {"request": request})
 
-@app.get("/profile", response_class=HTMLResponse)
 def profile_page(request: Request):
-    return templates.TemplateResponse("profile.html", {"request": request})
+    return request.app.state.templates.TemplateResponse("profile.html", {"request": request})
 
-@app.get("/logout", response_class=HTMLResponse)
 def logout_page(request: Request):
-    return templates.TemplateResponse("logout.html", {"request": request})
+    return request.app.state.templates.TemplateResponse("logout.html", {"request": request})
 
-# =======================================================
-# PAGE ROUTERS 
-# =======================================================
+def home_redirect():
+    return RedirectResponse("/dashboard")
 
-app.include_router(auth.pages)          # login + logout pages
-app.include_router(facilities.pages)    # facility list + detail
-app.include_router(activities.pages)    # new activity form
-app.include_router(factors.pages)       # emission factor pages
-app.include_router(reports.pages)       # reports UI
-app.include_router(forecast.pages)      # forecasting UI
-app.include_router(planner.pages)       # planner UI
-app.include_router(targets.pages)       # emissions target page
 
+def create_app(settings: Settings | None = None) -> FastAPI:
+    if settings is not None:
+        configure(settings)
+    settings = get_settings()
 
-# =======================================================
-# API ROUTERS (ALL BACK-END JSON ENDPOINTS)
-# =======================================================
+    from app import templating
+    from app.assets import StaticAssets
+    from app.compression import CompressionMiddleware
+    from app.Routers import (
+        auth,
+        files,
+        metrics,
+        facilities,
+        activities,
+        factors,
+        reports,
+        forecast,
+        planner,
+        targets,
+        exports,
+        jobs as jobs_api,
+    )
 
-app.include_router(auth.router)
-app.include_router(facilities.router)
-app.include_router(activities.router)
-app.include_router(factors.router)
-app.include_router(reports.router)
-app.include_router(forecast.router)
-app.include_router(planner.router)
-app.include_router(targets.router)
+    app = FastAPI(lifespan=lifespan)
+    app.state.settings = settings
+    app.state.templates = templating.templates
+    app.add_middleware(CompressionMiddleware)
+    app.add_exception_handler(sa_exc.TimeoutError, pool_exhausted)
 
+    app.include_router(auth.profile_router)
+    app.mount("/static", StaticAssets(directory="app/static"), name="static")
 
-# ---------------------------
-# Optional Redirect for /home
-# ---------------------------
-@app.get("/home")
-def home_redirect():
-    return RedirectResponse("/dashboard")
+    app.add_api_route("/", login_page, response_class=HTMLResponse)
+    app.add_api_route("/dashboard", dashboard_page, response_class=HTMLResponse)
+    app.add_api_route("/files", files_page, response_class=HTMLResponse)
+    app.add_api_route("/profile", profile_page, response_class=HTMLResponse)
+    app.add_api_route("/logout", logout_page, response_class=HTMLResponse)
+
+    # =======================================================
+    # PAGE ROUTERS
+    # =======================================================
+
+    app.include_router(auth.pages)          # login + logout pages
+    app.include_router(facilities.pages)    # facility list + detail
+    app.include_router(activities.pages)    # new activity form
+    app.include_router(factors.pages)       # emission factor pages
+    app.include_router(reports.pages)       # reports UI
+    app.include_router(forecast.pages)      # forecasting UI
+    app.include_router(planner.pages)       # planner UI
+    app.include_router(targets.pages)       # emissions target page
+
+    # =======================================================
+    # API ROUTERS (ALL BACK-END JSON ENDPOINTS)
+    # =======================================================
+
+    app.include_router(auth.router)
+    app.include_router(files.router)
+    app.include_router(facilities.router)
+    app.include_router(activities.router)
+    app.include_router(factors.router)
+    app.include_router(reports.router)
+    app.include_router(forecast.router)
+    app.include_router(planner.router)
+    app.include_router(targets.router)
+    app.include_router(exports.router)
+    app.include_router(jobs_api.router)
+    app.include_router(metrics.router)     # /internal/metrics
+
+    # Optional Redirect for /home
+    app.add_api_route("/home", home_redirect)
+
+    return app
+
+
+_app = None
+
+
+def __getattr__(name: str):
+    # `app.main:app` keeps working for uvicorn and scripts; built on first access
+    global _app
+    if name == "app":
+        if _app is None:
+            _app = create_app()
+        return _app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,293 @@
+# app/migrations.py
+"""
+Idempotent schema upgrades.
+
+Run `python -m app.migrations` after deploying a version that adds tables,
+columns or indexes. Missing tables are created, missing columns are added
+(and backfilled where needed, then made NOT NULL when the model says so) and
+missing indexes are built (dropping the ones they replace), after any rows
+that would violate a new unique index are merged; everything else that
+already exists is left untouched. A newly created emission_rollup is filled from
+activity_log, so reports work without a separate `python -m app.rollup`.
+
+Data is never thrown away implicitly. Before changing anything the upgrade
+looks for rows it could only fix destructively: activities whose facility is
+gone (they cannot get an org_id) and duplicate emission factors with different
+values. It stops with a DataConflict listing them unless run with --fix-data,
+which deletes the orphaned activities, keeps the newest factor of each
+duplicate key, recomputes co2e_kg of the activities moved to it and rebuilds
+the rollup. Duplicates with equal values are merged either way.
+"""
+import argparse
+import logging
+
+from sqlalchemy import Table, delete, func, inspect, select, text, update
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+from .database import Base
+from . import models, rollup  # noqa: F401  (models registers every table on Base.metadata)
+from .models import ActivityLog, EmissionFactor, EmissionRollup, Facility
+
+log = logging.getLogger(__name__)
+
+MAX_REPORTED = 20       # conflicting keys / row ids listed in a DataConflict
+
+
+class DataConflict(RuntimeError):
+    """Rows the upgrade could only fix by deleting or rewriting data (see --fix-data)."""
+
+
+def _add_column(conn: Connection, table_name: str, column) -> None:
+    """ALTER TABLE ... ADD COLUMN, always nullable so existing rows stay valid (see _set_not_null)."""
+    col_type = column.type.compile(dialect=conn.dialect)
+    ddl = f"ALTER TABLE {table_name} ADD COLUMN {column.name} {col_type}"
+    for fk in column.foreign_keys:
+        ddl += f" REFERENCES {fk.column.table.name} ({fk.column.name})"
+    conn.execute(text(ddl))
+
+
+def _backfill_activity_org(conn: Connection) -> None:
+    owner = (
+        select(Facility.org_id)
+        .where(Facility.facility_id == ActivityLog.facility_id)
+        .scalar_subquery()
+    )
+    conn.execute(
+        update(ActivityLog.__table__)
+        .where(ActivityLog.org_id.is_(None))
+        .values(org_id=owner)
+    )
+
+
+_FACTOR_KEY = (EmissionFactor.source, EmissionFactor.category, EmissionFactor.unit, EmissionFactor.year)
+
+
+def _duplicate_factor_keys(conn: Connection, conflicting_only: bool = False):
+    """(source, category, unit, year, newest factor_id) of keys held by more than one row."""
+    having = func.count() > 1
+    if conflicting_only:
+        having = func.count(func.distinct(EmissionFactor.factor)) > 1
+    return conn.execute(
+        select(*_FACTOR_KEY, func.max(EmissionFactor.factor_id))
+        .group_by(*_FACTOR_KEY)
+        .having(having)
+    ).all()
+
+
+def _orphan_activities(conn: Connection):
+    """Activities whose facility no longer exists: their org_id can't be backfilled."""
+    return (
+        select(ActivityLog.activity_id)
+        .where(~select(Facility.facility_id).where(Facility.facility_id == ActivityLog.facility_id).exists())
+    )
+
+
+def _check_data(conn: Connection, fix_data: bool) -> None:
+    """Raise DataConflict for rows only a destructive fix could handle, unless fix_data."""
+    existing = inspect(conn)
+    if not existing.has_table(ActivityLog.__tablename__):
+        return
+    problems = []
+
+    org_col = {c["name"]: c for c in existing.get_columns(ActivityLog.__tablename__)}.get("org_id")
+    if org_col is None or org_col["nullable"]:
+        orphans = _orphan_activities(conn)
+        if org_col is not None:
+            orphans = orphans.where(ActivityLog.org_id.is_(None))
+        ids = conn.execute(orphans.order_by(ActivityLog.activity_id)).scalars().all()
+        if ids:
+            shown = ", ".join(map(str, ids[:MAX_REPORTED])) + (" ..." if len(ids) > MAX_REPORTED else "")
+            problems.append(f"{len(ids)} activity_log row(s) reference a deleted facility: {shown}")
+
+    present = {i["name"] for i in existing.get_indexes(EmissionFactor.__tablename__)}
+    if "uq_emission_factor_key" not in present:
+        groups = _duplicate_factor_keys(conn, conflicting_only=True)
+        if groups:
+            keys = "; ".join(
+                f"({', '.join(repr(v) for v in g[:4])})" for g in groups[:MAX_REPORTED]
+            ) + (" ..." if len(groups) > MAX_REPORTED else "")
+            problems.append(
+                f"{len(groups)} emission_factor (source, category, unit, year) key(s) "
+                f"have rows with different factor values: {keys}"
+            )
+
+    if not problems:
+        return
+    if not fix_data:
+        raise DataConflict(
+            "Upgrade stopped before changing anything:\n  " + "\n  ".join(problems)
+            + "\nResolve these rows, or rerun with --fix-data to delete the orphaned activities"
+            " and keep the newest factor of each key."
+        )
+    for problem in problems:
+        log.warning("--fix-data: %s", problem)
+
+
+def _dedupe_emission_factors(conn: Connection) -> bool:
+    """
+    Keep the newest row per (source, category, unit, year); activities follow it.
+    True when a merged row had a different value (their co2e_kg is recomputed).
+    """
+    recomputed = False
+    for *values, keep in _duplicate_factor_keys(conn):
+        match = [col.is_(None) if v is None else col == v for col, v in zip(_FACTOR_KEY, values)]
+        kept = conn.execute(select(EmissionFactor.factor).where(EmissionFactor.factor_id == keep)).scalar()
+        dupes = conn.execute(
+            select(EmissionFactor.factor_id, EmissionFactor.factor).where(*match, EmissionFactor.factor_id != keep)
+        ).all()
+        dupe_ids = [factor_id for factor_id, _ in dupes]
+        changed = [factor_id for factor_id, factor in dupes if factor != kept]
+        if changed:
+            # only reached with --fix-data (see _check_data)
+            conn.execute(
+                update(ActivityLog.__table__)
+                .where(ActivityLog.factor_id.in_(changed))
+                .values(factor_id=keep, co2e_kg=ActivityLog.quantity * kept)
+            )
+            recomputed = True
+        conn.execute(
+            update(ActivityLog.__table__)
+            .where(ActivityLog.factor_id.in_(dupe_ids))
+            .values(factor_id=keep)
+        )
+        conn.execute(delete(EmissionFactor.__table__).where(EmissionFactor.factor_id.in_(dupe_ids)))
+        log.info(
+            "emission_factor %s: merged %d duplicate(s) into factor_id %s%s",
+            tuple(values), len(dupe_ids), keep, " and recomputed their activities" if changed else "",
+        )
+    return recomputed
+
+
+def _drop_orphan_activities(conn: Connection) -> bool:
+    """Activities whose facility is gone belong to no org; only reached with --fix-data."""
+    result = conn.execute(delete(ActivityLog.__table__).where(ActivityLog.org_id.is_(None)))
+    if result.rowcount:
+        log.warning("activity_log: deleted %d row(s) whose facility no longer exists", result.rowcount)
+    return False
+
+
+def _set_not_null(conn: Connection, table: Table, column) -> None:
+    dialect = conn.dialect.name
+    if dialect == "postgresql":
+        conn.execute(text(f"ALTER TABLE {table.name} ALTER COLUMN {column.name} SET NOT NULL"))
+    elif dialect == "mysql":
+        col_type = column.type.compile(dialect=conn.dialect)
+        conn.execute(text(f"ALTER TABLE {table.name} MODIFY {column.name} {col_type} NOT NULL"))
+    elif dialect == "sqlite":
+        _recreate_sqlite_table(conn, table)
+    else:
+        raise RuntimeError(f"Don't know how to make {table.name}.{column.name} NOT NULL on {dialect}")
+
+
+def _recreate_sqlite_table(conn: Connection, table: Table) -> None:
+    """SQLite can't alter a column: copy the rows into a table built from the model."""
+    # built in Base.metadata so its foreign keys resolve; removed again right after
+    temp = table.to_metadata(Base.metadata, name=f"_new_{table.name}")
+    try:
+        temp.indexes.clear()        # rebuilt under their real names by the index pass
+        temp.create(bind=conn)
+    finally:
+        Base.metadata.remove(temp)
+    columns = ", ".join(c.name for c in table.columns)
+    conn.execute(text(f"INSERT INTO {temp.name} ({columns}) SELECT {columns} FROM {table.name}"))
+    conn.execute(text(f"DROP TABLE {table.name}"))
+    conn.execute(text(f"ALTER TABLE {temp.name} RENAME TO {table.name}"))
+
+
+# table -> [(column name, backfill or None)]
+ADDED_COLUMNS = {
+    "activity_log": [("org_id", _backfill_activity_org)],
+    "forecast_scenario": [("category_growth_pct", None)],
+    "uploaded_file": [("sha256", None), ("size_bytes", None)],
+}
+
+# NOT NULL column -> cleanup of the rows its backfill could not fill
+BEFORE_NOT_NULL = {
+    ("activity_log", "org_id"): _drop_orphan_activities,
+}
+
+# unique index -> cleanup that must run before it can be built
+BEFORE_INDEX = {
+    "uq_emission_factor_key": _dedupe_emission_factors,
+}
+
+
+def _drop_index(conn: Connection, table_name: str, name: str) -> None:
+    on = f" ON {table_name}" if conn.dialect.name == "mysql" else ""
+    conn.execute(text(f"DROP INDEX {name}{on}"))
+
+
+# index -> index it supersedes, dropped once the new one exists
+REPLACED_INDEXES = {
+    "ix_activity_log_facility_date_id": "ix_activity_log_facility_date",
+}
+
+
+def upgrade(engine: Engine, fix_data: bool = False) -> None:
+    with engine.connect() as conn:
+        _check_data(conn, fix_data)
+
+    # a rollup created here starts empty and is filled from activity_log below
+    rebuild_rollup = not inspect(engine).has_table(EmissionRollup.__tablename__)
+    Base.metadata.create_all(bind=engine)
+
+    with engine.begin() as conn:
+        existing = inspect(conn)
+        for table_name, columns in ADDED_COLUMNS.items():
+            table = Base.metadata.tables[table_name]
+            present = {c["name"]: c for c in existing.get_columns(table_name)}
+            for name, backfill in columns:
+                column = table.c[name]
+                if name not in present:
+                    _add_column(conn, table_name, column)
+                elif column.nullable or not present[name]["nullable"]:
+                    continue
+                # new, or added nullable by an earlier upgrade but NOT NULL in the model
+                if backfill:
+                    backfill(conn)
+                if not column.nullable:
+                    if (table_name, name) in BEFORE_NOT_NULL:
+                        rebuild_rollup |= BEFORE_NOT_NULL[(table_name, name)](conn)
+                    _set_not_null(conn, table, column)
+
+    # create_all skips indexes of tables that already existed
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            present = {i["name"] for i in inspect(conn).get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name in present:
+                    continue
+                if index.name in BEFORE_INDEX:
+                    rebuild_rollup |= BEFORE_INDEX[index.name](conn)
+                index.create(bind=conn)
+                if REPLACED_INDEXES.get(index.name) in present:
+                    _drop_index(conn, table.name, REPLACED_INDEXES[index.name])
+
+    # after the column backfills: the rollup is keyed on activity_log.org_id
+    if rebuild_rollup:
+        with Session(bind=engine) as db:
+            rollup.rebuild(db)
+            db.commit()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Bring the database schema up to date.")
+    parser.add_argument(
+        "--fix-data", action="store_true",
+        help="delete orphaned activities and merge conflicting duplicate factors instead of stopping",
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(name)s: %(message)s")
+
+    from .database import get_engine
+
+    try:
+        upgrade(get_engine(), fix_data=args.fix_data)
+    except DataConflict as exc:
+        raise SystemExit(str(exc))
+    print("schema up to date")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,7 @@
 # app/models.py
 from sqlalchemy import (
     Column, Integer, String, ForeignKey, Date, Numeric, Text,
-    DECIMAL, JSON, TIMESTAMP
+    DECIMAL, JSON, TIMESTAMP, Index, BigInteger, Boolean
 )
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -44,7 +44,7 @@ class User(Base):
 class Facility(Base):
     __tablename__ = "facility"
     facility_id = Column(Integer, primary_key=True, autoincrement=True)
-    org_id = Column(Integer, ForeignKey("organization.org_id"), nullable=False)
+    org_id = Column(Integer, ForeignKey("organization.org_id"), nullable=False, index=True)
     name = Column(String(255))
     location = Column(Text)
     grid_region_code = Column(String(64))
@@ -65,6 +65,12 @@ class EmissionFactor(Base):
 
     activities = relationship("ActivityLog", back_populates="factor")
 
+    __table_args__ = (
+        Index("ix_emission_factor_category_year", "category", "year"),
+        # upsert key for factor imports
+        Index("uq_emission_factor_key", "source", "category", "unit", "year", unique=True),
+    )
+
 
 # -------------------------
 # New lookups (for forms)
@@ -99,6 +105,8 @@ class ActivityLog(Base):
 
     facility_id = Column(Integer, ForeignKey("facility.facility_id"), nullable=False)
     factor_id   = Column(Integer, ForeignKey("emission_factor.factor_id"), nullable=False)
+    # copy of facility.org_id so tenant-scoped queries skip the facility join
+    org_id      = Column(Integer, ForeignKey("organization.org_id"), nullable=False)
 
     # Original flexible fields (kept for compatibility)
     activity_type = Column(String(128))          # free-text legacy
@@ -118,6 +126,12 @@ class ActivityLog(Base):
     activity_type_fk = relationship("ActivityType", back_populates="activities")
     unit_fk         = relationship("Unit", back_populates="activities")
 
+    __table_args__ = (
+        # both end in activity_id: the listing's keyset order, read backwards
+        Index("ix_activity_log_org_date", "org_id", "activity_date", "activity_id"),
+        Index("ix_activity_log_facility_date_id", "facility_id", "activity_date", "activity_id"),
+    )
+
 
 # -------------------------
 # Targets & forecasting
@@ -148,6 +162,7 @@ class ForecastScenario(Base):
 
     annual_growth_pct = Column(Numeric(6, 3))    # % growth in activity demand
     renewable_share_pct = Column(Numeric(6, 3))  # % of electricity from renewables
+    category_growth_pct = Column(JSON)           # {"Diesel": -5.0, ...} overrides annual_growth_pct
 
     start_year = Column(Integer, nullable=False)
     end_year   = Column(Integer, nullable=False)
@@ -202,10 +217,85 @@ class UploadedFile(Base):
     org_id = Column(Integer, ForeignKey("organization.org_id"), nullable=False)
     user_id = Column(Integer, ForeignKey("user.user_id"))
     purpose = Column(String(32), nullable=False)       # 'energy','fuel','shipping','factors','other'
-    storage_path = Column(String(512), nullable=False)
+    storage_path = Column(String(512), nullable=False)  # shared by every row with the same sha256
     original_name = Column(String(255), nullable=False)
     content_type = Column(String(128))
+    sha256 = Column(String(64), index=True)             # NULL for files stored before dedup
+    size_bytes = Column(BigInteger)
     uploaded_at = Column(TIMESTAMP, server_default=func.current_timestamp())
 
     organization = relationship("Organization", back_populates="uploads")
     uploader = relationship("User", back_populates="uploads")
+
+
+# -------------------------
+# Reporting rollup
+# -------------------------
+class EmissionRollup(Base):
+    """
+    Monthly sums of activity_log, maintained alongside every activity write.
+    0 is used for "unknown" scope / activity type and for undated rows.
+    """
+    __tablename__ = "emission_rollup"
+    org_id = Column(Integer, ForeignKey("organization.org_id"), primary_key=True, autoincrement=False)
+    facility_id = Column(Integer, ForeignKey("facility.facility_id"), primary_key=True, autoincrement=False)
+    scope = Column(Integer, primary_key=True, autoincrement=False)
+    activity_type_id = Column(Integer, primary_key=True, autoincrement=False)
+    period_year = Column(Integer, primary_key=True, autoincrement=False)
+    period_month = Column(Integer, primary_key=True, autoincrement=False)
+
+    co2e_kg = Column(Numeric(20, 6), nullable=False, default=0)
+    quantity = Column(Numeric(20, 6), nullable=False, default=0)
+    row_count = Column(Integer, nullable=False, default=0)
+
+
+# -------------------------
+# Cache versions
+# -------------------------
+class DataVersion(Base):
+    """Monotonic counters that in-process caches compare against (e.g. key 'factors')."""
+    __tablename__ = "data_version"
+    key = Column(String(64), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(TIMESTAMP, server_default=func.current_timestamp())
+
+
+class SeedState(Base):
+    """Checksum of the reference data last seeded (see app/seed.py)."""
+    __tablename__ = "seed_state"
+    name = Column(String(64), primary_key=True)
+    checksum = Column(String(64), nullable=False)
+    applied_at = Column(TIMESTAMP, server_default=func.current_timestamp())
+
+
+# -------------------------
+# Background jobs
+# -------------------------
+class Job(Base):
+    """A unit of background work (see app/jobs.py); claimed by one worker at a time."""
+    __tablename__ = "job"
+    job_id = Column(Integer, primary_key=True, autoincrement=True)
+    org_id = Column(Integer, ForeignKey("organization.org_id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("user.user_id"))
+    kind = Column(String(32), nullable=False)                # 'ingest_file', 'recompute_org'
+    payload = Column(JSON)
+    status = Column(String(16), nullable=False, default="queued")  # queued/running/succeeded/failed/cancelled
+    progress = Column(Numeric(5, 4), nullable=False, default=0)    # 0..1
+    message = Column(String(255))
+    checkpoint = Column(JSON)                                # where a retry resumes
+    result = Column(JSON)
+    error = Column(Text)
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    cancel_requested = Column(Boolean, nullable=False, default=False)
+    worker = Column(String(64))
+    run_after = Column(TIMESTAMP, server_default=func.current_timestamp())
+    heartbeat_at = Column(TIMESTAMP, nullable=True)
+    created_at = Column(TIMESTAMP, server_default=func.current_timestamp())
+    started_at = Column(TIMESTAMP, nullable=True)
+    finished_at = Column(TIMESTAMP, nullable=True)
+
+    __table_args__ = (
+        Index("ix_job_status_run_after", "status", "run_after"),
+        Index("ix_job_org_created", "org_id", "created_at"),
+    )
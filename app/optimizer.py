@@ -0,0 +1,234 @@
+# app/optimizer.py
+"""
+Capex-constrained action portfolio for the planner.
+
+Candidates are (ActionLibrary entry x facility) pairs. A candidate avoids
+`expected_reduction_pct` of its facility's baseline-year emissions every year
+from the year after the baseline until the target year (or the end of the
+action's life, if sooner), capped at the facility's baseline. A knapsack over
+the capex budget picks the set with the largest avoided CO2e, taking at most
+one action per facility: reductions of actions on the same emissions don't
+add up, so stacking them would overstate what a portfolio avoids.
+
+Baselines come from emission_rollup (one GROUP BY per request).
+"""
+import math
+from typing import NamedTuple
+
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from .models import ActionLibrary, EmissionRollup, Facility
+
+R = EmissionRollup.__table__
+
+# The budget is split into at most this many DP cells; when capex values have
+# no common divisor that fits, they are rounded up to whole cells, so a
+# solution never exceeds the budget (but may be slightly short of optimal).
+MAX_BUDGET_CELLS = 20_000
+MAX_CANDIDATES = 5_000
+# The solver keeps one choice per (facility, budget cell); with many facilities
+# the budget axis gets fewer cells so that table stays within this size.
+MAX_CHOICE_TABLE_BYTES = 16 * 1024 ** 2
+
+
+class Candidate(NamedTuple):
+    action_id: int
+    code: str
+    name: str
+    facility_id: int
+    facility_name: str | None
+    capex_usd: float
+    annual_kg: float        # avoided per year, at most the facility's baseline
+    years: int              # years counted until the target year
+    avoided_kg: float       # annual_kg * years
+    life_years: float | None
+
+
+# ---------------------------------------------------------------
+# Baselines
+# ---------------------------------------------------------------
+def latest_year(db: Session, org_id: int) -> int | None:
+    return db.execute(
+        select(func.max(R.c.period_year)).where(R.c.org_id == org_id, R.c.period_year > 0)
+    ).scalar()
+
+
+def facility_baselines(db: Session, org_id: int, year: int) -> dict:
+    """{facility_id: co2e_kg} for one year."""
+    rows = db.execute(
+        select(R.c.facility_id, func.coalesce(func.sum(R.c.co2e_kg), 0))
+        .where(R.c.org_id == org_id, R.c.period_year == year)
+        .group_by(R.c.facility_id)
+    ).all()
+    return {fid: float(kg or 0) for fid, kg in rows}
+
+
+# ---------------------------------------------------------------
+# Candidates
+# ---------------------------------------------------------------
+def build_candidates(actions, facilities, baselines: dict, baseline_year: int, target_year: int) -> list[Candidate]:
+    horizon = max(target_year - baseline_year, 0)
+    out = []
+    for a in actions:
+        pct = min(float(a.expected_reduction_pct or 0) / 100.0, 1.0)
+        life = float(a.default_life_years) if a.default_life_years else None
+        years = min(horizon, math.floor(life)) if life else horizon
+        for fac in facilities:
+            annual = baselines.get(fac.facility_id, 0.0) * pct
+            if annual <= 0 or years <= 0:
+                continue
+            out.append(Candidate(
+                a.action_id, a.code, a.name, fac.facility_id, fac.name,
+                float(a.default_capex_usd or 0), annual, years, annual * years, life,
+            ))
+    return out
+
+
+# ---------------------------------------------------------------
+# Solver
+# ---------------------------------------------------------------
+def knapsack(values: np.ndarray, costs: np.ndarray, budget: float, groups=None) -> list[int]:
+    """
+    Indices of the selection maximising sum(values) with sum(costs) <= budget,
+    taking at most one item per group (every item is its own group by default,
+    which is the plain 0/1 knapsack). One NumPy pass per item over the
+    discretised budget axis.
+    """
+    items = [i for i in range(len(values)) if values[i] > 0 and costs[i] <= budget]
+    if not items:
+        return []
+    if groups is None:
+        groups = range(len(values))
+    members = {}
+    for i in items:
+        members.setdefault(groups[i], []).append(i)
+    members = list(members.values())
+
+    # exact on the GCD of the (whole-dollar) costs when that grid is small
+    # enough, otherwise capex is rounded up to whole cells
+    choice_type = np.min_scalar_type(max(len(m) for m in members))
+    max_cells = max(min(MAX_BUDGET_CELLS, MAX_CHOICE_TABLE_BYTES // (len(members) * choice_type.itemsize) - 1), 1)
+    paid = np.array([costs[i] for i in items if costs[i] > 0])
+    dollars = np.ceil(paid).astype(np.int64)
+    unit = math.gcd(*dollars.tolist()) if len(dollars) else 1
+    weights = np.zeros(len(values), dtype=np.int64)
+    if budget // unit <= max_cells:
+        cells = int(budget // unit)
+        weights[items] = np.ceil(np.maximum(costs[items], 0)).astype(np.int64) // unit
+    else:
+        cells = max_cells
+        weights[items] = np.ceil(np.maximum(costs[items], 0) / (budget / cells) - 1e-9).astype(np.int64)
+
+    # choice[g, c]: 1 + position in the group of the item taken at budget c, or 0
+    best = np.zeros(cells + 1)
+    choice = np.zeros((len(members), cells + 1), dtype=choice_type)
+    for g, group in enumerate(members):
+        after = best.copy()
+        for k, i in enumerate(group):
+            w = int(weights[i])
+            if w > cells:
+                continue
+            candidate = best[:cells + 1 - w] + values[i]
+            improved = candidate > after[w:]
+            after[w:] = np.where(improved, candidate, after[w:])
+            choice[g, w:][improved] = k + 1
+        best = after
+
+    chosen = []
+    c = int(np.argmax(best))
+    for g in range(len(members) - 1, -1, -1):
+        k = int(choice[g, c])
+        if k:
+            i = members[g][k - 1]
+            chosen.append(i)
+            c -= int(weights[i])
+    return sorted(chosen)
+
+
+def macc(candidates: list[Candidate]) -> list[dict]:
+    """Marginal abatement cost curve: candidates by lifetime $/tCO2e, cheapest first."""
+    points = []
+    for c in candidates:
+        life_t = c.annual_kg / 1000.0 * (c.life_years or c.years)
+        points.append((c.capex_usd / life_t if life_t else math.inf, c))
+    points.sort(key=lambda p: (p[0], -p[1].annual_kg))
+
+    out = []
+    cumulative = 0.0
+    for cost, c in points:
+        cumulative += c.annual_kg / 1000.0
+        out.append({
+            "action_id": c.action_id,
+            "code": c.code,
+            "facility_id": c.facility_id,
+            "cost_per_tco2e_usd": round(cost, 2),
+            "abatement_t_per_year": round(c.annual_kg / 1000.0, 3),
+            "cumulative_t_per_year": round(cumulative, 3),
+        })
+    return out
+
+
+def _candidate_dict(c: Candidate) -> dict:
+    return {
+        "action_id": c.action_id,
+        "code": c.code,
+        "name": c.name,
+        "facility_id": c.facility_id,
+        "facility_name": c.facility_name,
+        "capex_usd": c.capex_usd,
+        "annual_reduction_kg": c.annual_kg,
+        "years_counted": c.years,
+        "avoided_kg": c.avoided_kg,
+    }
+
+
+def optimize(
+    db: Session,
+    org_id: int,
+    budget_usd: float,
+    target_year: int,
+    baseline_year: int | None = None,
+    action_ids=None,
+    facility_ids=None,
+) -> dict:
+    if baseline_year is None:
+        baseline_year = latest_year(db, org_id)
+    baselines = facility_baselines(db, org_id, baseline_year) if baseline_year else {}
+
+    facilities = db.query(Facility.facility_id, Facility.name).filter(Facility.org_id == org_id)
+    if facility_ids:
+        facilities = facilities.filter(Facility.facility_id.in_(facility_ids))
+    actions = db.query(ActionLibrary)
+    if action_ids:
+        actions = actions.filter(ActionLibrary.action_id.in_(action_ids))
+
+    candidates = build_candidates(
+        actions.all(), facilities.all(), baselines, baseline_year or target_year, target_year
+    )
+    if len(candidates) > MAX_CANDIDATES:
+        raise ValueError(f"Too many candidates ({len(candidates)}); narrow action_ids or facility_ids")
+
+    values = np.array([c.avoided_kg for c in candidates])
+    costs = np.array([c.capex_usd for c in candidates])
+    facility_of = [c.facility_id for c in candidates]
+    picked = [candidates[i] for i in knapsack(values, costs, budget_usd, facility_of)]
+
+    # one action per facility, each capped at its baseline, so these add up
+    annual = sum(c.annual_kg for c in picked)
+    baseline_total = sum(baselines.values())
+
+    return {
+        "baseline_year": baseline_year,
+        "target_year": target_year,
+        "baseline_co2e_kg": baseline_total,
+        "budget_usd": budget_usd,
+        "spent_usd": sum(c.capex_usd for c in picked),
+        "avoided_kg": sum(c.avoided_kg for c in picked),
+        "annual_reduction_kg": annual,
+        "projected_emissions_kg": baseline_total - annual,
+        "candidates": len(candidates),
+        "selected": [_candidate_dict(c) for c in picked],
+        "macc": macc(candidates),
+    }
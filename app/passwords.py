@@ -0,0 +1,146 @@
+# app/passwords.py
+"""
+Bounded, off-event-loop bcrypt hashing.
+
+bcrypt runs in a small process pool so logins neither hold AnyIO threadpool
+slots nor the GIL. At most PASSWORD_HASH_MAX_PENDING hashes may be queued or
+running; beyond that callers get an immediate 503 instead of piling up.
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import bcrypt
+from fastapi import HTTPException, status
+
+MAX_BCRYPT_BYTES = 72
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+POOL_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "32"))
+
+_executor: ProcessPoolExecutor | None = None
+_lock = threading.Lock()
+_pending = 0
+_stats = {"completed": 0, "rejected": 0, "failed": 0}
+_latencies_ms: deque = deque(maxlen=1000)
+
+
+# --- run inside the pool (module-level so they pickle) ---
+def _hash(password: str, rounds: int) -> str:
+    password_bytes = password.encode("utf-8")[:MAX_BCRYPT_BYTES]
+    return bcrypt.hashpw(password_bytes, bcrypt.gensalt(rounds)).decode("utf-8")
+
+
+def _verify(password: str, hashed: str) -> bool:
+    return bcrypt.checkpw(password.encode("utf-8")[:MAX_BCRYPT_BYTES], hashed.encode("utf-8"))
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                # spawn: forking a process that already runs threads is unsafe
+                _executor = ProcessPoolExecutor(
+                    max_workers=POOL_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+    return _executor
+
+
+def _replace_broken(broken: ProcessPoolExecutor) -> None:
+    """Drop a pool whose worker died; the next _get_executor() builds a new one."""
+    global _executor
+    with _lock:
+        if _executor is broken:
+            _executor = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+async def _submit(fn, *args):
+    executor = _get_executor()
+    try:
+        return await asyncio.wrap_future(executor.submit(fn, *args))
+    except BrokenProcessPool:
+        # a bcrypt child was killed (OOM, signal); retry once on a fresh pool
+        _replace_broken(executor)
+        return await asyncio.wrap_future(_get_executor().submit(fn, *args))
+
+
+async def _run(fn, *args):
+    global _pending
+    with _lock:
+        if _pending >= MAX_PENDING:
+            _stats["rejected"] += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many concurrent sign-ins, please retry shortly",
+                headers={"Retry-After": "1"},
+            )
+        _pending += 1
+
+    started = time.perf_counter()
+    try:
+        result = await _submit(fn, *args)
+    except Exception:
+        with _lock:
+            _stats["failed"] += 1
+        raise
+    finally:
+        with _lock:
+            _pending -= 1
+
+    with _lock:
+        _stats["completed"] += 1
+        _latencies_ms.append((time.perf_counter() - started) * 1000)
+    return result
+
+
+async def hash_password(password: str) -> str:
+    return await _run(_hash, password, BCRYPT_ROUNDS)
+
+
+async def verify_password(password: str, hashed: str) -> bool:
+    return await _run(_verify, password, hashed)
+
+
+def needs_rehash(hashed: str) -> bool:
+    """True when a stored hash uses a different work factor than BCRYPT_ROUNDS."""
+    try:
+        return int(hashed.split("$")[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
+
+
+def metrics() -> dict:
+    with _lock:
+        samples = sorted(_latencies_ms)
+        pending = _pending
+        stats = dict(_stats)
+
+    def pct(p):
+        return round(samples[min(len(samples) - 1, int(p * len(samples)))], 1) if samples else None
+
+    return {
+        "workers": POOL_WORKERS,
+        "rounds": BCRYPT_ROUNDS,
+        "max_pending": MAX_PENDING,
+        "queue_depth": pending,
+        **stats,
+        "latency_ms_p50": pct(0.50),
+        "latency_ms_p95": pct(0.95),
+        "latency_ms_max": round(samples[-1], 1) if samples else None,
+    }
+
+
+def shutdown() -> None:
+    global _executor
+    with _lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
@@ -0,0 +1,133 @@
+# app/progress.py
+"""
+Progress of an org's reduction targets.
+
+Yearly totals come from one GROUP BY on emission_rollup (kept current by every
+activity write) and are memoized per org data version, so evaluating all of an
+org's targets costs one primary-key lookup while nothing changed.
+
+For each target:
+  baseline   emissions of its baseline year (the stored value if that year has no data)
+  required   the straight line from baseline to baseline * (1 - pct) at the target year
+  progress   share of the reduction required by the latest year that was achieved
+  hit year   where a least-squares line through the actual years reaches the target
+
+Only complete calendar years count: the current year is left out of the
+series until it is over, since a few months of data would read as a steep
+drop. Each result says so in "complete_years_through".
+"""
+import math
+import os
+from datetime import date
+
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from . import versions
+from .cache import TTLCache
+from .models import EmissionRollup, Target
+
+R = EmissionRollup.__table__
+
+_yearly = TTLCache(
+    int(os.getenv("TARGET_CACHE_SIZE", "10000")),
+    float(os.getenv("TARGET_CACHE_TTL_SECONDS", "3600")),
+)
+
+
+def yearly_stmt(org_id: int):
+    return (
+        select(R.c.period_year, func.coalesce(func.sum(R.c.co2e_kg), 0))
+        .where(R.c.org_id == org_id, R.c.period_year > 0)
+        .group_by(R.c.period_year)
+        .order_by(R.c.period_year)
+    )
+
+
+def yearly_totals(db: Session, org_id: int) -> dict:
+    """{year: co2e_kg} of an org, memoized per org data version."""
+    key = (org_id, versions.get(db, versions.org_key(org_id)))
+    totals = _yearly.get(key)
+    if totals is None:
+        totals = {year: float(kg or 0) for year, kg in db.execute(yearly_stmt(org_id))}
+        _yearly.set(key, totals)
+    return totals
+
+
+def baseline_for(db: Session, org_id: int, year: int) -> float:
+    return yearly_totals(db, org_id).get(year, 0.0)
+
+
+def _hit_year(years: np.ndarray, actual: np.ndarray, target_kg: float) -> int | None:
+    if actual.size and actual[-1] <= target_kg:
+        return int(years[actual <= target_kg][0])
+    if actual.size < 2:
+        return None
+    slope, intercept = np.polyfit(years, actual, 1)
+    if slope >= 0:
+        return None
+    return math.ceil((target_kg - intercept) / slope)
+
+
+def evaluate(target, totals: dict, this_year: int) -> dict:
+    by, ty = target.baseline_year, target.target_year
+    pct = float(target.reduction_percent or 0) / 100.0
+    baseline = totals.get(by, float(target.baseline_co2e_kg or 0))
+    target_kg = baseline * (1.0 - pct)
+    span = max(ty - by, 1)
+
+    # the current year is partial; compare and fit on complete years only
+    last_complete = this_year - 1
+    years = np.array([y for y in sorted(totals) if by <= y <= min(ty, last_complete)], dtype=int)
+    actual = np.array([totals[y] for y in years], dtype=float)
+    required = baseline - (baseline - target_kg) * np.clip((years - by) / span, 0.0, 1.0)
+
+    result = {
+        "target_id": target.target_id,
+        "baseline_year": by,
+        "target_year": ty,
+        "reduction_percent": float(target.reduction_percent or 0),
+        "baseline_co2e_kg": baseline,
+        "target_co2e_kg": target_kg,
+        "years": [
+            {"year": int(y), "actual_kg": float(a), "required_kg": float(r)}
+            for y, a, r in zip(years, actual, required)
+        ],
+        "complete_years_through": last_complete,
+        "latest_year": None,
+        "latest_co2e_kg": None,
+        "required_co2e_kg": None,
+        "progress_pct": None,
+        "on_track": None,
+        "projected_hit_year": None,
+    }
+    if not years.size or years[-1] == by:
+        return result
+
+    latest, req = float(actual[-1]), float(required[-1])
+    needed = baseline - req
+    result.update({
+        "latest_year": int(years[-1]),
+        "latest_co2e_kg": latest,
+        "required_co2e_kg": req,
+        "progress_pct": round((baseline - latest) / needed * 100.0, 2) if needed > 0 else None,
+        "on_track": latest <= req,
+        "projected_hit_year": _hit_year(years, actual, target_kg),
+    })
+    return result
+
+
+def org_progress(db: Session, org_id: int, this_year: int | None = None) -> list[dict]:
+    """Progress of every target of the org (one query for targets, yearly totals usually cached)."""
+    targets = (
+        db.query(Target)
+        .filter(Target.org_id == org_id)
+        .order_by(Target.target_year, Target.target_id)
+        .all()
+    )
+    if not targets:
+        return []
+    totals = yearly_totals(db, org_id)
+    year = this_year or date.today().year
+    return [evaluate(t, totals, year) for t in targets]
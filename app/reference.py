@@ -0,0 +1,56 @@
+# app/reference.py
+"""
+Dropdown data for HTML forms.
+
+Activity types and units come from the factor resolver's snapshot (reloaded
+only when the 'factors' version moves); an org's facilities are cached per org
+data version. Rendering a form therefore costs one data_version lookup instead
+of three table reads.
+"""
+import os
+from typing import NamedTuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from . import versions
+from .cache import TTLCache
+from .models import Facility
+from .resolver import TypeInfo, UnitInfo, resolver
+
+_facilities = TTLCache(
+    int(os.getenv("FACILITY_CACHE_SIZE", "10000")),
+    float(os.getenv("FACILITY_CACHE_TTL_SECONDS", "3600")),
+)
+
+
+class FacilityInfo(NamedTuple):
+    facility_id: int
+    name: str
+    location: str | None
+    grid_region_code: str | None
+
+
+def activity_types(db: Session) -> list[TypeInfo]:
+    return list(resolver.activity_types(db).values())
+
+
+def units(db: Session) -> list[UnitInfo]:
+    return list(resolver.units(db).values())
+
+
+def facilities(db: Session, org_id: int) -> list[FacilityInfo]:
+    """Facilities of an org by id, memoized per org data version."""
+    key = (org_id, versions.get(db, versions.org_key(org_id)))
+    rows = _facilities.get(key)
+    if rows is None:
+        rows = [
+            FacilityInfo(*row)
+            for row in db.execute(
+                select(Facility.facility_id, Facility.name, Facility.location, Facility.grid_region_code)
+                .where(Facility.org_id == org_id)
+                .order_by(Facility.facility_id)
+            )
+        ]
+        _facilities.set(key, rows)
+    return rows
@@ -0,0 +1,166 @@
+# app/resolver.py
+"""
+In-process emission factor resolver.
+
+Keeps an index of EmissionFactor by (category, year) and of ActivityType and
+Unit by id.
+Factor writes bump the 'factors' data version; every worker re-reads that number
+at most once per FACTOR_CACHE_CHECK_SECONDS and reloads when it moved, so the
+activity write path normally needs no factor or activity type queries at all.
+"""
+import bisect
+import os
+import threading
+import time
+from decimal import Decimal
+from typing import NamedTuple
+
+from sqlalchemy.orm import Session
+
+from . import versions
+from .models import ActivityType, EmissionFactor, Unit
+
+CHECK_SECONDS = float(os.getenv("FACTOR_CACHE_CHECK_SECONDS", "5"))
+
+# Map ActivityType.code -> EmissionFactor.category
+TYPE_CODE_TO_CATEGORY = {
+    "ELEC_USE": "Electricity",
+    "NAT_GAS": "NaturalGas",
+    "DIESEL": "Diesel",
+    "GASOLINE": "Gasoline",
+    "FREIGHT_TRUCK": "Freight_Truck",
+    "FREIGHT_SHIP": "Freight_Ship",
+    "WASTE": "Waste",
+    "WATER": "Water",
+}
+
+
+def category_for(atype) -> str:
+    """EmissionFactor.category for an ActivityType (falls back to the first word of its label)."""
+    return TYPE_CODE_TO_CATEGORY.get(atype.code) or atype.label.split()[0]
+
+
+class TypeInfo(NamedTuple):
+    activity_type_id: int
+    code: str
+    label: str
+    scope: int | None
+    default_unit_id: int | None
+    category: str
+
+
+class UnitInfo(NamedTuple):
+    unit_id: int
+    code: str
+    description: str | None
+
+
+class FactorInfo(NamedTuple):
+    factor_id: int
+    factor: Decimal
+    year: int | None
+
+
+class _Snapshot(NamedTuple):
+    version: int
+    types: dict            # activity_type_id -> TypeInfo
+    units: dict            # unit_id -> UnitInfo
+    factors: dict          # category -> (sorted years, [FactorInfo per year])
+
+
+class FactorResolver:
+    def __init__(self, check_seconds: float = CHECK_SECONDS):
+        self.check_seconds = check_seconds
+        self._snapshot: _Snapshot | None = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    # -------- loading --------
+    def _load(self, db: Session) -> _Snapshot:
+        version = versions.get(db, versions.FACTORS)
+
+        types = {
+            t.activity_type_id: TypeInfo(
+                t.activity_type_id, t.code, t.label,
+                int(t.scope) if t.scope is not None else None,
+                t.default_unit_id, category_for(t),
+            )
+            for t in db.query(ActivityType).order_by(ActivityType.activity_type_id)
+        }
+        units = {
+            u.unit_id: UnitInfo(u.unit_id, u.code, u.description)
+            for u in db.query(Unit).order_by(Unit.unit_id)
+        }
+
+        # one factor per (category, year); ties go to the oldest row
+        by_year = {}
+        rows = (
+            db.query(EmissionFactor)
+            .order_by(EmissionFactor.category, EmissionFactor.year, EmissionFactor.factor_id.desc())
+            .all()
+        )
+        for f in rows:
+            by_year.setdefault(f.category, {})[f.year] = FactorInfo(
+                f.factor_id, Decimal(str(f.factor or 0)), f.year
+            )
+
+        factors = {}
+        for category, per_year in by_year.items():
+            # undated factors sort before every real year
+            years = sorted(per_year, key=lambda y: -1 if y is None else y)
+            factors[category] = (
+                [-1 if y is None else y for y in years],
+                [per_year[y] for y in years],
+            )
+        return _Snapshot(version, types, units, factors)
+
+    def _current(self, db: Session) -> _Snapshot:
+        snap = self._snapshot
+        now = time.monotonic()
+        if snap is not None and now - self._checked_at < self.check_seconds:
+            return snap
+
+        with self._lock:
+            snap = self._snapshot
+            if snap is not None and time.monotonic() - self._checked_at < self.check_seconds:
+                return snap
+            if snap is None or versions.get(db, versions.FACTORS) != snap.version:
+                snap = self._snapshot = self._load(db)
+            self._checked_at = time.monotonic()
+            return snap
+
+    def invalidate(self) -> None:
+        """Drop this worker's snapshot (other workers notice via the data version)."""
+        with self._lock:
+            self._snapshot = None
+
+    # -------- lookups --------
+    def activity_type(self, db: Session, activity_type_id) -> TypeInfo | None:
+        try:
+            return self._current(db).types.get(int(activity_type_id))
+        except (TypeError, ValueError):
+            return None
+
+    def activity_types(self, db: Session) -> dict:
+        return self._current(db).types
+
+    def units(self, db: Session) -> dict:
+        return self._current(db).units
+
+    def factor(self, db: Session, category: str, year: int | None = None) -> FactorInfo | None:
+        """
+        Newest factor for `category`. With `year`, the newest one not newer than
+        that year, falling back to the newest overall.
+        """
+        entry = self._current(db).factors.get(category)
+        if not entry:
+            return None
+        years, infos = entry
+        if year is not None:
+            idx = bisect.bisect_right(years, year)
+            if idx:
+                return infos[idx - 1]
+        return infos[-1]
+
+
+resolver = FactorResolver()
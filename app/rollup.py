@@ -0,0 +1,181 @@
+# app/rollup.py
+"""
+Incrementally maintained emissions rollup (org x facility x scope x type x month).
+
+Activity writes call add_activities() / remove_activities() inside their own
+transaction, so the rollup commits (or rolls back) together with activity_log.
+`python -m app.rollup` regenerates it from scratch.
+"""
+import argparse
+import os
+from collections import defaultdict
+from decimal import Decimal
+
+from sqlalchemy import Integer, cast, delete, extract, func, insert, literal, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from . import versions
+from .bulk import upsert
+from .cache import TTLCache
+from .models import ActivityLog, ActivityType, EmissionRollup, Organization
+
+ROLLUP = EmissionRollup.__table__
+KEY_COLUMNS = ["org_id", "facility_id", "scope", "activity_type_id", "period_year", "period_month"]
+
+# org totals memoized per (org, org data version); entries of an old version
+# are simply never asked for again and age out
+_org_totals = TTLCache(
+    int(os.getenv("ORG_TOTAL_CACHE_SIZE", "10000")),
+    float(os.getenv("ORG_TOTAL_CACHE_TTL_SECONDS", "3600")),
+)
+
+
+def rollup_key(org_id: int, facility_id: int, scope, activity_type_id, activity_date) -> tuple:
+    return (
+        org_id,
+        facility_id,
+        int(scope or 0),
+        activity_type_id or 0,
+        activity_date.year if activity_date else 0,
+        activity_date.month if activity_date else 0,
+    )
+
+
+def _apply(db: Session, entries, sign: int) -> None:
+    """entries: iterable of (key tuple, co2e_kg, quantity)."""
+    deltas = defaultdict(lambda: [Decimal("0"), Decimal("0"), 0])
+    for key, co2e, qty in entries:
+        d = deltas[key]
+        d[0] += Decimal(str(co2e or 0))
+        d[1] += Decimal(str(qty or 0))
+        d[2] += 1
+
+    rows = [
+        {
+            **dict(zip(KEY_COLUMNS, key)),
+            "co2e_kg": sign * co2e,
+            "quantity": sign * qty,
+            "row_count": sign * count,
+        }
+        for key, (co2e, qty, count) in deltas.items()
+    ]
+    upsert(db, ROLLUP, rows, KEY_COLUMNS, increment=["co2e_kg", "quantity", "row_count"])
+
+    if sign < 0:
+        # drop buckets whose last activity was just removed
+        for key in deltas:
+            db.execute(
+                delete(ROLLUP).where(
+                    *(ROLLUP.c[k] == v for k, v in zip(KEY_COLUMNS, key)),
+                    ROLLUP.c.row_count <= 0,
+                )
+            )
+
+
+def add_activities(db: Session, entries) -> None:
+    _apply(db, entries, 1)
+
+
+def remove_activities(db: Session, entries) -> None:
+    _apply(db, entries, -1)
+
+
+def drop_facility(db: Session, facility_id: int) -> None:
+    """Remove all buckets of a facility that is being deleted."""
+    db.execute(delete(ROLLUP).where(ROLLUP.c.facility_id == facility_id))
+
+
+def rebuild(db: Session, org_id: int | None = None) -> None:
+    """Regenerate the rollup (for one org, or everything) with one INSERT ... SELECT."""
+    wipe = delete(ROLLUP)
+    if org_id is not None:
+        wipe = wipe.where(ROLLUP.c.org_id == org_id)
+    db.execute(wipe)
+
+    year = func.coalesce(cast(extract("year", ActivityLog.activity_date), Integer), 0)
+    month = func.coalesce(cast(extract("month", ActivityLog.activity_date), Integer), 0)
+    scope = func.coalesce(ActivityType.scope, 0)
+    type_id = func.coalesce(ActivityLog.activity_type_id, 0)
+
+    source = (
+        select(
+            ActivityLog.org_id,
+            ActivityLog.facility_id,
+            scope,
+            type_id,
+            year,
+            month,
+            func.coalesce(func.sum(ActivityLog.co2e_kg), 0),
+            func.coalesce(func.sum(ActivityLog.quantity), 0),
+            func.count(),
+        )
+        .select_from(ActivityLog)
+        .outerjoin(ActivityType, ActivityType.activity_type_id == ActivityLog.activity_type_id)
+        .group_by(ActivityLog.org_id, ActivityLog.facility_id, scope, type_id, year, month)
+    )
+    if org_id is not None:
+        source = source.where(ActivityLog.org_id == org_id)
+
+    db.execute(
+        insert(ROLLUP).from_select(
+            KEY_COLUMNS + ["co2e_kg", "quantity", "row_count"], source
+        )
+    )
+
+    org_ids = [org_id] if org_id is not None else db.scalars(select(Organization.org_id)).all()
+    for oid in org_ids:
+        versions.bump(db, versions.org_key(oid))
+
+
+# ---------------------------------------------------------------
+# Read helpers
+# ---------------------------------------------------------------
+def total_co2e_stmt(org_id: int, start_year: int | None = None, end_year: int | None = None):
+    """Sum of co2e_kg for an org, optionally limited to an inclusive year range."""
+    q = select(func.coalesce(func.sum(ROLLUP.c.co2e_kg), literal(0))).where(ROLLUP.c.org_id == org_id)
+    if start_year is not None:
+        q = q.where(ROLLUP.c.period_year >= start_year)
+    if end_year is not None:
+        q = q.where(ROLLUP.c.period_year <= end_year, ROLLUP.c.period_year > 0)
+    return q
+
+
+def total_co2e(db: Session, org_id: int, start_year: int | None = None, end_year: int | None = None) -> Decimal:
+    return Decimal(str(db.execute(total_co2e_stmt(org_id, start_year, end_year)).scalar() or 0))
+
+
+def org_total_co2e(db: Session, org_id: int) -> Decimal:
+    """All-time total of an org; one primary-key lookup while its data is unchanged."""
+    key = (org_id, versions.get(db, versions.org_key(org_id)))
+    total = _org_totals.get(key)
+    if total is None:
+        total = total_co2e(db, org_id)
+        _org_totals.set(key, total)
+    return total
+
+
+async def total_co2e_async(db: AsyncSession, org_id: int, start_year: int | None = None, end_year: int | None = None) -> Decimal:
+    result = await db.execute(total_co2e_stmt(org_id, start_year, end_year))
+    return Decimal(str(result.scalar() or 0))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Rebuild the emission_rollup table.")
+    parser.add_argument("--org", type=int, default=None, help="only rebuild this org_id")
+    args = parser.parse_args()
+
+    from .database import SessionLocal, get_engine
+
+    ROLLUP.create(bind=get_engine(), checkfirst=True)
+    db = SessionLocal()
+    try:
+        rebuild(db, args.org)
+        db.commit()
+    finally:
+        db.close()
+    print("emission_rollup rebuilt" + (f" for org {args.org}" if args.org else ""))
+
+
+if __name__ == "__main__":
+    main()
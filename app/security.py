@@ -1,42 +1,69 @@
 # app/security.py
 import os
+import time
 from datetime import datetime, timedelta
-from typing import Any, Dict
+from typing import Any, Dict, NamedTuple
 
-import bcrypt
 from jose import jwt, JWTError
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, Request, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from .database import get_db
+from . import passwords
+from .cache import TTLCache
+from .database import get_async_db, get_db
 from .models import User
+from .settings import get_settings
 
-SECRET_KEY = os.getenv("SECRET_KEY")
-ALGORITHM = os.getenv("ALGORITHM", "HS256")
-ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "60"))
-MAX_BCRYPT_BYTES = 72
-
-if not SECRET_KEY:
-    raise RuntimeError("SECRET_KEY is not set. Put it in your .env file.")
+MAX_BCRYPT_BYTES = passwords.MAX_BCRYPT_BYTES
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# Synchronous helpers for scripts; request handlers use the bounded pool in app.passwords
 def hash_password(password: str) -> str:
-    password_bytes = password.encode("utf-8")[:MAX_BCRYPT_BYTES]
-    hashed = bcrypt.hashpw(password_bytes, bcrypt.gensalt())
-    return hashed.decode("utf-8")
+    return passwords._hash(password, passwords.BCRYPT_ROUNDS)
 
 def verify_password(password: str, hashed: str) -> bool:
-    return bcrypt.checkpw(password.encode("utf-8")[:MAX_BCRYPT_BYTES], hashed.encode("utf-8"))
+    return passwords._verify(password, hashed)
+
+def _signing_key() -> str:
+    # read when first needed; the app's startup has already checked it is set
+    secret_key = get_settings().secret_key
+    if not secret_key:
+        raise RuntimeError("SECRET_KEY is not set. Put it in your .env file.")
+    return secret_key
 
 def create_access_token(data: Dict[str, Any], expires_minutes: int | None = None) -> str:
+    settings = get_settings()
     to_encode = data.copy()
-    expire = datetime.utcnow() + timedelta(minutes=expires_minutes or ACCESS_TOKEN_EXPIRE_MINUTES)
+    expire = datetime.utcnow() + timedelta(minutes=expires_minutes or settings.access_token_expire_minutes)
     to_encode.update({"exp": expire})
-    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    return jwt.encode(to_encode, _signing_key(), algorithm=settings.algorithm)
 
-def get_current_user(request: Request, db: Session = Depends(get_db)) -> User:
+# ---------------------------
+# Authenticated principals
+# ---------------------------
+# Verified token claims and the (user_id, org_id, role) they resolve to are
+# cached per token for a short TTL, so most requests skip both the JWT
+# verification and the SELECT on "user". Profile/org writes evict entries
+# in this worker; other workers pick changes up when the TTL runs out.
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "60"))
+
+
+class Principal(NamedTuple):
+    user_id: int
+    org_id: int | None
+    role: str | None
+
+
+_claims_cache = TTLCache(PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL_SECONDS)
+_principal_cache = TTLCache(PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL_SECONDS)
+
+
+def _token_from_request(request: Request) -> str:
     # 1) Try cookie set by /api/auth/login
     token = None
     cookie_val = request.cookies.get("access_token")
@@ -51,14 +78,92 @@ def get_current_user(request: Request, db: Session = Depends(get_db)) -> User:
 
     if not token:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
+    return token
+
+
+def _verified_claims(token: str) -> Dict[str, Any]:
+    claims = _claims_cache.get(token)
+    if claims is not None:
+        return claims
 
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id = int(payload.get("sub"))
+        claims = jwt.decode(token, _signing_key(), algorithms=[get_settings().algorithm])
+        int(claims.get("sub"))
     except (JWTError, ValueError, TypeError):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials")
 
-    user = db.query(User).filter(User.user_id == user_id).first()
+    exp = claims.get("exp")
+    max_age = exp - time.time() if isinstance(exp, (int, float)) else None
+    _claims_cache.set(token, claims, max_age)
+    return claims
+
+
+def get_token_claims(request: Request) -> Dict[str, Any]:
+    """Lightweight dependency: a verified token, no database access."""
+    return _verified_claims(_token_from_request(request))
+
+
+def _cache_principal(token: str, claims: Dict[str, Any], row) -> Principal:
+    if not row:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+
+    principal = Principal(row.user_id, row.org_id, row.role)
+    exp = claims.get("exp")
+    max_age = exp - time.time() if isinstance(exp, (int, float)) else None
+    _principal_cache.set(token, principal, max_age)
+    return principal
+
+
+def _principal_stmt(claims: Dict[str, Any]):
+    return select(User.user_id, User.org_id, User.role).where(User.user_id == int(claims["sub"]))
+
+
+def get_principal(request: Request, db: Session = Depends(get_db)) -> Principal:
+    """user_id / org_id / role of the caller, cached per token."""
+    token = _token_from_request(request)
+    principal = _principal_cache.get(token)
+    if principal is not None:
+        return principal
+
+    claims = _verified_claims(token)
+    return _cache_principal(token, claims, db.execute(_principal_stmt(claims)).first())
+
+
+async def get_principal_async(request: Request, db: AsyncSession = Depends(get_async_db)) -> Principal:
+    """get_principal for async routes: no threadpool hop, shares the route's AsyncSession."""
+    token = _token_from_request(request)
+    principal = _principal_cache.get(token)
+    if principal is not None:
+        return principal
+
+    claims = _verified_claims(token)
+    result = await db.execute(_principal_stmt(claims))
+    return _cache_principal(token, claims, result.first())
+
+
+def require_role(*roles: str):
+    """Dependency: the caller's Principal, or 403 unless their role is one of `roles`."""
+    def check(principal: Principal = Depends(get_principal)) -> Principal:
+        if principal.role not in roles:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not allowed for your role")
+        return principal
+    return check
+
+
+def invalidate_user(user_id: int) -> None:
+    """Forget cached principals of a user (call after changing their profile/org)."""
+    _principal_cache.discard_where(lambda p: p.user_id == user_id)
+
+
+def invalidate_org(org_id: int) -> None:
+    """Forget cached principals of every member of an org."""
+    _principal_cache.discard_where(lambda p: p.org_id == org_id)
+
+
+def get_current_user(request: Request, db: Session = Depends(get_db)) -> User:
+    """The full User row, for the few routes that read or edit profile fields."""
+    claims = _verified_claims(_token_from_request(request))
+    user = db.get(User, int(claims["sub"]))
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
-    return user
\ No newline at end of file
+    return user
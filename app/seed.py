@@ -1,6 +1,36 @@
 # app/seed.py
+"""
+Reference data seeding (emission factors, units, activity types).
+
+Runs on every startup and is normally one query: the checksum of the seed data
+below is compared with the one stored in seed_state, and nothing else happens
+when they match. Otherwise one worker at a time (Postgres advisory lock, MySQL
+GET_LOCK) inserts the missing rows with one bulk upsert per table, bumps the
+factors version and stores the new checksum, all in a single transaction.
+Rows that already exist are left alone, so edits and imports are never undone.
+"""
+import hashlib
+import json
+import logging
+import os
+from contextlib import contextmanager
+from datetime import datetime
+
+from sqlalchemy import inspect, select, text
 from sqlalchemy.orm import Session
-from .models import EmissionFactor, Unit, ActivityType
+
+from . import versions
+from .bulk import upsert
+from .factor_import import KEY_COLUMNS as FACTOR_KEY
+from .models import ActivityType, EmissionFactor, SeedState, Unit
+from .resolver import resolver
+
+log = logging.getLogger(__name__)
+
+SEED_LOCK_TIMEOUT_SECONDS = int(os.getenv("SEED_LOCK_TIMEOUT_SECONDS", "60"))
+SEED_NAME = "reference"
+SEED_LOCK_KEY = 0x5EED0001           # pg_advisory_xact_lock key
+SEED_LOCK_NAME = "dbproject.seed"    # MySQL GET_LOCK name
 
 # NOTE: These numbers are conservative placeholders so the app works end-to-end.
 # Replace with official values when you import EPA eGRID / DEFRA CSVs later.
@@ -29,70 +59,155 @@ STARTER_FACTORS = [
     {"source": "GLEC 2023 (starter)",  "category": "Freight_Truck", "unit": "kgCO2e/ton-mile", "factor": 0.16, "year": 2023},
 ]
 
-def _ensure_factor(db: Session, row: dict) -> None:
-    exists = (
-        db.query(EmissionFactor)
-          .filter(
-              EmissionFactor.source == row["source"],
-              EmissionFactor.category == row["category"],
-              EmissionFactor.unit == row["unit"],
-              EmissionFactor.year == row["year"],
-          )
-          .first()
+UNITS = [
+    {"code": "kWh", "description": "Kilowatt-hour"},
+    {"code": "therm", "description": "Therm (natural gas)"},
+    {"code": "gal", "description": "US gallon"},
+    {"code": "L", "description": "Liter"},
+    {"code": "kg", "description": "Kilogram"},
+    {"code": "ton-mile", "description": "Ton-mile of freight"},
+    {"code": "km", "description": "Kilometer"},
+    {"code": "mi", "description": "Mile"},
+    {"code": "kgCO2e", "description": "Kilogram CO₂ equivalent"},
+    {"code": "MWh", "description": "Megawatt-hour"},
+]
+
+# default_unit is a Unit.code, resolved to its id when seeding
+ACTIVITY_TYPES = [
+    {"code": "ELEC_USE", "label": "Electricity Use", "scope": 2, "default_unit": "kWh"},
+    {"code": "NAT_GAS", "label": "Natural Gas", "scope": 1, "default_unit": "therm"},
+    {"code": "DIESEL", "label": "Diesel Fuel", "scope": 1, "default_unit": "gal"},
+    {"code": "GASOLINE", "label": "Gasoline Fuel", "scope": 1, "default_unit": "gal"},
+    {"code": "AIR_TRAVEL", "label": "Air Travel (Commercial)", "scope": 3, "default_unit": "km"},
+    {"code": "FREIGHT_TRUCK", "label": "Freight Transport (Truck)", "scope": 3, "default_unit": "ton-mile"},
+    {"code": "FREIGHT_SHIP", "label": "Freight Transport (Ship)", "scope": 3, "default_unit": "ton-mile"},
+    {"code": "WASTE", "label": "Waste Disposal", "scope": 3, "default_unit": "kg"},
+    {"code": "WATER", "label": "Water Usage", "scope": 3, "default_unit": "L"},
+]
+
+
+def checksum() -> str:
+    data = {"factors": STARTER_FACTORS, "units": UNITS, "activity_types": ACTIVITY_TYPES}
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()
+
+
+# ---------------------------------------------------------------
+# Per-table upserts (no commit; seed_all owns the transaction)
+# ---------------------------------------------------------------
+def seed_emission_factors(db: Session, rows: list[dict] = STARTER_FACTORS) -> None:
+    """Insert the (source, category, unit, year) combos that are missing."""
+    upsert(db, EmissionFactor.__table__, rows, FACTOR_KEY)
+
+
+def seed_units(db: Session, rows: list[dict] = UNITS) -> None:
+    upsert(db, Unit.__table__, rows, ["code"])
+
+
+def seed_activity_types(db: Session, rows: list[dict] = ACTIVITY_TYPES) -> None:
+    """Run after seed_units: default units are looked up by code."""
+    unit_ids = dict(db.execute(select(Unit.code, Unit.unit_id)).all())
+    upsert(
+        db,
+        ActivityType.__table__,
+        [
+            {
+                "code": r["code"],
+                "label": r["label"],
+                "scope": r["scope"],
+                "default_unit_id": unit_ids.get(r["default_unit"]),
+            }
+            for r in rows
+        ],
+        ["code"],
     )
-    if not exists:
-        db.add(EmissionFactor(
-            source=row["source"],
-            category=row["category"],
-            unit=row["unit"],
-            factor=row["factor"],
-            year=row["year"],
-        ))
-
-def seed_emission_factors(db: Session) -> None:
-    """Idempotent: insert only if (source, category, unit, year) combo is missing."""
-    for row in STARTER_FACTORS:
-        _ensure_factor(db, row)
-    db.commit()
-
-def seed_all(db: Session) -> None:
-    """Called once on startup."""
-    seed_emission_factors(db)
-    seed_units(db)
-    seed_activity_types(db)
-
-def seed_units(db):
-    units = [
-        {"code": "kWh", "description": "Kilowatt-hour"},
-        {"code": "therm", "description": "Therm (natural gas)"},
-        {"code": "gal", "description": "US gallon"},
-        {"code": "L", "description": "Liter"},
-        {"code": "kg", "description": "Kilogram"},
-        {"code": "ton-mile", "description": "Ton-mile of freight"},
-        {"code": "km", "description": "Kilometer"},
-        {"code": "mi", "description": "Mile"},
-        {"code": "kgCO2e", "description": "Kilogram CO₂ equivalent"},
-        {"code": "MWh", "description": "Megawatt-hour"},
-    ]
-    for row in units:
-        if not db.query(Unit).filter_by(code=row["code"]).first():
-            db.add(Unit(**row))
-    db.commit()
-
-def seed_activity_types(db):
-    unit_lookup = {u.code: u.unit_id for u in db.query(Unit).all()}
-    types = [
-        {"code": "ELEC_USE", "label": "Electricity Use", "scope": "2", "default_unit_id": unit_lookup.get("kWh")},
-        {"code": "NAT_GAS", "label": "Natural Gas", "scope": "1", "default_unit_id": unit_lookup.get("therm")},
-        {"code": "DIESEL", "label": "Diesel Fuel", "scope": "1", "default_unit_id": unit_lookup.get("gal")},
-        {"code": "GASOLINE", "label": "Gasoline Fuel", "scope": "1", "default_unit_id": unit_lookup.get("gal")},
-        {"code": "AIR_TRAVEL", "label": "Air Travel (Commercial)", "scope": "3", "default_unit_id": unit_lookup.get("km")},
-        {"code": "FREIGHT_TRUCK", "label": "Freight Transport (Truck)", "scope": "3", "default_unit_id": unit_lookup.get("ton-mile")},
-        {"code": "FREIGHT_SHIP", "label": "Freight Transport (Ship)", "scope": "3", "default_unit_id": unit_lookup.get("ton-mile")},
-        {"code": "WASTE", "label": "Waste Disposal", "scope": "3", "default_unit_id": unit_lookup.get("kg")},
-        {"code": "WATER", "label": "Water Usage", "scope": "3", "default_unit_id": unit_lookup.get("L")},
-    ]
-    for row in types:
-        if not db.query(ActivityType).filter_by(code=row["code"]).first():
-            db.add(ActivityType(**row))
-    db.commit()
+
+
+# ---------------------------------------------------------------
+# Seeding
+# ---------------------------------------------------------------
+def _stored_checksum(db: Session, for_update: bool = False) -> str | None:
+    stmt = select(SeedState.checksum).where(SeedState.name == SEED_NAME)
+    if for_update:
+        stmt = stmt.with_for_update()
+    return db.execute(stmt).scalar()
+
+
+@contextmanager
+def _seed_lock(db: Session):
+    """Serialize seeding across workers (SQLite already serializes writers)."""
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        # released by the commit/rollback
+        db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": SEED_LOCK_KEY})
+        yield
+    elif dialect == "mysql":
+        # GET_LOCK belongs to a connection, not a transaction: hold it on one of
+        # its own and release it only after the seeding transaction has committed
+        with db.get_bind().connect() as conn:
+            got = conn.execute(
+                text("SELECT GET_LOCK(:name, :timeout)"),
+                {"name": SEED_LOCK_NAME, "timeout": SEED_LOCK_TIMEOUT_SECONDS},
+            ).scalar()
+            if got != 1:
+                raise RuntimeError("Timed out waiting for another worker to finish seeding")
+            try:
+                yield
+            finally:
+                conn.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": SEED_LOCK_NAME})
+    else:
+        yield
+
+
+def seed_all(db: Session) -> bool:
+    """Seed reference data unless the stored checksum is current; True when it ran."""
+    digest = checksum()
+    if _stored_checksum(db) == digest:
+        db.rollback()
+        return False
+
+    with _seed_lock(db):
+        try:
+            # another worker may have finished while we waited for the lock
+            if _stored_checksum(db, for_update=True) == digest:
+                db.rollback()
+                return False
+
+            seed_units(db)
+            seed_activity_types(db)
+            seed_emission_factors(db)
+            # the factor resolver caches units and activity types alongside factors
+            versions.bump(db, versions.FACTORS)
+            upsert(
+                db,
+                SeedState.__table__,
+                [{"name": SEED_NAME, "checksum": digest, "applied_at": datetime.utcnow()}],
+                ["name"],
+                update=["checksum", "applied_at"],
+            )
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+    resolver.invalidate()
+    return True
+
+
+def seed_on_startup() -> None:
+    """
+    Startup hook of the web app (skipped when SEED_ON_STARTUP=0).
+
+    The schema comes from `python -m app.migrations`; on a database that has
+    not been migrated yet seeding is skipped with a warning instead of
+    stopping the server.
+    """
+    from .database import SessionLocal
+
+    with SessionLocal() as db:
+        if not inspect(db.get_bind()).has_table(SeedState.__tablename__):
+            log.warning(
+                "%s table is missing; reference data not seeded (run python -m app.migrations)",
+                SeedState.__tablename__,
+            )
+            return
+        seed_all(db)
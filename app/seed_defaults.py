@@ -1,27 +1,28 @@
-def seed_defaults(db):
-    from app.models import Unit, ActivityType
+# app/seed_defaults.py
+"""Minimal reference data for a bare database; app/seed.py has the full set."""
+from sqlalchemy.orm import Session
 
-    units = [
-        ("kWh", "Electricity kilowatt-hour"),
-        ("therm", "Natural Gas"),
-        ("gal", "Liquid fuel gallons"),
-        ("m3", "Water cubic meters")
-    ]
+from . import versions
+from .seed import seed_activity_types, seed_units
 
-    for code, desc in units:
-        if not db.query(Unit).filter_by(code=code).first():
-            db.add(Unit(code=code, description=desc))
+UNITS = [
+    {"code": "kWh", "description": "Electricity kilowatt-hour"},
+    {"code": "therm", "description": "Natural Gas"},
+    {"code": "gal", "description": "Liquid fuel gallons"},
+    {"code": "m3", "description": "Water cubic meters"},
+]
 
-    types = [
-        ("electricity", "Electricity", 2, "kWh"),
-        ("natural_gas", "Natural Gas", 1, "therm"),
-        ("diesel", "Diesel Fuel", 1, "gal"),
-        ("water", "Water Usage", 3, "m3"),
-    ]
+ACTIVITY_TYPES = [
+    {"code": "electricity", "label": "Electricity", "scope": 2, "default_unit": "kWh"},
+    {"code": "natural_gas", "label": "Natural Gas", "scope": 1, "default_unit": "therm"},
+    {"code": "diesel", "label": "Diesel Fuel", "scope": 1, "default_unit": "gal"},
+    {"code": "water", "label": "Water Usage", "scope": 3, "default_unit": "m3"},
+]
 
-    for code, label, scope, unit_code in types:
-        default_unit = db.query(Unit).filter_by(code=unit_code).first()
-        if not db.query(ActivityType).filter_by(code=code).first():
-            db.add(ActivityType(code=code, label=label, scope=scope, default_unit_id=default_unit.unit_id))
 
+def seed_defaults(db: Session) -> None:
+    """Insert whichever of these units and activity types are missing (one upsert each)."""
+    seed_units(db, UNITS)
+    seed_activity_types(db, ACTIVITY_TYPES)
+    versions.bump(db, versions.FACTORS)
     db.commit()
@@ -0,0 +1,99 @@
+# app/settings.py
+"""
+Typed application settings.
+
+Settings.from_env() reads the environment (and the .env file at the project
+root, if there is one) the first time get_settings() is called, not at import.
+create_app(settings) installs its own Settings with configure(); the database
+engine and token signing read them from here when they are first needed.
+Nothing is validated on import: validate() runs in the app's startup, so a
+missing DATABASE_URL or SECRET_KEY stops the server before it accepts
+traffic instead of breaking every module that imports app.database.
+
+create_app() reads its settings before importing the routers, so the .env
+file is loaded in time for the knobs other modules read at import. Spawned job
+workers inherit that environment; CLI scripts build their Settings from it.
+"""
+import os
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+
+ENV_FILE = Path(__file__).resolve().parents[1] / ".env"
+
+
+def _flag(value: str) -> bool:
+    return value.lower() in ("1", "true", "yes")
+
+
+@dataclass(frozen=True)
+class Settings:
+    database_url: str | None = None
+    async_database_url: str | None = None      # derived from database_url when unset
+
+    secret_key: str | None = None
+    algorithm: str = "HS256"
+    access_token_expire_minutes: int = 60
+
+    # connection pool (see app/database.py)
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_recycle: int = 1800
+    db_pool_timeout: float = 30.0
+    db_pool_fail_fast: bool = False
+    db_pool_ping_idle_seconds: float = 60.0
+    db_pool_warm: int = 2                       # connections opened per pool at startup
+
+    seed_on_startup: bool = True
+
+    @classmethod
+    def from_env(cls, env=None, env_file: Path | None = ENV_FILE) -> "Settings":
+        if env is None:
+            if env_file is not None and env_file.is_file():
+                from dotenv import load_dotenv
+
+                load_dotenv(env_file)
+            env = os.environ
+        return cls(
+            database_url=env.get("DATABASE_URL") or None,
+            async_database_url=env.get("ASYNC_DATABASE_URL") or None,
+            secret_key=env.get("SECRET_KEY") or None,
+            algorithm=env.get("ALGORITHM", "HS256"),
+            access_token_expire_minutes=int(env.get("ACCESS_TOKEN_EXPIRE_MINUTES", "60")),
+            db_pool_size=int(env.get("DB_POOL_SIZE", "5")),
+            db_max_overflow=int(env.get("DB_MAX_OVERFLOW", "10")),
+            db_pool_recycle=int(env.get("DB_POOL_RECYCLE", "1800")),
+            db_pool_timeout=float(env.get("DB_POOL_TIMEOUT", "30")),
+            db_pool_fail_fast=_flag(env.get("DB_POOL_FAIL_FAST", "0")),
+            db_pool_ping_idle_seconds=float(env.get("DB_POOL_PING_IDLE_SECONDS", "60")),
+            db_pool_warm=int(env.get("DB_POOL_WARM", "2")),
+            seed_on_startup=_flag(env.get("SEED_ON_STARTUP", "1")),
+        )
+
+    def validate(self) -> None:
+        if not self.database_url:
+            raise RuntimeError(
+                "DATABASE_URL is not set. Put it in a .env file at project root or set it in the environment."
+            )
+        if not self.secret_key:
+            raise RuntimeError("SECRET_KEY is not set. Put it in your .env file.")
+
+
+_settings: Settings | None = None
+_lock = threading.Lock()
+
+
+def get_settings() -> Settings:
+    global _settings
+    if _settings is None:
+        with _lock:
+            if _settings is None:
+                _settings = Settings.from_env()
+    return _settings
+
+
+def configure(settings: Settings) -> None:
+    """Install `settings` for this process (before the engine is first used)."""
+    global _settings
+    with _lock:
+        _settings = settings
@@ -0,0 +1,47 @@
+# app/templating.py
+"""
+The one Jinja2 environment every page renders with.
+
+Compiled templates are kept in a filesystem bytecode cache (shared by all
+workers and kept across restarts) and precompile() loads every template at
+startup, so the first request to a page neither parses nor compiles anything.
+"""
+import os
+import tempfile
+
+from fastapi.templating import Jinja2Templates
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+
+from .assets import static_url
+
+TEMPLATE_DIR = os.getenv("TEMPLATE_DIR", "app/templates")
+TEMPLATE_CACHE_DIR = os.getenv(
+    "TEMPLATE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "dbproject-jinja-cache")
+)
+# re-stat template files on every render; turn off in production
+TEMPLATE_AUTO_RELOAD = os.getenv("TEMPLATE_AUTO_RELOAD", "1") == "1"
+
+
+def _bytecode_cache() -> FileSystemBytecodeCache | None:
+    try:
+        os.makedirs(TEMPLATE_CACHE_DIR, exist_ok=True)
+    except OSError:
+        return None     # read-only filesystem: compile in memory only
+    return FileSystemBytecodeCache(TEMPLATE_CACHE_DIR)
+
+
+env = Environment(
+    loader=FileSystemLoader(TEMPLATE_DIR),
+    autoescape=True,
+    bytecode_cache=_bytecode_cache(),
+    auto_reload=TEMPLATE_AUTO_RELOAD,
+    cache_size=-1,      # never evict a compiled template
+)
+env.globals["static_url"] = static_url
+templates = Jinja2Templates(env=env)
+
+
+def precompile() -> None:
+    """Load (and compile, or read from the bytecode cache) every template."""
+    for name in env.list_templates(extensions=["html"]):
+        env.get_template(name)
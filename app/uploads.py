@@ -0,0 +1,219 @@
+# app/uploads.py
+"""
+Streaming, content-addressed storage for uploaded files.
+
+The multipart body is parsed straight off the request stream; file bytes are
+collected into UPLOAD_CHUNK_BYTES pieces that a worker thread hashes (SHA-256)
+and appends to a temp file, so neither the event loop nor memory ever holds
+more than one chunk. An upload is refused with 413 as soon as it passes
+UPLOAD_MAX_BYTES.
+
+Finished files live at blobs/<aa>/<bb>/<sha256>: identical uploads are stored
+once and shared by every UploadedFile row with that sha256, and a blob is
+removed when the last row pointing at it is deleted.
+"""
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+from typing import NamedTuple
+
+from fastapi import Request
+from starlette.concurrency import run_in_threadpool
+
+try:
+    import python_multipart as multipart
+    from python_multipart.exceptions import FormParserError
+    from python_multipart.multipart import parse_options_header
+except ModuleNotFoundError:  # python-multipart < 0.0.13
+    import multipart
+    from multipart.exceptions import FormParserError
+    from multipart.multipart import parse_options_header
+
+UPLOAD_ROOT = Path(os.getenv("UPLOAD_DIR", "uploads"))
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(4 * 1024 ** 3)))
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(1024 * 1024)))
+MAX_FIELD_BYTES = 64 * 1024
+MULTIPART_OVERHEAD = 64 * 1024      # boundaries, part headers and form fields
+
+BLOB_DIR = UPLOAD_ROOT / "blobs"
+TMP_DIR = UPLOAD_ROOT / "tmp"
+
+
+class UploadError(Exception):
+    status_code = 400
+
+
+class UploadTooLarge(UploadError):
+    status_code = 413
+
+
+class StoredFile(NamedTuple):
+    sha256: str
+    size: int
+    filename: str
+    content_type: str | None
+    temp_path: str          # moved into place by place()
+
+
+def blob_path(sha256: str) -> Path:
+    return BLOB_DIR / sha256[:2] / sha256[2:4] / sha256
+
+
+# ---------------------------------------------------------------
+# Writing
+# ---------------------------------------------------------------
+class _BlobWriter:
+    def __init__(self, max_bytes: int):
+        TMP_DIR.mkdir(parents=True, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(dir=TMP_DIR, suffix=".part")
+        self.fh = os.fdopen(fd, "wb")
+        self.sha = hashlib.sha256()
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.pending = bytearray()
+
+    def feed(self, data: bytes) -> None:
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            raise UploadTooLarge(f"File exceeds the {self.max_bytes} byte upload limit")
+        self.pending += data
+
+    def flush(self) -> None:
+        """Hash and write the buffered bytes (blocking; run in a worker thread)."""
+        data, self.pending = self.pending, bytearray()
+        self.sha.update(data)
+        self.fh.write(data)
+
+    def finish(self) -> str:
+        self.flush()
+        self.fh.close()
+        return self.sha.hexdigest()
+
+    def discard(self) -> None:
+        self.fh.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+def place(stored: StoredFile) -> Path:
+    """Move a received file to its blob path (or drop it when the blob exists)."""
+    dest = blob_path(stored.sha256)
+    if dest.exists():
+        os.remove(stored.temp_path)
+    else:
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(stored.temp_path, dest)
+    return dest
+
+
+def discard(stored: StoredFile) -> None:
+    try:
+        os.remove(stored.temp_path)
+    except OSError:
+        pass
+
+
+def remove(path: str) -> None:
+    """Delete a stored file; call once no UploadedFile row points at it."""
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+# ---------------------------------------------------------------
+# Receiving
+# ---------------------------------------------------------------
+async def receive(request: Request, file_field: str = "file", max_bytes: int = UPLOAD_MAX_BYTES):
+    """
+    Parse a multipart/form-data request with exactly one file part.
+
+    Returns ({field: value} of the other parts, StoredFile); the file is left
+    in the temp dir until place() or discard().
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise UploadError("Expected a multipart/form-data upload")
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > max_bytes + MULTIPART_OVERHEAD:
+        raise UploadTooLarge(f"File exceeds the {max_bytes} byte upload limit")
+
+    fields: dict = {}
+    part = {"headers": {}, "field": None, "value": bytearray()}
+    header_field = bytearray()
+    header_value = bytearray()
+    file_info: dict = {}
+    writer: _BlobWriter | None = None
+
+    def on_part_begin():
+        part.update(headers={}, field=None, value=bytearray())
+
+    def on_header_field(data, start, end):
+        header_field.extend(data[start:end])
+
+    def on_header_value(data, start, end):
+        header_value.extend(data[start:end])
+
+    def on_header_end():
+        part["headers"][bytes(header_field).lower()] = bytes(header_value)
+        header_field.clear()
+        header_value.clear()
+
+    def on_headers_finished():
+        nonlocal writer
+        _, disposition = parse_options_header(part["headers"].get(b"content-disposition", b""))
+        name = disposition.get(b"name", b"").decode("utf-8", "replace")
+        part["field"] = name
+        if b"filename" in disposition:
+            if name != file_field or writer is not None:
+                raise UploadError(f"Expected exactly one file, in the '{file_field}' field")
+            file_info["filename"] = disposition[b"filename"].decode("utf-8", "replace")
+            file_info["content_type"] = part["headers"].get(b"content-type", b"").decode("latin-1") or None
+            writer = _BlobWriter(max_bytes)
+
+    def on_part_data(data, start, end):
+        if part["field"] == file_field and writer is not None:
+            writer.feed(data[start:end])
+        else:
+            part["value"].extend(data[start:end])
+            if len(part["value"]) > MAX_FIELD_BYTES:
+                raise UploadError(f"Form field '{part['field']}' is too large")
+
+    def on_part_end():
+        if part["field"] != file_field:
+            fields[part["field"]] = part["value"].decode("utf-8", "replace")
+
+    parser = multipart.MultipartParser(params[b"boundary"], {
+        "on_part_begin": on_part_begin,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+    })
+
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            if writer is not None and len(writer.pending) >= UPLOAD_CHUNK_BYTES:
+                await run_in_threadpool(writer.flush)
+        parser.finalize()
+        if writer is None:
+            raise UploadError(f"No file in the '{file_field}' field")
+        sha256 = await run_in_threadpool(writer.finish)
+    except FormParserError:
+        if writer is not None:
+            await run_in_threadpool(writer.discard)
+        raise UploadError("Malformed multipart body")
+    except Exception:
+        if writer is not None:
+            await run_in_threadpool(writer.discard)
+        raise
+
+    return fields, StoredFile(
+        sha256, writer.size, file_info["filename"], file_info["content_type"], writer.path
+    )
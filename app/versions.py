@@ -0,0 +1,40 @@
+# app/versions.py
+"""
+Shared version counters (data_version table).
+
+Writers bump a key in the same transaction as their change; caches in every
+worker compare the stored number with the one they loaded and reload on mismatch.
+"""
+from datetime import datetime
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from .bulk import upsert
+from .models import DataVersion
+
+FACTORS = "factors"
+
+
+def org_key(org_id: int) -> str:
+    """Per-org counter, bumped by every write to that org's activity data."""
+    return f"org:{org_id}"
+
+
+TABLE = DataVersion.__table__
+
+
+def get(db: Session, key: str) -> int:
+    version = db.execute(select(TABLE.c.version).where(TABLE.c.key == key)).scalar()
+    return version or 0
+
+
+def bump(db: Session, key: str) -> None:
+    upsert(
+        db,
+        TABLE,
+        [{"key": key, "version": 1, "updated_at": datetime.utcnow()}],
+        ["key"],
+        update=["updated_at"],
+        increment=["version"],
+    )
@@ -0,0 +1,235 @@
+# scripts/bench_query_plans.py
+"""
+Seed a realistic data volume into a scratch database and check that the hot
+tenant-scoped queries are answered from indexes.
+
+    python scripts/bench_query_plans.py --url sqlite:////tmp/bench.db
+    python scripts/bench_query_plans.py --url postgresql+psycopg2://u:p@localhost/bench --rows 500000
+
+The database at --url is created/upgraded and filled with bench data; never
+point it at a real one. Exits non-zero when a plan scans activity_log,
+facility or emission_factor instead of using an index, or when a listing
+page sorts rows instead of reading them in index order.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+from typing import NamedTuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--url", required=True, help="SQLAlchemy URL of a scratch database")
+    parser.add_argument("--orgs", type=int, default=50)
+    parser.add_argument("--facilities", type=int, default=10, help="facilities per org")
+    parser.add_argument("--rows", type=int, default=200_000, help="activity rows in total")
+    parser.add_argument("--seed", type=int, default=7)
+    return parser.parse_args()
+
+
+args = parse_args()
+os.environ["DATABASE_URL"] = args.url
+
+from sqlalchemy import func, insert, select, text  # noqa: E402
+
+from app import rollup  # noqa: E402
+from app.database import SessionLocal, get_engine  # noqa: E402
+from app.migrations import upgrade  # noqa: E402
+from app.models import ActivityLog, ActivityType, EmissionFactor, Facility, Organization  # noqa: E402
+from app.Routers.activities import activities_queries, encode_cursor  # noqa: E402
+
+BATCH = 10_000
+CATEGORIES = ["Electricity", "NaturalGas", "Diesel", "Gasoline", "Freight_Truck", "Freight_Ship", "Waste", "Water"]
+SOURCES = ["EPA", "DEFRA", "IEA", "eGRID", "Custom"]
+INDEXED_TABLES = ("activity_log", "facility", "emission_factor")
+
+
+# ---------------------------------------------------------------
+# Seeding
+# ---------------------------------------------------------------
+def seed(db, rng: random.Random) -> int:
+    """Fill the database with bench data; returns the org_id queries run against."""
+    if db.scalar(select(func.count()).select_from(Organization).where(Organization.name.like("bench-%"))):
+        return db.scalar(select(func.min(Organization.org_id)).where(Organization.name.like("bench-%")))
+
+    db.execute(insert(Organization), [{"name": f"bench-{i}"} for i in range(args.orgs)])
+    org_ids = db.scalars(select(Organization.org_id).where(Organization.name.like("bench-%"))).all()
+
+    db.execute(insert(Facility), [
+        {"org_id": org_id, "name": f"site-{org_id}-{n}"}
+        for org_id in org_ids for n in range(args.facilities)
+    ])
+    facilities = db.execute(
+        select(Facility.facility_id, Facility.org_id).where(Facility.org_id.in_(org_ids))
+    ).all()
+
+    # every source publishes every category for ~30 years
+    db.execute(insert(EmissionFactor), [
+        {"source": src, "category": cat, "unit": "kgCO2e", "factor": rng.uniform(0.01, 3), "year": year}
+        for src in SOURCES for cat in CATEGORIES for year in range(1995, 2026)
+    ])
+    factor_id = db.scalar(select(func.min(EmissionFactor.factor_id)))
+    type_ids = db.scalars(select(ActivityType.activity_type_id)).all() or [None]
+
+    first_day = date(2018, 1, 1)
+    rows = []
+    for _ in range(args.rows):
+        fac_id, org_id = rng.choice(facilities)
+        qty = round(rng.uniform(1, 5000), 3)
+        rows.append({
+            "org_id": org_id,
+            "facility_id": fac_id,
+            "factor_id": factor_id,
+            "activity_type_id": rng.choice(type_ids),
+            "quantity": qty,
+            "activity_date": first_day + timedelta(days=rng.randrange(2500)),
+            "co2e_kg": round(qty * 0.4, 6),
+        })
+        if len(rows) >= BATCH:
+            db.execute(insert(ActivityLog.__table__), rows)
+            rows.clear()
+    if rows:
+        db.execute(insert(ActivityLog.__table__), rows)
+
+    rollup.rebuild(db)
+    db.commit()
+    return org_ids[0]
+
+
+def analyze(conn) -> None:
+    """Refresh planner statistics so the plans reflect the seeded volume."""
+    if conn.dialect.name in ("postgresql", "sqlite"):
+        conn.execute(text("ANALYZE"))
+    elif conn.dialect.name in ("mysql", "mariadb"):
+        for table in INDEXED_TABLES:
+            conn.execute(text(f"ANALYZE TABLE {table}"))
+
+
+# ---------------------------------------------------------------
+# Plans
+# ---------------------------------------------------------------
+class _Row(NamedTuple):
+    activity_date: date | None
+    activity_id: int
+
+
+# listing pages must come back in index order, without a sort step
+KEYSET_QUERIES = (
+    "activities: first page",
+    "activities: next page",
+    "activities: undated page",
+    "activities: facility + date range",
+)
+
+
+def hot_queries(org_id: int, facility_id: int) -> dict:
+    dated, undated = activities_queries(org_id, cursor=encode_cursor(_Row(date(2022, 6, 1), 10 ** 9)))
+    return {
+        "activities: first page": activities_queries(org_id)[0].limit(101),
+        "activities: next page": dated.limit(101),
+        "activities: undated page": undated.limit(101),
+        "activities: facility + date range": activities_queries(
+            org_id, facility_id, date(2020, 1, 1), date(2020, 12, 31)
+        )[0].limit(101),
+        "activities: org count": select(func.count()).select_from(ActivityLog).where(ActivityLog.org_id == org_id),
+        "facilities of org": select(Facility.facility_id, Facility.name).where(Facility.org_id == org_id),
+        "factor for (category, year)": (
+            select(EmissionFactor.factor_id, EmissionFactor.factor)
+            .where(EmissionFactor.category == "Diesel", EmissionFactor.year <= 2022)
+            .order_by(EmissionFactor.year.desc())
+            .limit(1)
+        ),
+        "rollup total for org": rollup.total_co2e_stmt(org_id, 2019, 2023),
+    }
+
+
+def explain(conn, stmt) -> list[str]:
+    compiled = stmt.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True})
+    name = conn.dialect.name
+    if name == "sqlite":
+        return [row[-1] for row in conn.execute(text(f"EXPLAIN QUERY PLAN {compiled}"))]
+    if name == "postgresql":
+        return [row[0] for row in conn.execute(text(f"EXPLAIN {compiled}"))]
+    # MySQL / MariaDB: table, type, key, Extra
+    result = conn.execute(text(f"EXPLAIN {compiled}"))
+    cols = list(result.keys())
+    return [
+        f"{r[cols.index('table')]} type={r[cols.index('type')]} key={r[cols.index('key')]}"
+        f" extra={r[cols.index('Extra')]}"
+        for r in result
+    ]
+
+
+def full_scans(dialect: str, plan: list[str]) -> list[str]:
+    """Plan lines that read one of INDEXED_TABLES without an index."""
+    bad = []
+    for line in plan:
+        if dialect == "sqlite":
+            hit = line.startswith("SCAN ") and "USING" not in line
+        elif dialect == "postgresql":
+            hit = "Seq Scan on" in line
+        else:
+            hit = " type=ALL " in line
+        if hit and any(t in line for t in INDEXED_TABLES):
+            bad.append(line.strip())
+    return bad
+
+
+def sorts(dialect: str, plan: list[str]) -> list[str]:
+    """Plan lines that sort rows instead of reading them in index order."""
+    bad = []
+    for line in plan:
+        if dialect == "sqlite":
+            hit = "TEMP B-TREE FOR ORDER BY" in line
+        elif dialect == "postgresql":
+            hit = line.strip().lstrip("-> ").startswith(("Sort ", "Incremental Sort "))
+        else:
+            hit = "Using filesort" in line
+        if hit:
+            bad.append(line.strip())
+    return bad
+
+
+def main() -> int:
+    rng = random.Random(args.seed)
+    engine = get_engine()
+    upgrade(engine)
+
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        org_id = seed(db, rng)
+        print(f"seeded in {time.perf_counter() - started:.1f}s")
+        facility_id = db.scalar(select(func.min(Facility.facility_id)).where(Facility.org_id == org_id))
+    finally:
+        db.close()
+
+    failures = 0
+    with engine.connect() as conn:
+        analyze(conn)
+        for label, stmt in hot_queries(org_id, facility_id).items():
+            plan = explain(conn, stmt)
+            started = time.perf_counter()
+            conn.execute(stmt).all()
+            elapsed_ms = (time.perf_counter() - started) * 1000
+
+            bad = full_scans(conn.dialect.name, plan)
+            if label in KEYSET_QUERIES:
+                bad += sorts(conn.dialect.name, plan)
+            failures += bool(bad)
+            print(f"\n[{'FAIL' if bad else 'ok'}] {label}  ({elapsed_ms:.1f} ms)")
+            for line in plan:
+                print(f"    {line}")
+
+    print(f"\n{failures} quer{'y' if failures == 1 else 'ies'} without index use or index order")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,130 @@
+# scripts/bench_startup.py
+"""
+Measure cold-start time: importing app.main, building the app with
+create_app(), and time from launching uvicorn to the first 200 response.
+
+    python scripts/bench_startup.py --url sqlite:////tmp/bench.db
+    python scripts/bench_startup.py --runs 10 --max-import-ms 1500 --max-first-200-ms 4000
+
+Every run is a fresh interpreter. Medians are reported; with --max-* the
+script exits non-zero when a median goes over budget, so CI can catch
+startup regressions. The database at --url (default: DATABASE_URL) must
+already have the schema (python -m app.migrations).
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+IMPORT_PROBE = """
+import json, time
+t0 = time.perf_counter()
+import app.main
+t1 = time.perf_counter()
+app.main.create_app()
+t2 = time.perf_counter()
+print(json.dumps({"import_ms": (t1 - t0) * 1000, "create_app_ms": (t2 - t1) * 1000}))
+"""
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--url", default=os.getenv("DATABASE_URL"), help="SQLAlchemy URL (default: DATABASE_URL)")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--path", default="/", help="page polled for the first 200")
+    parser.add_argument("--timeout", type=float, default=60.0, help="seconds to wait for a 200")
+    parser.add_argument("--max-import-ms", type=float, default=None)
+    parser.add_argument("--max-first-200-ms", type=float, default=None)
+    return parser.parse_args()
+
+
+def _env(url: str | None) -> dict:
+    env = dict(os.environ)
+    if url:
+        env["DATABASE_URL"] = url
+    env.setdefault("SECRET_KEY", "bench")
+    env.setdefault("JOB_EMBEDDED_WORKERS", "0")    # worker processes are not part of serving
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(ROOT), env.get("PYTHONPATH")]))
+    return env
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def measure_import(env: dict) -> dict:
+    out = subprocess.run(
+        [sys.executable, "-c", IMPORT_PROBE], cwd=ROOT, env=env, check=True, capture_output=True, text=True
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def measure_first_200(env: dict, path: str, timeout: float) -> float:
+    """Milliseconds from spawning uvicorn until `path` answers 200."""
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}{path}"
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "--factory", "app.main:create_app",
+         "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, env=env,
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            if proc.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with status {proc.returncode}")
+            try:
+                with urllib.request.urlopen(url, timeout=1) as resp:
+                    if resp.status == 200:
+                        return (time.perf_counter() - started) * 1000
+            except (urllib.error.URLError, ConnectionError, TimeoutError):
+                pass
+            time.sleep(0.01)
+        raise RuntimeError(f"no 200 from {url} within {timeout:.0f}s")
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def _report(label: str, samples: list[float], budget: float | None) -> bool:
+    median = statistics.median(samples)
+    over = budget is not None and median > budget
+    limit = f"  (budget {budget:.0f} ms{' EXCEEDED' if over else ''})" if budget is not None else ""
+    print(f"{label:<16} median {median:8.1f} ms   min {min(samples):8.1f}   max {max(samples):8.1f}{limit}")
+    return over
+
+
+def main() -> int:
+    args = parse_args()
+    env = _env(args.url)
+
+    imports, creates, first = [], [], []
+    for _ in range(args.runs):
+        timing = measure_import(env)
+        imports.append(timing["import_ms"])
+        creates.append(timing["create_app_ms"])
+        first.append(measure_first_200(env, args.path, args.timeout))
+
+    print(f"{args.runs} run(s)")
+    failed = _report("import app.main", imports, args.max_import_ms)
+    _report("create_app()", creates, None)
+    failed |= _report("first 200", first, args.max_first_200_ms)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
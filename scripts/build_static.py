@@ -0,0 +1,34 @@
+# scripts/build_static.py
+"""
+Fingerprint and precompress the static files.
+
+    python scripts/build_static.py
+
+Writes app/static/build/ (hashed copies, .gz/.br variants and manifest.json).
+Run it as part of a deploy, before the app starts; templates pick the hashed
+names up through static_url().
+"""
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.assets import BUILD_DIR, STATIC_DIR, build  # noqa: E402
+from app.compression import brotli  # noqa: E402
+
+
+def main() -> None:
+    started = time.perf_counter()
+    manifest = build(STATIC_DIR)
+    for source, hashed in sorted(manifest.items()):
+        print(f"{source} -> {hashed}")
+    variants = "gzip + brotli" if brotli is not None else "gzip (install 'brotli' for .br)"
+    print(
+        f"{len(manifest)} file(s) into {STATIC_DIR / BUILD_DIR}, {variants}, "
+        f"{time.perf_counter() - started:.2f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()